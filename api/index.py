@@ -1,26 +1,47 @@
 from fastapi import FastAPI, Depends, HTTPException, Query, Body, Request
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, Response, JSONResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.datastructures import Headers, MutableHeaders
 from fastapi.security import OAuth2PasswordBearer # <--- NOVO: Para pegar o token do header
 from jose import JWTError, jwt # <--- NOVO: Para decodificar o token
-from datetime import datetime, timedelta # <--- NOVO: Para expiração do token
+from datetime import datetime, timedelta, timezone # <--- NOVO: Para expiração do token
+from email.utils import format_datetime, parsedate_to_datetime
 import requests
 import os
 import time
 import json
 import re
 import random
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+import math
+import base64
+import gzip
+import hashlib
+from pydantic import BaseModel, ConfigDict
+from typing import Optional, List, Dict, Any, Union
 import urllib.parse
 from difflib import SequenceMatcher 
 import concurrent.futures
+import threading
+import bisect
+from collections import OrderedDict
 
 from dotenv import load_dotenv
 load_dotenv()
 
 import bcrypt
 
+try:
+    import orjson  # Serializador JSON rápido (opcional)
+except ImportError:
+    orjson = None
+
+try:
+    import brotli  # Compressão br (opcional): sem ele as respostas saem só em gzip
+except ImportError:
+    brotli = None
+
 CACHE_EXPIRATION = 3600  # 1 hora em segundos
 
 upcoming_cache = {
@@ -45,6 +66,9 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7 # 1 semana
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
+# Mesma origem do token, mas sem 401 automático: usado nas rotas públicas que só
+# querem saber quem está vendo (likes/votos do visitante)
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login", auto_error=False)
 
 # --- CONFIGURAÇÃO DE SEGURANÇA (BCRYPT) ---
 def verify_password(plain_password, hashed_password):
@@ -56,18 +80,52 @@ def verify_password(plain_password, hashed_password):
         print(f"Erro na verificação de senha: {e}")
         return False
 
+# Custo do bcrypt (log2 das rodadas); mudar aqui rehasheia cada senha no próximo login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
 def get_password_hash(password):
     pwd_bytes = password.encode('utf-8')
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(pwd_bytes, salt)
     return hashed.decode('utf-8')
 
+def password_needs_rehash(hashed_password) -> bool:
+    # "$2b$12$..." -> custo 12
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (AttributeError, IndexError, ValueError):
+        return False
+
+# O bcrypt leva centenas de ms de CPU por chamada e libera o GIL enquanto calcula:
+# roda num pool próprio e pequeno, para um pico de logins não ocupar o threadpool
+# das rotas. Além de PASSWORD_WORKERS em execução, no máximo PASSWORD_QUEUE_DEPTH
+# esperam; o resto recebe 503 na hora em vez de enfileirar sem limite.
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "2"))
+PASSWORD_QUEUE_DEPTH = int(os.getenv("PASSWORD_QUEUE_DEPTH", "16"))
+password_executor = concurrent.futures.ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="bcrypt")
+password_slots = threading.BoundedSemaphore(PASSWORD_WORKERS + PASSWORD_QUEUE_DEPTH)
+
+def run_password_task(fn, *args):
+    # Chamado das rotas síncronas (threadpool): a thread da rota só espera o resultado
+    if not password_slots.acquire(blocking=False):
+        raise HTTPException(status_code=503, detail="Muitas requisições de login, tente novamente", headers={"Retry-After": "1"})
+    try:
+        return password_executor.submit(fn, *args).result()
+    finally:
+        password_slots.release()
+
 # --- CONFIGURAÇÃO DO BANCO DE DADOS (SQLALCHEMY) ---
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, desc, Boolean, Text, or_, func, distinct, text
-from sqlalchemy.orm import sessionmaker, declarative_base, Session
+from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, desc, Boolean, Text, or_, and_, func, distinct, text, inspect, Index, select, case, literal, union_all, event, update, tuple_
+from sqlalchemy.orm import sessionmaker, declarative_base, Session, aliased
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.engine import make_url
 
 engine = None
 SessionLocal = None
+DATABASE_URL = None
+user_search_backend = "like"
 Base = declarative_base()
 
 # --- MODELOS DO BANCO DE DADOS ---
@@ -89,6 +147,47 @@ class User(Base):
     psn_url = Column(String, default="")
     epic_url = Column(String, default="")
 
+# Índices de prefixo case-insensitive (busca de usuários); o level junto permite
+# escolher os melhores de cada prefixo só pelo índice
+Index("ix_users_username_lower", func.lower(User.username), User.level)
+Index("ix_users_nickname_lower", func.lower(User.nickname), User.level)
+# Ranking geral: top-N e vizinhos por busca no índice (xp, id)
+Index("ix_users_xp", User.xp, User.id)
+
+class XpEvent(Base):
+    # Livro-caixa de XP (só inserção), gravado na mesma transação da ação que deu o XP.
+    # users.xp é o saldo; a soma dos eventos de um usuário deve bater com ele.
+    __tablename__ = "xp_events"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    amount = Column(Integer, nullable=False)
+    reason = Column(String, nullable=False)
+    source_id = Column(Integer, nullable=True)
+    created_at = Column(String, default=lambda: datetime.now().isoformat())
+
+    __table_args__ = (
+        Index("ix_xp_events_user", "user_id", "id"),
+    )
+
+class XpBucket(Base):
+    # Contadores de XP por janela (semana ISO "2026-W42" / mês "2026-10") para os rankings
+    __tablename__ = "xp_buckets"
+    period = Column(String, primary_key=True)
+    bucket = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    xp = Column(Integer, default=0)
+
+    __table_args__ = (
+        Index("ix_xp_buckets_rank", "period", "bucket", "xp", "user_id"),
+    )
+
+class Game(Base):
+    # Dimensão de jogos (id do IGDB -> nome/capa), preenchida por reviews, discussões e /api/game
+    __tablename__ = "games"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    cover_url = Column(String, default="")
+
 class Review(Base):
     __tablename__ = "reviews"
     id = Column(Integer, primary_key=True, index=True)
@@ -104,7 +203,12 @@ class Review(Base):
     desempenho = Column(Float)
     nota_geral = Column(Float)
     is_favorite = Column(Boolean, default=False)
-    owner_id = Column(Integer, ForeignKey("users.id"))
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
+
+    __table_args__ = (
+        # Amostragem por faixa de id dentro das reviews de um usuário (minigame)
+        Index("ix_reviews_owner_id_id", "owner_id", "id"),
+    )
 
 class Tierlist(Base):
     __tablename__ = "tierlists"
@@ -112,7 +216,32 @@ class Tierlist(Base):
     name = Column(String)
     data = Column(Text)
     owner_id = Column(Integer, ForeignKey("users.id"))
-    
+    # Versão otimista: cada gravação soma 1; PATCH com versão velha é recusado
+    version = Column(Integer, default=0, server_default="0")
+    # Resumo para listagens (contagens, capas, tiers), gravado junto com o cache JSON
+    summary = Column(Text, nullable=True)
+    # Tiers definidas pelo dono, na ordem (JSON), inclusive as vazias e as personalizadas
+    tiers = Column(Text, nullable=True)
+
+    __table_args__ = (
+        Index("ix_tierlists_owner_id_id", "owner_id", "id"),
+    )
+
+class TierlistItem(Base):
+    # Entradas normalizadas das tierlists (fonte da verdade); Tierlist.data é só o cache JSON
+    __tablename__ = "tierlist_items"
+    tierlist_id = Column(Integer, ForeignKey("tierlists.id"), primary_key=True)
+    game_id = Column(Integer, primary_key=True)
+    tier = Column(String, nullable=False)
+    position = Column(Integer, nullable=False, default=0)
+    # O que o dono escolheu para esta entrada; vazio = capa da dimensão de jogos
+    cover = Column(String, nullable=True)
+    is_favorite = Column(Boolean, default=False)
+
+    __table_args__ = (
+        # Índice reverso: em quais tierlists um jogo aparece
+        Index("ix_tierlist_items_game", "game_id", "tierlist_id"),
+    )
 
 class Comment(Base):
     __tablename__ = "comments"
@@ -121,12 +250,20 @@ class Comment(Base):
     user_id = Column(Integer, ForeignKey("users.id"))
     content = Column(Text, nullable=False)
     created_at = Column(String, default=lambda: datetime.now().isoformat())
+    # Contador desnormalizado, atualizado no toggle_like (ver refresh_comment_likes)
+    likes_count = Column(Integer, default=0, server_default="0")
+
+    __table_args__ = (
+        Index("ix_comments_game_likes", "game_id", "likes_count", "id"),
+        Index("ix_comments_likes", "likes_count", "id"),
+        Index("ix_comments_user_id_id", "user_id", "id"),
+    )
 
 class CommentLike(Base):
     __tablename__ = "comment_likes"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    comment_id = Column(Integer, ForeignKey("comments.id"))
+    comment_id = Column(Integer, ForeignKey("comments.id"), index=True)
 
 class TierlistLike(Base):
     __tablename__ = "tierlist_likes"
@@ -142,17 +279,91 @@ class TierlistComment(Base):
     content = Column(Text, nullable=False)
     created_at = Column(String, default=lambda: datetime.now().isoformat())
 
+    __table_args__ = (
+        Index("ix_tierlist_comments_tierlist_id_id", "tierlist_id", "id"),
+    )
+
 class Follower(Base):
     __tablename__ = "followers"
     follower_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
     followed_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
 
+    __table_args__ = (
+        Index("ix_followers_followed_follower", "followed_id", "follower_id"),
+    )
+
+class ProfileSummary(Base):
+    # Agregados do perfil materializados na escrita (reviews, favoritos, follows);
+    # o get_profile só lê esta linha junto com o usuário
+    __tablename__ = "profile_summary"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    reviews_count = Column(Integer, default=0)
+    average_score = Column(Float, default=0.0)
+    favorite_genre = Column(String, default="Nenhum")
+    fps_count = Column(Integer, default=0)
+    has_high_score = Column(Boolean, default=False)
+    has_perfect_game = Column(Boolean, default=False)
+    has_hater_review = Column(Boolean, default=False)
+    best_by_attribute = Column(Text, default="{}")
+    top_favorites = Column(Text, default="[]")
+    followers_count = Column(Integer, default=0)
+    following_count = Column(Integer, default=0)
+    updated_at = Column(String, default=lambda: datetime.now().isoformat())
+
+class UserAchievement(Base):
+    # Conquistas desbloqueadas (persistidas; uma vez ganha, fica)
+    __tablename__ = "user_achievements"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    achievement = Column(String, primary_key=True)
+    unlocked_at = Column(String, default=lambda: datetime.now().isoformat())
+
+class UserSimilarity(Base):
+    # Índice de compatibilidade: só os K usuários mais compatíveis de cada usuário
+    # (pares com jogos em comum). Atualizado a cada review (autor + co-avaliadores do
+    # jogo) e reconstruído em lotes pelo job, que pega o resto.
+    __tablename__ = "user_similarity"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    other_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    similarity_sum = Column(Float, default=0.0)
+    shared_count = Column(Integer, default=0)
+    compatibility = Column(Float, default=0.0)
+
+    __table_args__ = (
+        Index("ix_user_similarity_rank", "user_id", "compatibility"),
+    )
+
+class GameNeighbor(Base):
+    # Modelo item-item das recomendações: só os K vizinhos mais parecidos de cada jogo.
+    # Reconstruído por job (cron da Vercel ou python api/index.py rebuild-recommendations).
+    __tablename__ = "game_neighbors"
+    game_id = Column(Integer, primary_key=True)
+    neighbor_id = Column(Integer, primary_key=True)
+    similarity = Column(Float, default=0.0)
+    support = Column(Integer, default=0)
+
+    __table_args__ = (
+        Index("ix_game_neighbors_rank", "game_id", "similarity"),
+    )
+
+class JobProgress(Base):
+    # Jobs em lotes do cron: id onde a próxima invocação continua. A linha do
+    # backfill de conquistas só existe enquanto ele está pendente.
+    __tablename__ = "job_progress"
+    name = Column(String, primary_key=True)
+    last_id = Column(Integer, default=0)
+    updated_at = Column(String, default=lambda: datetime.now().isoformat())
+
 class FriendRequest(Base):
     __tablename__ = "friend_requests"
     id = Column(Integer, primary_key=True, index=True)
     sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     receiver_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     status = Column(String, default="pending") # pending, accepted
+
+    __table_args__ = (
+        Index("ix_friend_requests_receiver_status", "receiver_id", "status", "id"),
+        Index("ix_friend_requests_sender_status", "sender_id", "status", "id"),
+    )
 # --- NOVOS MODELOS PARA DISCUSSÕES ---
 
 class Discussion(Base):
@@ -164,12 +375,21 @@ class Discussion(Base):
     game_name = Column(String, nullable=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     created_at = Column(String, default=lambda: datetime.now().isoformat())
+    # Contadores desnormalizados, atualizados nos votos e comentários (ver refresh_discussion_stats)
+    score = Column(Integer, default=0, server_default="0")
+    comment_count = Column(Integer, default=0, server_default="0")
+    hot_score = Column(Float, default=0.0, server_default="0")
+
+    __table_args__ = (
+        Index("ix_discussions_hot", "hot_score", "id"),
+        Index("ix_discussions_game_hot", "game_id", "hot_score", "id"),
+    )
 
 class DiscussionVote(Base):
     __tablename__ = "discussion_votes"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    discussion_id = Column(Integer, ForeignKey("discussions.id"))
+    discussion_id = Column(Integer, ForeignKey("discussions.id"), index=True)
     vote_type = Column(Integer) # 1 para Like (Upvote), -1 para Deslike (Downvote)
 
 class DiscussionComment(Base):
@@ -180,39 +400,384 @@ class DiscussionComment(Base):
     content = Column(Text, nullable=False)
     created_at = Column(String, default=lambda: datetime.now().isoformat())
 
+    __table_args__ = (
+        Index("ix_discussion_comments_discussion_id_id", "discussion_id", "id"),
+    )
+
+class Revision(Base):
+    # Contador de revisão por recurso público ("profile:1", "tierlist:7", "best_rated"):
+    # toda escrita que muda a resposta soma 1 na mesma transação, e o GET condicional
+    # compara só esta linha em vez de remontar o corpo
+    __tablename__ = "revisions"
+    key = Column(String, primary_key=True)
+    revision = Column(Integer, default=0)
+    updated_at = Column(String, default=lambda: datetime.now(timezone.utc).isoformat()) # UTC (vira Last-Modified)
+
 # --- CONEXÃO COM O BANCO ---
+
+# create_all só cria tabelas novas; colunas/índices adicionados depois em tabelas
+# que já existem no Postgres da Vercel precisam de ALTER TABLE manual.
+# Retorna os nomes de tabelas ("games") e colunas ("discussions.hot_score") criados,
+# para o get_db disparar os backfills correspondentes.
+def upgrade_schema(bind):
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    Base.metadata.create_all(bind=bind)
+    added = {t.name for t in Base.metadata.sorted_tables if t.name not in existing_tables}
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=bind.dialect)}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                conn.execute(text(ddl))
+                added.add(f"{table.name}.{column.name}")
+            for index in table.indexes:
+                # IF NOT EXISTS em vez de checkfirst: índices de expressão (lower(...))
+                # não aparecem na reflexão do SQLite
+                conn.execute(CreateIndex(index, if_not_exists=True))
+    return added
+
+def ensure_user_search_index(bind):
+    # Índice de substring fora do alcance do create_all: trigram GIN no Postgres,
+    # FTS5 (tokenizer trigram) mantido por triggers no SQLite. Sem ele a busca
+    # cai no LIKE simples, que continua correto, só que sequencial.
+    try:
+        with bind.begin() as conn:
+            if bind.dialect.name == "postgresql":
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_username_trgm ON users USING gin (lower(username) gin_trgm_ops)"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_nickname_trgm ON users USING gin (lower(nickname) gin_trgm_ops)"))
+                return "trgm"
+            if bind.dialect.name == "sqlite":
+                created = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'users_fts'")).first() is None
+                conn.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(username, nickname, content='users', content_rowid='id', tokenize='trigram')"))
+                conn.execute(text("""CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN
+                    INSERT INTO users_fts(rowid, username, nickname) VALUES (new.id, new.username, new.nickname); END"""))
+                conn.execute(text("""CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN
+                    INSERT INTO users_fts(users_fts, rowid, username, nickname) VALUES ('delete', old.id, old.username, old.nickname); END"""))
+                conn.execute(text("""CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF username, nickname ON users BEGIN
+                    INSERT INTO users_fts(users_fts, rowid, username, nickname) VALUES ('delete', old.id, old.username, old.nickname);
+                    INSERT INTO users_fts(rowid, username, nickname) VALUES (new.id, new.username, new.nickname); END"""))
+                if created:
+                    conn.execute(text("INSERT INTO users_fts(users_fts) VALUES ('rebuild')"))
+                return "fts5"
+    except Exception as e:
+        print(f"Índice de busca de usuários indisponível: {e}")
+    return "like"
+
+def init_db():
+    # Engine síncrono + upgrade de esquema e backfills, uma vez por instância
+    global engine, SessionLocal, user_search_backend, DATABASE_URL
+    if engine is None:
+        DATABASE_URL = os.environ.get('POSTGRES_URL_NON_POOLING')
+        if not DATABASE_URL: 
+            DATABASE_URL = "sqlite:///./test.db"
+        if DATABASE_URL.startswith("postgres://"):
+            DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+        
+        engine = create_engine(DATABASE_URL)
+        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        added = upgrade_schema(engine)
+        user_search_backend = ensure_user_search_index(engine)
+        backfills = []
+        if "discussions.hot_score" in added: backfills.append(rebuild_discussion_scores)
+        if "comments.likes_count" in added: backfills.append(rebuild_comment_likes)
+        if "games" in added: backfills.append(rebuild_games)
+        # Conquistas, compatibilidade e vizinhos de jogos ficam para o cron (em lotes);
+        # até lá o perfil avalia as conquistas na leitura, as conexões são calculadas
+        # sob demanda e as recomendações caem nos jogos populares
+        if "user_achievements" in added: backfills.append(schedule_achievements_backfill)
+        if "xp_events" in added: backfills.append(backfill_xp_ledger)
+        if "tierlist_items" in added or "tierlist_items.cover" in added: backfills.append(rebuild_tierlist_items)
+        if "tierlists.summary" in added: backfills.append(rebuild_tierlist_summaries)
+        if "tierlists.tiers" in added: backfills.append(rebuild_tierlist_tiers)
+        if backfills:
+            backfill_session = SessionLocal()
+            try:
+                for backfill in backfills:
+                    backfill(backfill_session)
+            finally:
+                backfill_session.close()
+
 def get_db():
-    global engine, SessionLocal
     try:
-        if engine is None:
-            DATABASE_URL = os.environ.get('POSTGRES_URL_NON_POOLING')
-            if not DATABASE_URL: 
-                DATABASE_URL = "sqlite:///./test.db"
-            if DATABASE_URL.startswith("postgres://"):
-                DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-            
-            engine = create_engine(DATABASE_URL)
-            SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-            Base.metadata.create_all(bind=engine)
-            
+        init_db()
         db = SessionLocal()
         yield db
     finally:
         if 'db' in locals() and db: db.close()
 
+# --- CAMINHO ASSÍNCRONO (SQLAlchemy asyncio) ---
+# As leituras mais quentes são async def com AsyncSession: esperar o banco não
+# prende uma das ~40 threads do threadpool. Driver asyncpg no Postgres e aiosqlite
+# no SQLite local. Com DB_ASYNC=0, ou sem os drivers instalados, as mesmas rotas
+# usam a sessão síncrona numa thread (ThreadedSession), com a mesma interface.
+DB_ASYNC = os.getenv("DB_ASYNC", "1") != "0"
+async_engine = None
+AsyncSessionLocal = None
+
+def async_database_url(url: str):
+    # postgresql:// -> postgresql+asyncpg://. O asyncpg recusa os parâmetros libpq da
+    # URL (sslmode, channel_binding, options...): os que têm equivalente viram
+    # connect_args, o resto sai da URL
+    url = make_url(url)
+    connect_args = {}
+    if url.drivername in ("postgresql", "postgresql+psycopg2"):
+        query = {key: value if isinstance(value, str) else value[-1] for key, value in url.query.items()}
+        url = url.set(drivername="postgresql+asyncpg", query={})
+        server_settings = {}
+        if query.get("sslmode"):
+            connect_args["ssl"] = query.pop("sslmode")
+        if query.get("connect_timeout"):
+            connect_args["timeout"] = float(query.pop("connect_timeout"))
+        if query.get("target_session_attrs"):
+            connect_args["target_session_attrs"] = query.pop("target_session_attrs")
+        if query.get("application_name"):
+            server_settings["application_name"] = query.pop("application_name")
+        # options="-c search_path=app -c statement_timeout=5000" -> server_settings
+        for name, value in re.findall(r"(?:-c\s*|--)([\w.-]+)=(\S+)", query.pop("options", "")):
+            server_settings[name.replace("-", "_")] = value
+        if server_settings:
+            connect_args["server_settings"] = server_settings
+        if query:
+            print(f"Parâmetros da URL do banco ignorados no asyncpg: {', '.join(sorted(query))}")
+    elif url.drivername in ("sqlite", "sqlite+pysqlite"):
+        url = url.set(drivername="sqlite+aiosqlite")
+    return url, connect_args
+
+class ThreadedSession:
+    # Fallback do get_async_db (só leituras): Session síncrona rodando no threadpool.
+    # O resultado vem materializado (freeze) e a conexão volta ao pool a cada comando;
+    # segurá-la entre um await e outro esgota o pool com threads esperando por ela.
+    def __init__(self, session: Session):
+        self.session = session
+
+    def _run(self, fn):
+        try:
+            return fn()
+        finally:
+            self.session.close()
+
+    async def execute(self, statement):
+        return await run_in_threadpool(self._run, lambda: self.session.execute(statement).freeze()())
+
+    async def scalar(self, statement):
+        return await run_in_threadpool(self._run, lambda: self.session.scalar(statement))
+
+    async def close(self):
+        await run_in_threadpool(self.session.close)
+
+async def get_async_db():
+    global async_engine, AsyncSessionLocal, DB_ASYNC
+    if engine is None:
+        # Esquema e backfills continuam no caminho síncrono
+        await run_in_threadpool(init_db)
+    if DB_ASYNC and AsyncSessionLocal is None:
+        try:
+            import greenlet  # exigido pelo asyncio do SQLAlchemy
+            from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+            url, connect_args = async_database_url(DATABASE_URL)
+            async_engine = create_async_engine(url, connect_args=connect_args)
+            AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+        except ImportError as e:
+            print(f"Driver async indisponível, usando sessão síncrona: {e}")
+            DB_ASYNC = False
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = ThreadedSession(SessionLocal())
+        try:
+            yield db
+        finally:
+            await db.close()
+
+# --- PAGINAÇÃO POR CURSOR (KEYSET) ---
+# O cursor é opaco para o frontend: guarda os valores da chave de ordenação do
+# último item da página, e a próxima página busca com WHERE (chave) < (cursor).
+def encode_cursor(*values):
+    raw = json.dumps(list(values), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: Optional[str], size: int):
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return values
+
+# Aplica o "seek" do cursor e a ordenação. columns é a chave de ordenação
+# completa (sempre terminando no id para ser estável); busca limit + 1 linhas
+# só para saber se existe próxima página.
+def keyset_query(query, columns, cursor: Optional[str], limit: int, descending: bool = True):
+    after = decode_cursor(cursor, len(columns))
+    if after:
+        clauses = []
+        for i, column in enumerate(columns):
+            seek = column < after[i] if descending else column > after[i]
+            clauses.append(and_(*[columns[j] == after[j] for j in range(i)], seek))
+        query = query.filter(or_(*clauses))
+    order = [desc(c) if descending else c.asc() for c in columns]
+    return query.order_by(*order).limit(limit + 1)
+
+# Monta o envelope padrão {items, next_cursor} a partir das linhas do keyset_query.
+# total (tamanho da lista inteira) só vai na primeira página: é o que a tela mostra
+# como contagem, já que items.length para na primeira página
+def keyset_page(rows, limit: int, cursor_values, serialize, total: Optional[int] = None):
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    page = {
+        "items": [serialize(r) for r in rows],
+        "next_cursor": encode_cursor(*cursor_values(rows[-1])) if has_more and rows else None
+    }
+    if total is not None:
+        page["total"] = total
+    return page
+
+def count_total(query, cursor: Optional[str]) -> Optional[int]:
+    return query.order_by(None).count() if cursor is None else None
+
+async def count_total_async(db, query, cursor: Optional[str]) -> Optional[int]:
+    if cursor is not None:
+        return None
+    return await db.scalar(select(func.count()).select_from(query.order_by(None).subquery()))
+
+# --- GET CONDICIONAL (ETag / LAST-MODIFIED / CACHE DA BORDA) ---
+# O ETag vem dos contadores da tabela revisions (mais o deploy atual, para um formato
+# novo de resposta não casar com ETag antigo). If-None-Match batendo devolve 304
+# antes de qualquer consulta pesada.
+EDGE_CACHE_SECONDS = 30
+EDGE_STALE_SECONDS = 60
+DEPLOY_ID = os.getenv("VERCEL_GIT_COMMIT_SHA", "")
+
+def bump_revision(db: Session, *keys):
+    # Uma vez por chave e transação; a primeira escrita do recurso cria a linha
+    bumped = db.info.setdefault("revision_keys", set())
+    now = datetime.now(timezone.utc).isoformat()
+    for key in keys:
+        if key in bumped:
+            continue
+        bump = update(Revision).where(Revision.key == key)\
+            .values(revision=func.coalesce(Revision.revision, 0) + 1, updated_at=now)\
+            .execution_options(synchronize_session=False)
+        if not db.execute(bump).rowcount:
+            try:
+                with db.begin_nested():
+                    db.execute(Revision.__table__.insert().values(key=key, revision=1, updated_at=now))
+            except IntegrityError:
+                db.execute(bump)
+        bumped.add(key)
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def reset_revision_keys(session):
+    session.info.pop("revision_keys", None)
+
+def unpack_revisions(rows, keys):
+    # -> ([revisão por chave, na ordem], updated_at mais recente ou None)
+    rows = dict((key, (revision, updated_at)) for key, revision, updated_at in rows)
+    stamps = [rows[key][1] for key in keys if key in rows and rows[key][1]]
+    return [rows.get(key, (0, None))[0] for key in keys], max(stamps) if stamps else None
+
+def revisions_select(keys):
+    return select(Revision.key, Revision.revision, Revision.updated_at).where(Revision.key.in_(keys))
+
+def read_revisions(db: Session, *keys):
+    return unpack_revisions(db.execute(revisions_select(keys)).all(), keys)
+
+async def read_revisions_async(db, *keys):
+    return unpack_revisions((await db.execute(revisions_select(keys))).all(), keys)
+
+def http_date(stamp: str) -> str:
+    return format_datetime(datetime.fromisoformat(stamp).replace(microsecond=0, tzinfo=timezone.utc), usegmt=True)
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # Comparação fraca (RFC 9110): ignora o prefixo W/
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag.removeprefix("W/") for tag in if_none_match.split(","))
+
+def conditional_get(request: Request, response: Response, validators, last_modified: Optional[str] = None,
+                    private: bool = False, s_maxage: int = EDGE_CACHE_SECONDS, max_age: int = 0) -> Optional[Response]:
+    # Põe ETag/Last-Modified/Cache-Control na resposta; devolve o 304 pronto se o cliente já tem esta versão
+    digest = hashlib.blake2b(repr((DEPLOY_ID, *validators)).encode("utf-8"), digest_size=12).hexdigest()
+    headers = {"ETag": f'W/"{digest}"'}
+    if last_modified:
+        headers["Last-Modified"] = http_date(last_modified)
+    if private:
+        # Resposta personalizada (visitante logado): só o navegador guarda, sempre revalidando
+        headers["Cache-Control"] = "private, no-cache"
+    else:
+        headers["Cache-Control"] = f"public, max-age={max_age}, s-maxage={s_maxage}, stale-while-revalidate={EDGE_STALE_SECONDS}"
+    headers["Vary"] = "Authorization"
+    response.headers.update(headers)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        fresh = etag_matches(if_none_match, headers["ETag"])
+    else:
+        # If-Modified-Since só vale sem If-None-Match; precisão de segundos
+        fresh = False
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since and last_modified:
+            try:
+                fresh = datetime.fromisoformat(last_modified).replace(microsecond=0, tzinfo=timezone.utc) <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                fresh = False
+    return Response(status_code=304, headers=headers) if fresh else None
+
 # --- FUNÇÕES DE TOKEN JWT ---
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = datetime.now(timezone.utc) + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
+        expire = datetime.now(timezone.utc) + timedelta(minutes=15)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-# Dependência para obter usuário atual baseado no token
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+# Identidade do token em cache (cache-aside): a maioria das rotas protegidas só usa
+# current_user.id, então não precisa carregar a linha inteira (avatar_url é Text)
+PRINCIPAL_CACHE_TTL = 60
+PRINCIPAL_CACHE_SIZE = 4096
+principal_cache = OrderedDict()
+principal_cache_lock = threading.Lock()
+
+def invalidate_principal(user_id: int):
+    with principal_cache_lock:
+        principal_cache.pop(user_id, None)
+
+class Principal:
+    # Registro mínimo do usuário autenticado; quem altera o usuário (perfil, XP,
+    # conquistas) pede a linha completa com row(), carregada uma vez por requisição
+    __slots__ = ("id", "username", "_db", "_row")
+
+    def __init__(self, user_id: int, username: str, db: Session):
+        self.id = user_id
+        self.username = username
+        self._db = db
+        self._row = None
+
+    def row(self) -> User:
+        if self._row is None:
+            self._row = self._db.get(User, self.id)
+        return self._row
+
+# Dependência para obter usuário atual baseado no token. Síncrona de propósito: a
+# consulta no cache miss roda no threadpool, sem travar o event loop
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
     credentials_exception = HTTPException(
         status_code=401,
         detail="Credenciais inválidas",
@@ -226,13 +791,78 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    
-    user = db.query(User).filter(User.id == user_id).first()
-    if user is None:
+
+    now = time.time()
+    with principal_cache_lock:
+        entry = principal_cache.get(user_id)
+        if entry and now - entry["last_updated"] < PRINCIPAL_CACHE_TTL:
+            principal_cache.move_to_end(user_id)
+            return Principal(user_id, entry["username"], db)
+
+    # Só as colunas de identidade
+    row = db.query(User.id, User.username).filter(User.id == user_id).first()
+    if row is None:
         raise credentials_exception
-    return user
+    with principal_cache_lock:
+        principal_cache[user_id] = {"username": row.username, "last_updated": now}
+        while len(principal_cache) > PRINCIPAL_CACHE_SIZE:
+            principal_cache.popitem(last=False)
+    return Principal(row.id, row.username, db)
+
+def viewer_id_from_token(token: Optional[str]) -> Optional[int]:
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        viewer_id = payload.get("id")
+        return int(viewer_id) if viewer_id is not None else None
+    except (JWTError, TypeError, ValueError):
+        return None
 
-app = FastAPI()
+# Dependência para rotas públicas: id do visitante vindo do token, se houver.
+def get_viewer_id(token: Optional[str] = Depends(optional_oauth2_scheme)) -> Optional[int]:
+    # Só o token identifica quem vê; sem token (ou inválido/expirado) = visitante anônimo
+    return viewer_id_from_token(token)
+
+# --- ESTADO DO VISITANTE (LIKES / VOTOS EM LOTE) ---
+# Uma consulta por página (IN nos ids da página) em vez de uma por item.
+def liked_comments_select(viewer_id: int, comment_ids):
+    return select(CommentLike.comment_id).where(CommentLike.user_id == viewer_id, CommentLike.comment_id.in_(list(comment_ids)))
+
+def viewer_liked_comment_ids(db: Session, viewer_id: Optional[int], comment_ids) -> set:
+    if viewer_id is None or not comment_ids:
+        return set()
+    return set(db.execute(liked_comments_select(viewer_id, comment_ids)).scalars())
+
+async def viewer_liked_comment_ids_async(db, viewer_id: Optional[int], comment_ids) -> set:
+    if viewer_id is None or not comment_ids:
+        return set()
+    return set((await db.execute(liked_comments_select(viewer_id, comment_ids))).scalars())
+
+def viewer_liked_tierlist_ids(db: Session, viewer_id: Optional[int], tierlist_ids) -> set:
+    if viewer_id is None or not tierlist_ids:
+        return set()
+    rows = db.query(TierlistLike.tierlist_id).filter(TierlistLike.user_id == viewer_id, TierlistLike.tierlist_id.in_(list(tierlist_ids))).all()
+    return {r[0] for r in rows}
+
+def viewer_discussion_votes(db: Session, viewer_id: Optional[int], discussion_ids) -> dict:
+    if viewer_id is None or not discussion_ids:
+        return {}
+    rows = db.query(DiscussionVote.discussion_id, DiscussionVote.vote_type).filter(DiscussionVote.user_id == viewer_id, DiscussionVote.discussion_id.in_(list(discussion_ids))).all()
+    return {discussion_id: vote_type for discussion_id, vote_type in rows}
+
+class FastJSONResponse(JSONResponse):
+    # Mesmo JSON do JSONResponse (UTF-8, compacto), codificado pelo orjson quando disponível
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        try:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # Tipos que o orjson não conhece (ex.: Decimal) passam pelo encoder do FastAPI
+            return orjson.dumps(jsonable_encoder(content), option=orjson.OPT_NON_STR_KEYS)
+
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # Substitua a URL abaixo pelo link real do seu site na Vercel quando ele for criado
 # Exemplo: "https://gameg-score-gustavo.vercel.app"
@@ -250,6 +880,123 @@ app.add_middleware(
     allow_headers=["*"], 
 )
 
+# --- COMPRESSÃO DAS RESPOSTAS (gzip / brotli) ---
+# Abaixo de COMPRESSION_MIN_SIZE não compensa (cabeçalhos + CPU > bytes poupados).
+# Os níveis são para respostas dinâmicas; payloads estáticos são pré-comprimidos
+# uma vez no nível máximo (precompress_static).
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", "6"))  # gzip, 1-9
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))  # br, 0-11
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+# Métricas por instância: encoding -> respostas, bytes antes/depois e CPU gasta
+compression_stats = {}
+compression_stats_lock = threading.Lock()
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    # Accept-Encoding com pesos (q=0 recusa); br tem preferência quando disponível
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if name.strip():
+            weights[name.strip()] = weight
+    for encoding in ("br", "gzip") if brotli is not None else ("gzip",):
+        if weights.get(encoding, weights.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+def compress_body(body: bytes, encoding: str, static: bool = False) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=11 if static else BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=9 if static else COMPRESSION_LEVEL, mtime=0)
+
+def record_compression(encoding: str, bytes_in: int, bytes_out: int, cpu_seconds: float):
+    with compression_stats_lock:
+        stats = compression_stats.setdefault(encoding, {"responses": 0, "bytes_in": 0, "bytes_out": 0, "cpu_ms": 0.0})
+        stats["responses"] += 1
+        stats["bytes_in"] += bytes_in
+        stats["bytes_out"] += bytes_out
+        stats["cpu_ms"] += cpu_seconds * 1000
+
+def precompress_static(body: bytes) -> dict:
+    # encoding -> bytes, para servir conteúdo fixo sem comprimir a cada requisição
+    variants = {}
+    for encoding in ("br", "gzip") if brotli is not None else ("gzip",):
+        started = time.thread_time()
+        variants[encoding] = compress_body(body, encoding, static=True)
+        record_compression(f"{encoding}:static", len(body), len(variants[encoding]), time.thread_time() - started)
+    return variants
+
+class CompressionMiddleware:
+    # ASGI puro: segura o corpo (as rotas daqui respondem de uma vez), comprime se
+    # valer a pena e mede a CPU. Respostas em streaming passam direto.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        start = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start = message
+                headers = MutableHeaders(scope=start)
+                content_type = headers.get("content-type", "")
+                if not content_type.startswith(COMPRESSIBLE_TYPES):
+                    passthrough = True
+                    await send(start)
+                    return
+                # Caches (borda da Vercel) guardam uma variante por encoding
+                headers.add_vary_header("Accept-Encoding")
+                if encoding is None or "content-encoding" in headers or start["status"] in (204, 304):
+                    passthrough = True
+                    await send(start)
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            if message.get("more_body", False):
+                # Streaming: não dá para saber o tamanho final, vai sem compressão
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            if len(body) >= COMPRESSION_MIN_SIZE:
+                started = time.thread_time()
+                compressed = compress_body(body, encoding)
+                cpu_seconds = time.thread_time() - started
+                record_compression(encoding, len(body), len(compressed), cpu_seconds)
+                if len(compressed) < len(body):
+                    headers = MutableHeaders(scope=start)
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(compressed))
+                    headers.append("Server-Timing", f"compress;dur={cpu_seconds * 1000:.2f}")
+                    body = compressed
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+app.add_middleware(CompressionMiddleware)
+
 # --- SCHEMAS (Pydantic) ---
 class UserCreate(BaseModel):
     username: str
@@ -316,6 +1063,20 @@ class TierlistUpdate(BaseModel):
     data: Dict[str, Any]
     # owner_id removido
 
+class TierlistOperation(BaseModel):
+    op: str                         # "move" | "insert" | "remove"
+    game_id: int
+    tier: Optional[str] = None      # destino (move/insert)
+    position: Optional[int] = None  # posição no destino; vazio = final
+    title: Optional[str] = None     # insert de jogo que a dimensão ainda não conhece
+    cover: Optional[str] = None     # capa da entrada (insert)
+    is_favorite: bool = False
+
+class TierlistPatch(BaseModel):
+    version: int
+    name: Optional[str] = None
+    ops: List[TierlistOperation] = []
+
 class CommentInput(BaseModel):
     game_id: int
     # user_id removido
@@ -342,6 +1103,349 @@ class FriendInput(BaseModel):
     # sender_id removido no request
     target_id: int
 
+# Saídas tipadas das rotas mais pesadas: o FastAPI serializa direto pelo pydantic, sem jsonable_encoder
+class AuthorOut(BaseModel):
+    id: Optional[int] = None
+    username: Optional[str] = None
+    nickname: Optional[str] = None
+    avatar_url: Optional[str] = None
+
+class CommentOut(BaseModel):
+    id: int
+    content: Optional[str] = None
+    created_at: Optional[str] = None
+    author: AuthorOut
+
+class GameCommentOut(CommentOut):
+    likes: int = 0
+    user_liked: bool = False
+
+class CommentPage(BaseModel):
+    items: List[CommentOut]
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
+
+class GameCommentPage(BaseModel):
+    items: List[GameCommentOut]
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
+
+class TierlistPublicOut(BaseModel):
+    id: int
+    name: Optional[str] = None
+    data: Dict[str, Any]
+    version: int = 0
+    owner_id: Optional[int] = None
+    owner: AuthorOut
+    likes_count: int = 0
+    user_has_liked: bool = False
+    comments: List[CommentOut]
+    comments_next_cursor: Optional[str] = None
+    comments_total: int = 0
+
+class ReviewOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: int
+    game_id: int
+    game_name: Optional[str] = None
+    game_image_url: Optional[str] = None
+    game_video_id: Optional[str] = None
+    genre: Optional[str] = None
+    jogabilidade: Optional[float] = None
+    graficos: Optional[float] = None
+    narrativa: Optional[float] = None
+    audio: Optional[float] = None
+    desempenho: Optional[float] = None
+    nota_geral: Optional[float] = None
+    is_favorite: Optional[bool] = None
+    owner_id: Optional[int] = None
+
+# ==============================================================================
+#  DIMENSÃO DE JOGOS (id -> nome/capa)
+# ==============================================================================
+
+# LRU em memória na frente da tabela games; invalidado a cada upsert
+GAME_CACHE_SIZE = 4096
+game_cache = OrderedDict()
+game_cache_lock = threading.Lock()
+
+def resolve_games(db: Session, game_ids) -> dict:
+    # Resolve vários ids de uma vez: o que não está no LRU vem numa única consulta IN
+    wanted = {gid for gid in game_ids if gid is not None}
+    found = {}
+    with game_cache_lock:
+        for gid in wanted:
+            if gid in game_cache:
+                game_cache.move_to_end(gid)
+                found[gid] = game_cache[gid]
+    missing = wanted - found.keys()
+    if missing:
+        rows = db.query(Game.id, Game.name, Game.cover_url).filter(Game.id.in_(missing)).all()
+        with game_cache_lock:
+            for gid, name, cover_url in rows:
+                entry = {"name": name, "cover": cover_url or ""}
+                found[gid] = entry
+                game_cache[gid] = entry
+            while len(game_cache) > GAME_CACHE_SIZE:
+                game_cache.popitem(last=False)
+    return found
+
+def upsert_game(db: Session, game_id, name, cover_url=None):
+    # Roda dentro da transação de quem chamou; o savepoint evita que uma
+    # inserção concorrente do mesmo jogo derrube a operação principal
+    if not game_id or not name:
+        return
+    try:
+        with db.begin_nested():
+            game = db.query(Game).filter(Game.id == game_id).first()
+            if game is None:
+                db.add(Game(id=game_id, name=name, cover_url=cover_url or ""))
+            else:
+                game.name = name
+                if cover_url: game.cover_url = cover_url
+    except IntegrityError:
+        pass
+    with game_cache_lock:
+        game_cache.pop(game_id, None)
+
+def rebuild_games(db: Session):
+    # Backfill inicial a partir dos nomes/capas já gravados em reviews e discussões
+    known = {}
+    for game_id, name, cover_url in db.query(Review.game_id, func.max(Review.game_name), func.max(Review.game_image_url)).group_by(Review.game_id).all():
+        if name: known[game_id] = (name, cover_url or "")
+    for game_id, name in db.query(Discussion.game_id, func.max(Discussion.game_name)).filter(Discussion.game_id.isnot(None)).group_by(Discussion.game_id).all():
+        if name and game_id not in known: known[game_id] = (name, "")
+    for game_id, (name, cover_url) in known.items():
+        db.add(Game(id=game_id, name=name, cover_url=cover_url))
+    db.commit()
+
+# ==============================================================================
+#  SERVIÇOS EXTERNOS: BULKHEADS, TIMEOUTS E CIRCUIT BREAKERS
+# ==============================================================================
+
+# Cada serviço externo tem um teto próprio de chamadas simultâneas. Sem isso, uma
+# Steam lenta prende todas as threads do servidor e rotas só de banco (perfil,
+# tierlists) ficam esperando junto. Além de `concurrency` chamadas em andamento,
+# no máximo `queue` esperam até BULKHEAD_QUEUE_TIMEOUT segundos; o resto falha na hora.
+BULKHEAD_QUEUE_TIMEOUT = float(os.getenv("BULKHEAD_QUEUE_TIMEOUT", "0.5"))
+
+class UpstreamUnavailable(Exception):
+    pass
+
+class BulkheadFull(UpstreamUnavailable):
+    pass
+
+class CircuitOpen(UpstreamUnavailable):
+    pass
+
+class Bulkhead:
+    def __init__(self, name: str, concurrency: int, queue: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+        self.peak = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def call(self, fn, *args, **kwargs):
+        with self._lock:
+            if self.active + self.waiting >= self.concurrency + self.queue:
+                self.rejected += 1
+                raise BulkheadFull(self.name)
+            self.waiting += 1
+        acquired = self._slots.acquire(timeout=BULKHEAD_QUEUE_TIMEOUT)
+        with self._lock:
+            self.waiting -= 1
+            if not acquired:
+                self.timed_out += 1
+                raise BulkheadFull(self.name)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "concurrency": self.concurrency,
+                "queue": self.queue,
+                "active": self.active,
+                "waiting": self.waiting,
+                "saturation": round(self.active / self.concurrency, 2),
+                "peak": self.peak,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out
+            }
+
+def make_bulkhead(name: str, concurrency: int, queue: int) -> Bulkhead:
+    prefix = f"BULKHEAD_{name.upper()}"
+    return Bulkhead(
+        name,
+        int(os.getenv(f"{prefix}_CONCURRENCY", str(concurrency))),
+        int(os.getenv(f"{prefix}_QUEUE", str(queue)))
+    )
+
+bulkheads = {
+    "igdb": make_bulkhead("igdb", 8, 8),
+    "steam": make_bulkhead("steam", 10, 10),
+    "translator": make_bulkhead("translator", 4, 8)
+}
+
+# Timeouts por serviço: (conexão, leitura) em segundos. Nenhuma chamada externa sai sem eles.
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "3.05"))
+# serviço -> (bulkhead, timeout de leitura padrão)
+UPSTREAMS = {
+    "igdb": ("igdb", 5),
+    "steam_store": ("steam", 5),
+    "steam_api": ("steam", 4),
+    "translator": ("translator", 4)
+}
+
+def upstream_timeout(upstream: str) -> float:
+    return float(os.getenv(f"UPSTREAM_{upstream.upper()}_TIMEOUT", str(UPSTREAMS[upstream][1])))
+
+# Circuit breaker: depois de CIRCUIT_FAILURE_THRESHOLD falhas seguidas o serviço fica
+# "open" e as chamadas nem saem por CIRCUIT_RESET_TIMEOUT segundos; aí uma única
+# chamada de teste passa ("half_open"). Sucesso fecha o circuito, falha reabre.
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+class CircuitBreaker:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.times_opened = 0
+        self.short_circuited = 0
+        self.stale_served = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= CIRCUIT_RESET_TIMEOUT:
+                self.state = "half_open"
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self.probing:
+                self.probing = True
+                return True
+            self.short_circuited += 1
+            return False
+
+    def release(self):
+        # Chamada liberada mas que não chegou ao serviço (ex.: bulkhead cheio)
+        with self._lock:
+            self.probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= CIRCUIT_FAILURE_THRESHOLD):
+                if self.state == "closed":
+                    self.times_opened += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def record_stale(self):
+        with self._lock:
+            self.stale_served += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "times_opened": self.times_opened,
+                "short_circuited": self.short_circuited,
+                "stale_served": self.stale_served,
+                "timeout": upstream_timeout(self.name)
+            }
+
+circuit_breakers = {name: CircuitBreaker(name) for name in UPSTREAMS}
+
+def guarded_call(upstream: str, fn, *args, **kwargs):
+    breaker = circuit_breakers[upstream]
+    if not breaker.allow():
+        raise CircuitOpen(upstream)
+    try:
+        result = fn(*args, **kwargs)
+    except UpstreamUnavailable:
+        breaker.release()
+        raise
+    except Exception:
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+    return result
+
+# Última resposta boa de cada chamada: servida enquanto o circuito está aberto ou
+# quando a chamada falha, para a página não ficar vazia durante uma queda
+UPSTREAM_CACHE_SIZE = 256
+upstream_cache = OrderedDict()
+upstream_cache_lock = threading.Lock()
+
+def fetch_json(method: str, url: str, **kwargs):
+    response = requests.request(method, url, **kwargs)
+    # 429/5xx contam como falha do serviço; 4xx é problema da consulta
+    if response.status_code == 429 or response.status_code >= 500:
+        raise requests.HTTPError(f"{url.split('?')[0]} respondeu {response.status_code}", response=response)
+    return response.json()
+
+def upstream_json(upstream: str, method: str, url: str, cache: bool = True, **kwargs):
+    kwargs.setdefault("timeout", (UPSTREAM_CONNECT_TIMEOUT, upstream_timeout(upstream)))
+    key = (upstream, method, url, kwargs.get("data"))
+    try:
+        # Circuito antes do bulkhead: aberto, falha na hora (ou cai no cache) sem
+        # esperar vaga na fila; bulkhead cheio devolve a vaga de sonda do circuito
+        data = guarded_call(upstream, bulkheads[UPSTREAMS[upstream][0]].call, fetch_json, method, url, **kwargs)
+    except (UpstreamUnavailable, requests.RequestException, ValueError):
+        if not cache:
+            raise
+        with upstream_cache_lock:
+            if key not in upstream_cache:
+                raise
+            upstream_cache.move_to_end(key)
+            data = upstream_cache[key]
+        circuit_breakers[upstream].record_stale()
+        return data
+    if cache:
+        with upstream_cache_lock:
+            upstream_cache[key] = data
+            upstream_cache.move_to_end(key)
+            while len(upstream_cache) > UPSTREAM_CACHE_SIZE:
+                upstream_cache.popitem(last=False)
+    return data
+
+@app.exception_handler(UpstreamUnavailable)
+async def upstream_unavailable_handler(request: Request, exc: UpstreamUnavailable):
+    # Falha rápida (bulkhead cheio ou circuito aberto, sem cópia em cache): o
+    # cliente tenta de novo em vez de segurar uma thread esperando o serviço
+    return FastJSONResponse(
+        status_code=503,
+        content={"detail": "Serviço externo indisponível, tente novamente"},
+        headers={"Retry-After": "1"}
+    )
+
 # ==============================================================================
 #  INTEGRAÇÃO IGDB
 # ==============================================================================
@@ -362,10 +1466,12 @@ def get_igdb_headers():
     if not IGDB_ACCESS_TOKEN or time.time() > IGDB_TOKEN_EXPIRY:
         try:
             url = f"https://id.twitch.tv/oauth2/token?client_id={client_id}&client_secret={client_secret}&grant_type=client_credentials"
-            response = requests.post(url)
-            data = response.json()
+            # Token nunca vem do cache: um token velho com expires_in novo seria pior que nada
+            data = upstream_json("igdb", "POST", url, cache=False)
             IGDB_ACCESS_TOKEN = data["access_token"]
-            IGDB_TOKEN_EXPIRY = time.time() + data["expires_in"] - 60 
+            IGDB_TOKEN_EXPIRY = time.time() + data["expires_in"] - 60
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
             print(f"Erro ao pegar token IGDB: {e}")
             return None
@@ -395,27 +1501,30 @@ def get_steam_library(steam_id: str):
     if not steam_id.isdigit():
         try:
             resolve_url = f"http://api.steampowered.com/ISteamUser/ResolveVanityURL/v0001/?key={api_key}&vanityurl={steam_id}"
-            resp = requests.get(resolve_url).json()
+            resp = upstream_json("steam_api", "GET", resolve_url)
             if resp.get('response', {}).get('success') == 1:
                 target_id = resp['response']['steamid']
+        except UpstreamUnavailable:
+            raise
         except:
             pass 
 
     player_summary = {}
     try:
         summary_url = f"http://api.steampowered.com/ISteamUser/GetPlayerSummaries/v0002/?key={api_key}&steamids={target_id}"
-        summary_resp = requests.get(summary_url).json()
+        summary_resp = upstream_json("steam_api", "GET", summary_url)
         players = summary_resp.get("response", {}).get("players", [])
         if players:
             player_summary = players[0]
+    except UpstreamUnavailable:
+        raise
     except: pass
 
     url = f"http://api.steampowered.com/IPlayerService/GetOwnedGames/v0001/?key={api_key}&steamid={target_id}&include_appinfo=1&include_played_free_games=1&format=json"
     
     games_list = []
     try:
-        response = requests.get(url)
-        data = response.json()
+        data = upstream_json("steam_api", "GET", url)
         games = data.get("response", {}).get("games", [])
         
         for game in games:
@@ -433,6 +1542,8 @@ def get_steam_library(steam_id: str):
             })
             
         games_list.sort(key=lambda x: x['playtime_forever'], reverse=True)
+    except UpstreamUnavailable:
+        raise
     except: pass
 
     return {
@@ -457,8 +1568,7 @@ def search_games(q: str = None):
     body = f'search "{q}"; fields name, cover.url, genres.name, first_release_date, videos.video_id, total_rating_count; where cover != null; limit 50;'
     
     try:
-        response = requests.post(url, headers=headers, data=body)
-        games = response.json()
+        games = upstream_json("igdb", "POST", url, headers=headers, data=body)
         
 # --- 1. DEDUPLICAÇÃO INTELIGENTE COM DETECÇÃO DE REMAKES ---
         
@@ -575,6 +1685,8 @@ def search_games(q: str = None):
             
         return results
 
+    except UpstreamUnavailable:
+        raise
     except Exception as e:
         print(f"Erro na busca IGDB: {e}")
         return []
@@ -592,10 +1704,11 @@ def get_game(game_id: str, db: Session = Depends(get_db)):
     community_stats = {}
     
     try:
-        response = requests.post(url, headers=headers, data=body)
-        data = response.json()
+        data = upstream_json("igdb", "POST", url, headers=headers, data=body)
         if data:
             igdb_data = data[0]
+    except UpstreamUnavailable:
+        raise
     except Exception as e:
         print(f"Erro IGDB: {e}")
         return {}
@@ -623,7 +1736,7 @@ def get_game(game_id: str, db: Session = Depends(get_db)):
         try:
             search_name = urllib.parse.quote(igdb_data["name"])
             search_url = f"https://store.steampowered.com/api/storesearch/?term={search_name}&l=portuguese&cc=BR"
-            search_resp = requests.get(search_url, timeout=3).json()
+            search_resp = upstream_json("steam_store", "GET", search_url)
             
             items = search_resp.get("items", [])
             if items:
@@ -696,7 +1809,7 @@ def get_game(game_id: str, db: Session = Depends(get_db)):
         
         try:
             store_url = f"http://store.steampowered.com/api/appdetails?appids={steam_app_id}&cc=br&l=portuguese&filters=basic,price_overview,metacritic"
-            store_resp = requests.get(store_url, headers={"User-Agent": "GameGScore/1.0"}, timeout=3).json()
+            store_resp = upstream_json("steam_store", "GET", store_url, headers={"User-Agent": "GameGScore/1.0"})
             if store_resp and str(steam_app_id) in store_resp:
                 app_data = store_resp[str(steam_app_id)]
                 if app_data.get("success"):
@@ -710,7 +1823,7 @@ def get_game(game_id: str, db: Session = Depends(get_db)):
 
         try:
             players_url = f"https://api.steampowered.com/ISteamUserStats/GetNumberOfCurrentPlayers/v1/?appid={steam_app_id}"
-            players_resp = requests.get(players_url, headers={"User-Agent": "GameGScore/1.0"}, timeout=3).json()
+            players_resp = upstream_json("steam_api", "GET", players_url, headers={"User-Agent": "GameGScore/1.0"})
             if players_resp.get("response"):
                 steam_data["current_players"] = players_resp["response"].get("player_count", 0)
         except Exception as e:
@@ -736,6 +1849,15 @@ def get_game(game_id: str, db: Session = Depends(get_db)):
         for s in igdb_data["screenshots"][:4]: 
             screenshots.append(format_igdb_image(s["url"], "t_screenshot_big"))
 
+    # Mantém a dimensão de jogos atualizada com o nome/capa oficiais do IGDB
+    if igdb_data.get("id") and igdb_data.get("name"):
+        try:
+            upsert_game(db, igdb_data["id"], igdb_data["name"], cover_med)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Erro ao salvar jogo na dimensão: {e}")
+
     return {
         "id": igdb_data.get("id"),
         "name": igdb_data.get("name"),
@@ -756,79 +1878,74 @@ def get_game(game_id: str, db: Session = Depends(get_db)):
 
 @app.get("/api/community/top_comments")
 def get_top_community_comments(db: Session = Depends(get_db)):
-    stmt = db.query(Comment, func.count(CommentLike.id).label('likes'))\
-        .outerjoin(CommentLike)\
-        .group_by(Comment.id)\
-        .order_by(desc('likes'), desc(Comment.created_at))\
+    # Uma consulta: likes desnormalizados + autor + nome do jogo pela dimensão games
+    stmt = db.query(Comment, User, Game.name)\
+        .outerjoin(User, User.id == Comment.user_id)\
+        .outerjoin(Game, Game.id == Comment.game_id)\
+        .order_by(desc(Comment.likes_count), desc(Comment.id))\
         .limit(10)\
         .all()
     
     results = []
-    for comment, likes in stmt:
-        author = db.query(User).filter(User.id == comment.user_id).first()
-        game_name = "Jogo Desconhecido"
-        review = db.query(Review).filter(Review.game_id == comment.game_id).first()
-        if review:
-            game_name = review.game_name
-
+    for comment, author, game_name in stmt:
         results.append({
             "id": comment.id,
             "content": comment.content,
-            "likes": likes,
+            "likes": comment.likes_count or 0,
             "created_at": comment.created_at,
             "game_id": comment.game_id,
-            "game_name": game_name,
+            "game_name": game_name or "Jogo Desconhecido",
             "author": {
                 "id": author.id,
                 "username": author.username,
                 "nickname": author.nickname or author.username,
                 "avatar_url": author.avatar_url
-            }
+            } if author else {"nickname": "Desconhecido", "avatar_url": ""}
         })
     return results
 
 @app.get("/api/community/top_tierlists")
 def get_top_community_tierlists(db: Session = Depends(get_db)):
-    stmt = db.query(Tierlist, func.count(TierlistLike.id).label('likes'))\
-        .outerjoin(TierlistLike)\
-        .group_by(Tierlist.id)\
-        .order_by(desc('likes'), desc(Tierlist.id))\
+    # Só o resumo: o documento completo vem de /api/tierlist_public/{id}
+    likes = db.query(TierlistLike.tierlist_id, func.count(TierlistLike.id).label("likes"))\
+        .group_by(TierlistLike.tierlist_id).subquery()
+    likes_count = func.coalesce(likes.c.likes, 0)
+    stmt = db.query(Tierlist.id, Tierlist.name, Tierlist.summary, likes_count, User)\
+        .outerjoin(likes, likes.c.tierlist_id == Tierlist.id)\
+        .outerjoin(User, User.id == Tierlist.owner_id)\
+        .order_by(desc(likes_count), desc(Tierlist.id))\
         .limit(10)\
         .all()
     
     results = []
-    for tierlist, likes in stmt:
-        author = db.query(User).filter(User.id == tierlist.owner_id).first()
-        try:
-            loaded_data = json.loads(tierlist.data) if tierlist.data else {}
-        except:
-            loaded_data = {}
-            
+    for tierlist_id, name, summary, likes, author in stmt:
         results.append({
-            "id": tierlist.id,
-            "name": tierlist.name,
+            "id": tierlist_id,
+            "name": name,
             "likes": likes,
-            "data": loaded_data,
+            "summary": tierlist_summary(summary),
             "author": {
                 "id": author.id,
                 "username": author.username,
                 "nickname": author.nickname or author.username,
                 "avatar_url": author.avatar_url
-            }
+            } if author else {"id": 0, "username": "Desconhecido", "nickname": "Desconhecido", "avatar_url": ""}
         })
     return results
 
 # Rota protegida: usuário deve estar logado para dar like
 @app.post("/api/tierlist/{tierlist_id}/like")
-def toggle_tierlist_like(tierlist_id: int, like_data: TierlistLikeInput, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def toggle_tierlist_like(tierlist_id: int, like_data: TierlistLikeInput, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     existing = db.query(TierlistLike).filter(TierlistLike.tierlist_id == tierlist_id, TierlistLike.user_id == current_user.id).first()
     if existing:
         db.delete(existing)
+        bump_revision(db, f"tierlist:{tierlist_id}")
         db.commit()
         return {"status": "unliked"}
     else:
         new_like = TierlistLike(tierlist_id=tierlist_id, user_id=current_user.id)
         db.add(new_like)
+        bump_revision(db, f"tierlist:{tierlist_id}")
         db.commit()
         return {"status": "liked"}
 
@@ -837,26 +1954,39 @@ def toggle_tierlist_like(tierlist_id: int, like_data: TierlistLikeInput, current
 # ==============================================================================
 
 
+# Rotas síncronas (banco no threadpool); só o bcrypt vai para o password_executor
 @app.post("/api/auth/register")
 def register(user: UserCreate, db: Session = Depends(get_db)):
-    if db.query(User).filter(User.email == user.email).first():
+    if db.query(User.id).filter(User.email == user.email).first():
         raise HTTPException(status_code=400, detail="Email já cadastrado")
-    if db.query(User).filter(User.username == user.username).first():
+    if db.query(User.id).filter(User.username == user.username).first():
         raise HTTPException(status_code=400, detail="Nome de usuário já existe")
-    hashed_pw = get_password_hash(user.password)
+    hashed_pw = run_password_task(get_password_hash, user.password)
     new_user = User(email=user.email, username=user.username, nickname=user.username, hashed_password=hashed_pw, avatar_url="", banner_url="")
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
+    invalidate_user_prefixes(new_user.username)
     return {"message": "Criado!", "user_id": new_user.id, "username": new_user.username}
 
 @app.post("/api/auth/login")
 def login(user_login: UserLogin, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == user_login.email).first()
+    user = db.query(User.id, User.username, User.hashed_password).filter(User.email == user_login.email).first()
     if not user:
         raise HTTPException(status_code=401, detail="Email ou senha incorretos")
-    if not verify_password(user_login.password, user.hashed_password):
+    if not run_password_task(verify_password, user_login.password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Email ou senha incorretos")
+
+    # Política de custo mudou: regrava o hash com a senha que acabou de ser validada.
+    # O UPDATE condicional não sobrescreve um hash trocado por outra requisição.
+    if password_needs_rehash(user.hashed_password):
+        try:
+            new_hash = run_password_task(get_password_hash, user_login.password)
+            db.execute(update(User).where(User.id == user.id, User.hashed_password == user.hashed_password)
+                .values(hashed_password=new_hash).execution_options(synchronize_session=False))
+            db.commit()
+        except HTTPException:
+            pass # pool cheio: fica para o próximo login
     
     # Cria o token de acesso seguro
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -873,108 +2003,274 @@ def login(user_login: UserLogin, db: Session = Depends(get_db)):
         "username": user.username
     }
 
+# ==============================================================================
+#  RESUMO DE PERFIL MATERIALIZADO
+# ==============================================================================
+
+REVIEW_ATTRIBUTES = ["jogabilidade", "graficos", "narrativa", "audio", "desempenho"]
+
+# Top-N com ROW_NUMBER() OVER (PARTITION BY ...): o banco devolve só as linhas
+# necessárias (funciona no SQLite >= 3.25 e no Postgres). Empates seguem o id,
+# como a ordenação estável que era feita em Python.
+def top_reviews_by_attribute(db: Session, user_id: int, limit: int = 3):
+    # "Unpivot" das 5 notas com UNION ALL e um ranking por atributo
+    unpivoted = union_all(*[
+        select(
+            literal(attr).label("attribute"),
+            Review.id.label("review_id"),
+            Review.game_name.label("game_name"),
+            getattr(Review, attr).label("score")
+        ).where(Review.owner_id == user_id, getattr(Review, attr) > 0)
+        for attr in REVIEW_ATTRIBUTES
+    ]).subquery()
+    ranked = select(
+        unpivoted.c.attribute, unpivoted.c.game_name, unpivoted.c.score,
+        func.row_number().over(partition_by=unpivoted.c.attribute, order_by=(desc(unpivoted.c.score), unpivoted.c.review_id)).label("rn")
+    ).subquery()
+    rows = db.execute(select(ranked.c.attribute, ranked.c.game_name, ranked.c.score).where(ranked.c.rn <= limit).order_by(ranked.c.attribute, ranked.c.rn)).all()
+
+    best_by_attribute = {attr: [] for attr in REVIEW_ATTRIBUTES}
+    for attr, game_name, score in rows:
+        best_by_attribute[attr].append({"title": game_name, "score": score})
+    return best_by_attribute
+
+def top_reviews_by_genre(db: Session, user_id: int, limit: int = 3):
+    genre_col = func.coalesce(func.nullif(Review.genre, ""), "Outros")
+    ranked = select(
+        genre_col.label("genre"), Review.game_name, Review.game_image_url, Review.nota_geral,
+        *[getattr(Review, attr) for attr in REVIEW_ATTRIBUTES],
+        func.row_number().over(partition_by=genre_col, order_by=(desc(Review.nota_geral), Review.id)).label("rn"),
+        func.min(Review.id).over(partition_by=genre_col).label("first_id")
+    ).where(Review.owner_id == user_id).subquery()
+    # Gêneros na ordem em que aparecem pela primeira vez, como antes
+    rows = db.execute(select(ranked).where(ranked.c.rn <= limit).order_by(ranked.c.first_id, ranked.c.rn)).mappings().all()
+
+    top_by_genre = {}
+    for r in rows:
+        top_by_genre.setdefault(r["genre"], []).append({
+            "title": r["game_name"],
+            "ratings": {attr: r[attr] for attr in REVIEW_ATTRIBUTES},
+            "cover": r["game_image_url"] or "", "nota_geral": r["nota_geral"]
+        })
+    return top_by_genre
+
+def load_profile_summary(db: Session, user_id: int) -> ProfileSummary:
+    # Na primeira vez (usuário antigo ou novo) materializa todas as partes
+    summary = db.query(ProfileSummary).filter(ProfileSummary.user_id == user_id).first()
+    if summary is None:
+        summary = ProfileSummary(user_id=user_id)
+        fill_profile_review_stats(db, summary)
+        fill_profile_follow_counts(db, summary)
+        db.add(summary)
+        db.flush() # sem autoflush: garante que as próximas consultas da sessão vejam a linha
+    return summary
+
+def refresh_profile_reviews(db: Session, user_id: int):
+    # Chamado por post_review e set_favorites (o fill_* abaixo bumpa o perfil)
+    bump_revision(db, f"user_games:{user_id}")
+    summary = db.query(ProfileSummary).filter(ProfileSummary.user_id == user_id).first()
+    if summary is None:
+        return load_profile_summary(db, user_id)
+    fill_profile_review_stats(db, summary)
+    return summary
+
+def refresh_profile_follows(db: Session, user_id: int):
+    # Chamado no toggle_follow para os dois lados da relação
+    summary = db.query(ProfileSummary).filter(ProfileSummary.user_id == user_id).first()
+    if summary is None:
+        return load_profile_summary(db, user_id)
+    fill_profile_follow_counts(db, summary)
+    return summary
+
+# Toda escrita no resumo passa pelos fill_*: é aqui que a revisão do perfil (ETag) muda
+def fill_profile_review_stats(db: Session, summary: ProfileSummary):
+    # Parte derivada das reviews, calculada com agregados no banco (nada de
+    # carregar todas as reviews em Python)
+    bump_revision(db, f"profile:{summary.user_id}")
+    owned = Review.owner_id == summary.user_id
+
+    any_10 = or_(*[getattr(Review, a) == 10 for a in REVIEW_ATTRIBUTES])
+    all_10 = and_(*[getattr(Review, a) == 10 for a in REVIEW_ATTRIBUTES])
+    is_fps = or_(Review.genre.contains("Shooter"), Review.genre.contains("FPS"))
+    count, total, fps_count, high_score, perfect, hater = db.query(
+        func.count(Review.id),
+        func.coalesce(func.sum(Review.nota_geral), 0.0),
+        func.coalesce(func.sum(case((is_fps, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((any_10, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((all_10, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((Review.nota_geral < 3, 1), else_=0)), 0),
+    ).filter(owned).one()
+
+    summary.reviews_count = count
+    summary.average_score = total / count if count > 0 else 0.0
+    summary.fps_count = fps_count
+    summary.has_high_score = high_score > 0
+    summary.has_perfect_game = perfect > 0
+    summary.has_hater_review = hater > 0
+
+    # Gênero favorito: mais reviews, desempate pela média
+    genre_col = func.coalesce(func.nullif(Review.genre, ""), "Outros")
+    top_genre = db.query(genre_col).filter(owned).group_by(genre_col)\
+        .order_by(desc(func.count(Review.id)), desc(func.avg(Review.nota_geral))).first()
+    summary.favorite_genre = top_genre[0] if top_genre else "Nenhum"
+
+    summary.best_by_attribute = json.dumps(top_reviews_by_attribute(db, summary.user_id))
+
+    # Favoritos marcados; se não houver, as 3 maiores notas
+    favorites = db.query(Review).filter(owned, Review.is_favorite == True).order_by(Review.id).limit(3).all()
+    if not favorites:
+        favorites = db.query(Review).filter(owned).order_by(desc(Review.nota_geral), Review.id).limit(3).all()
+    summary.top_favorites = json.dumps([{
+        "game_name": r.game_name,
+        "game_image_url": r.game_image_url or "",
+        "nota_geral": r.nota_geral,
+        "jogabilidade": r.jogabilidade,
+        "graficos": r.graficos,
+        "narrativa": r.narrativa,
+        "audio": r.audio,
+        "desempenho": r.desempenho
+    } for r in favorites])
+    summary.updated_at = datetime.now().isoformat()
+
+def fill_profile_follow_counts(db: Session, summary: ProfileSummary):
+    bump_revision(db, f"profile:{summary.user_id}")
+    summary.followers_count = db.query(func.count(Follower.follower_id)).filter(Follower.followed_id == summary.user_id).scalar()
+    summary.following_count = db.query(func.count(Follower.followed_id)).filter(Follower.follower_id == summary.user_id).scalar()
+    summary.updated_at = datetime.now().isoformat()
+
+# ==============================================================================
+#  CONQUISTAS (AVALIADAS NA ESCRITA)
+# ==============================================================================
+
+def is_connected(user: User) -> bool:
+    return bool(user.steam_url) or bool(user.xbox_url) or bool(user.psn_url) or bool(user.epic_url)
+
+# código -> (eventos que podem desbloquear, regra). As regras só leem o resumo
+# materializado e a linha do usuário, então avaliar não custa consultas extras.
+# Ao criar uma conquista nova, rode o backfill: python api/index.py backfill-achievements <codigo>
+ACHIEVEMENT_RULES = {
+    "first_review": (("review",), lambda user, summary: summary.reviews_count >= 1),
+    "five_reviews": (("review",), lambda user, summary: summary.reviews_count >= 5),
+    "ten_reviews": (("review",), lambda user, summary: summary.reviews_count >= 10),
+    "fps_king": (("review",), lambda user, summary: summary.fps_count >= 20),
+    "high_score": (("review",), lambda user, summary: summary.has_high_score),
+    "perfect_game": (("review",), lambda user, summary: summary.has_perfect_game),
+    "hater": (("review",), lambda user, summary: summary.has_hater_review),
+    "connected": (("profile",), lambda user, summary: is_connected(user)),
+    "veteran": (("xp",), lambda user, summary: (user.level or 1) >= 5),
+}
+
+def evaluate_achievements(db: Session, user: User, event: Optional[str] = None, codes=None):
+    # Chamado nos caminhos de escrita (post_review, update_profile, ganhos de XP)
+    # antes do commit; devolve os códigos desbloqueados agora
+    summary = load_profile_summary(db, user.id)
+    unlocked = {code for (code,) in db.query(UserAchievement.achievement).filter(UserAchievement.user_id == user.id).all()}
+    newly_unlocked = []
+    for code, (events, rule) in ACHIEVEMENT_RULES.items():
+        if code in unlocked: continue
+        if event is not None and event not in events: continue
+        if codes is not None and code not in codes: continue
+        if not rule(user, summary): continue
+        try:
+            with db.begin_nested():
+                db.add(UserAchievement(user_id=user.id, achievement=code))
+            newly_unlocked.append(code)
+        except IntegrityError:
+            pass # desbloqueada por outra requisição concorrente
+    if newly_unlocked:
+        # As conquistas vão no corpo do perfil: invalida o ETag
+        bump_revision(db, f"profile:{user.id}")
+    return newly_unlocked
+
+def ensure_profile_summary(db: Session, user_id: int):
+    # Usuários antigos ainda sem resumo: materializa uma vez
+    if db.query(ProfileSummary.user_id).filter(ProfileSummary.user_id == user_id).first() is not None:
+        return
+    try:
+        load_profile_summary(db, user_id)
+        db.commit()
+    except IntegrityError:
+        db.rollback() # outra requisição materializou ao mesmo tempo
+
+def ensure_achievements_evaluated(db: Session, user_id: int):
+    # Backfill pendente que ainda não chegou neste usuário: avalia as regras na
+    # leitura do perfil em vez de mostrar tudo bloqueado até o cron passar
+    progress = db.get(JobProgress, "backfill_achievements")
+    if progress is None or user_id <= (progress.last_id or 0):
+        return
+    user = db.get(User, user_id)
+    if user is None:
+        return
+    try:
+        evaluate_achievements(db, user)
+        db.commit()
+    except IntegrityError:
+        db.rollback() # outra requisição avaliou ao mesmo tempo
+
+def get_user_achievements(db: Session, user_id: int):
+    # Leitura indexada pela PK (user_id, achievement)
+    rows = db.query(UserAchievement.achievement, UserAchievement.unlocked_at).filter(UserAchievement.user_id == user_id).all()
+    unlocked_at = dict(rows)
+    achievements = {code: code in unlocked_at for code in ACHIEVEMENT_RULES}
+    return achievements, unlocked_at
+
+ACHIEVEMENT_BATCH_SIZE = 500
+
+def backfill_achievements_batch(db: Session, last_id: int, codes=None, batch_size: int = ACHIEVEMENT_BATCH_SIZE):
+    # Um lote de usuários depois de last_id; devolve (último id, desbloqueios) ou (None, 0) no fim
+    users = db.query(User).filter(User.id > last_id).order_by(User.id).limit(batch_size).all()
+    if not users:
+        return None, 0
+    unlocked = sum(len(evaluate_achievements(db, user, codes=codes)) for user in users)
+    return users[-1].id, unlocked
+
+def backfill_achievements(db: Session, codes=None):
+    # Job pontual para conquistas novas: avalia todos os usuários em lotes
+    # (python api/index.py backfill-achievements [codigo ...])
+    last_id, total = 0, 0
+    while True:
+        last_id, unlocked = backfill_achievements_batch(db, last_id, codes=codes)
+        if last_id is None:
+            return total
+        total += unlocked
+        db.commit()
+
+def schedule_achievements_backfill(db: Session):
+    # Tabela recém-criada: o cron avalia os usuários antigos em lotes
+    if db.get(JobProgress, "backfill_achievements") is None:
+        db.add(JobProgress(name="backfill_achievements", last_id=0))
+        db.commit()
+
 @app.get("/api/profile/{identifier}")
-def get_profile(identifier: str, db: Session = Depends(get_db)):
-    # Tenta buscar o usuário
-    user = None
-    
-    # Se for puramente numérico, tenta buscar pelo ID primeiro
+def get_profile(identifier: str, request: Request, response: Response, db: Session = Depends(get_db)):
+    # Resolve ID (se numérico) ou username só pelo índice; se os dois casarem com
+    # usuários diferentes, o ID tem prioridade.
+    query = db.query(User.id)
     if identifier.isdigit():
-        user = db.query(User).filter(User.id == int(identifier)).first()
-    
-    # Se não achou pelo ID (ou não era número), busca pelo username
-    if not user:
-        # Busca por username (case insensitive é melhor para UX, mas aqui manteremos exato ou ilike)
-        user = db.query(User).filter(User.username == identifier).first()
+        query = query.filter(or_(User.id == int(identifier), User.username == identifier))\
+            .order_by(desc(case((User.id == int(identifier), 1), else_=0)))
+    else:
+        query = query.filter(User.username == identifier)
+    user_id = query.scalar()
 
-    if not user: 
+    if user_id is None:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
-    
-    user_id = user.id # Pegamos o ID real do usuário encontrado
 
-    all_reviews = db.query(Review).filter(Review.owner_id == user_id).all()
-    review_count = len(all_reviews)
-    
-    genre_map = {}
-    fps_count = 0
-    total_score_sum = 0
+    # Antes da revisão: o que for gravado aqui (resumo de usuário antigo, conquistas
+    # do backfill pendente) já entra no ETag desta resposta
+    ensure_profile_summary(db, user_id)
+    ensure_achievements_evaluated(db, user_id)
 
-    favorites = [r for r in all_reviews if r.is_favorite]
-    if not favorites:
-        favorites = sorted(all_reviews, key=lambda x: x.nota_geral, reverse=True)[:3]
-    else:
-        favorites = favorites[:3]
+    # Cliente já tem esta revisão do perfil: 304 sem montar nada
+    (revision,), last_modified = read_revisions(db, f"profile:{user_id}")
+    not_modified = conditional_get(request, response, ("profile", user_id, revision), last_modified)
+    if not_modified:
+        return not_modified
 
-    favorites_data = []
-    for r in favorites:
-        favorites_data.append({
-            "game_name": r.game_name,
-            "game_image_url": r.game_image_url or "",
-            "nota_geral": r.nota_geral,
-            "jogabilidade": r.jogabilidade,
-            "graficos": r.graficos,
-            "narrativa": r.narrativa,
-            "audio": r.audio,
-            "desempenho": r.desempenho
-        })
+    user, summary = db.query(User, ProfileSummary).join(ProfileSummary, ProfileSummary.user_id == User.id)\
+        .filter(User.id == user_id).one()
 
-    for r in all_reviews:
-        g_name = r.genre or "Outros"
-        if "Shooter" in g_name or "FPS" in g_name:
-            fps_count += 1
-        if g_name not in genre_map:
-            genre_map[g_name] = {"count": 0, "total_score": 0.0}
-        genre_map[g_name]["count"] += 1
-        genre_map[g_name]["total_score"] += r.nota_geral
-        total_score_sum += r.nota_geral
-
-    favorite_genre = "Nenhum"
-    if genre_map:
-        def get_sort_key(item):
-            data = item[1]
-            avg = data["total_score"] / data["count"] if data["count"] > 0 else 0
-            return (data["count"], avg)
-        sorted_genres = sorted(genre_map.items(), key=get_sort_key, reverse=True)
-        favorite_genre = sorted_genres[0][0]
-
-    global_average = total_score_sum / review_count if review_count > 0 else 0.0
-
-    attributes = ["jogabilidade", "graficos", "narrativa", "audio", "desempenho"]
-    best_by_attribute = {}
-    for attr in attributes:
-        sorted_by_attr = sorted(all_reviews, key=lambda x: getattr(x, attr), reverse=True)[:3]
-        best_by_attribute[attr] = [
-            {"title": r.game_name, "score": getattr(r, attr)} 
-            for r in sorted_by_attr if getattr(r, attr) > 0
-        ]
-
-    has_10_any = False
-    perfect_game = False
-    hater_mode = False
-    for r in all_reviews:
-        if (r.jogabilidade == 10 or r.graficos == 10 or r.narrativa == 10 or r.audio == 10 or r.desempenho == 10):
-            has_10_any = True
-        if (r.jogabilidade == 10 and r.graficos == 10 and r.narrativa == 10 and r.audio == 10 and r.desempenho == 10):
-            perfect_game = True
-        if r.nota_geral < 3:
-            hater_mode = True
-
-    connected = (user.steam_url != "") or (user.xbox_url != "") or (user.psn_url != "") or (user.epic_url != "")
-
-    achievements = {
-        "first_review": review_count >= 1,
-        "five_reviews": review_count >= 5,
-        "ten_reviews": review_count >= 10,
-        "fps_king": fps_count >= 20,
-        "high_score": has_10_any,
-        "perfect_game": perfect_game,
-        "hater": hater_mode,
-        "connected": connected,
-        "veteran": user.level >= 5
-    }
-    
-    followers_count = db.query(Follower).filter(Follower.followed_id == user_id).count()
-    following_count = db.query(Follower).filter(Follower.follower_id == user_id).count()
+    achievements, achievements_unlocked_at = get_user_achievements(db, user.id)
 
     return {
         "id": user.id,
@@ -985,56 +2281,304 @@ def get_profile(identifier: str, db: Session = Depends(get_db)):
         "banner_url": user.banner_url,
         "xp": user.xp,
         "level": user.level,
-        "followers_count": followers_count,
-        "following_count": following_count,
+        "followers_count": summary.followers_count,
+        "following_count": summary.following_count,
         "stats": { 
-            "reviews_count": review_count,
-            "favorite_genre": favorite_genre,
-            "average_score": global_average
+            "reviews_count": summary.reviews_count,
+            "favorite_genre": summary.favorite_genre,
+            "average_score": summary.average_score
         },
         "social": { "steam": user.steam_url, "xbox": user.xbox_url, "psn": user.psn_url, "epic": user.epic_url },
-        "best_by_attribute": best_by_attribute,
+        "best_by_attribute": json.loads(summary.best_by_attribute or "{}"),
         "achievements": achievements,
-        "top_favorites": favorites_data
+        "achievements_unlocked_at": achievements_unlocked_at,
+        "top_favorites": json.loads(summary.top_favorites or "[]")
     }
 
+# Consultas de 1-2 letras (as mais frequentes, a cada tecla) não têm trigram:
+# o resultado por prefixo fica num LRU em memória com TTL
+USER_SEARCH_LIMIT = 50
+USER_PREFIX_MAX_LENGTH = 2
+USER_PREFIX_CACHE_SIZE = 2048
+USER_PREFIX_CACHE_TTL = 300
+user_prefix_cache = OrderedDict()
+user_prefix_cache_lock = threading.Lock()
+
+def invalidate_user_prefixes(*names):
+    with user_prefix_cache_lock:
+        for name in names:
+            lowered = (name or "").lower()
+            for size in range(1, USER_PREFIX_MAX_LENGTH + 1):
+                user_prefix_cache.pop(lowered[:size], None)
+
+def search_user_rows(db: Session, q: str):
+    # Relevância: nome exato > prefixo > substring, depois nível (id desempata)
+    lowered = q.lower()
+    username, nickname = func.lower(User.username), func.lower(User.nickname)
+    exact = or_(username == lowered, nickname == lowered)
+    prefix = or_(username.startswith(lowered, autoescape=True), nickname.startswith(lowered, autoescape=True))
+    rank = case((exact, 0), (prefix, 1), else_=2)
+    query = db.query(User.id, User.username, User.nickname, User.avatar_url, User.level)
+
+    if len(lowered) <= USER_PREFIX_MAX_LENGTH:
+        # Prefixo curto casa muita gente: pega os melhores de cada coluna pela faixa
+        # [q, q+1) do índice (lower(nome), level) e só então ordena a união
+        upper = lowered[:-1] + chr(ord(lowered[-1]) + 1)
+        candidates = [select(User.id).where(exact)]
+        for column in (username, nickname):
+            best = select(User.id).where(column >= lowered, column < upper, column.startswith(lowered, autoescape=True))\
+                .order_by(desc(User.level), User.id).limit(USER_SEARCH_LIMIT).subquery()
+            candidates.append(select(best.c.id))
+        query = query.filter(User.id.in_(union_all(*candidates)))
+    elif user_search_backend == "fts5":
+        match = '"' + lowered.replace('"', '""') + '"'
+        query = query.filter(User.id.in_(text("SELECT rowid FROM users_fts WHERE users_fts MATCH :match").bindparams(match=match)))
+    else:
+        # No Postgres este LIKE usa o GIN trigram de lower(username)/lower(nickname)
+        query = query.filter(or_(username.contains(lowered, autoescape=True), nickname.contains(lowered, autoescape=True)))
+
+    return query.order_by(rank, desc(User.level), User.id).limit(USER_SEARCH_LIMIT).all()
+
 @app.get("/api/users/search")
 def search_users(q: Optional[str] = None, db: Session = Depends(get_db)):
-    query = db.query(User)
+    q = (q or "").strip()
+    cache_key = q.lower() if 0 < len(q) <= USER_PREFIX_MAX_LENGTH else None
+    now = time.time()
+    if cache_key:
+        with user_prefix_cache_lock:
+            entry = user_prefix_cache.get(cache_key)
+            if entry and now - entry["last_updated"] < USER_PREFIX_CACHE_TTL:
+                user_prefix_cache.move_to_end(cache_key)
+                return entry["data"]
+
     if q:
-        query = query.filter(or_(User.username.ilike(f"%{q}%"), User.nickname.ilike(f"%{q}%")))
-        query = query.order_by(User.username.asc())
+        rows = search_user_rows(db, q)
     else:
-        query = query.order_by(User.username.asc())
-    users = query.limit(50).all()
+        rows = db.query(User.id, User.username, User.nickname, User.avatar_url, User.level)\
+            .order_by(User.username.asc()).limit(USER_SEARCH_LIMIT).all()
     results = []
-    for u in users:
+    for u in rows:
         results.append({
             "id": u.id, "username": u.username, "nickname": u.nickname or u.username, 
             "avatar_url": u.avatar_url, "level": u.level
         })
+    if cache_key:
+        with user_prefix_cache_lock:
+            user_prefix_cache[cache_key] = {"data": results, "last_updated": now}
+            while len(user_prefix_cache) > USER_PREFIX_CACHE_SIZE:
+                user_prefix_cache.popitem(last=False)
     return results
 
+# ==============================================================================
+#  RANKING DE XP (GERAL, SEMANAL E MENSAL)
+# ==============================================================================
+
+LEADERBOARD_PERIODS = ("all", "week", "month")
+LEADERBOARD_TTL = 60
+
+def xp_bucket_keys(moment=None):
+    moment = moment or datetime.now()
+    year, week, _ = moment.isocalendar()
+    return {"week": f"{year}-W{week:02d}", "month": moment.strftime("%Y-%m")}
+
+class XpRankIndex:
+    # Lista ordenada com o XP de cada usuário do quadro: posição de qualquer XP por
+    # busca binária, memória proporcional ao número de usuários (não ao maior XP).
+    # Empates dividem a posição (1, 2, 2, 4).
+    def __init__(self, histogram):
+        self.values = sorted(xp or 0 for xp, count in histogram for _ in range(count))
+
+    def add(self, xp, delta=1):
+        if delta > 0:
+            for _ in range(delta):
+                bisect.insort(self.values, xp)
+            return
+        for _ in range(-delta):
+            i = bisect.bisect_left(self.values, xp)
+            if i < len(self.values) and self.values[i] == xp:
+                del self.values[i]
+
+    def rank(self, xp):
+        return len(self.values) - bisect.bisect_right(self.values, xp) + 1
+
+# Um índice por quadro ("all", "week:2026-W42"...), refeito do banco a cada TTL
+# (outras instâncias também dão XP) e atualizado localmente a cada commit. Cada
+# índice guarda o instante da leitura (snapshot_at) e cada lote de deltas o instante
+# de antes do commit: delta mais antigo que o índice já está na leitura e é ignorado.
+leaderboard_indexes = {}
+leaderboard_lock = threading.Lock()
+
+def leaderboard_columns(period: str):
+    return (User.xp, User.id) if period == "all" else (XpBucket.xp, XpBucket.user_id)
+
+def leaderboard_rows(db: Session, period: str, bucket: str):
+    # Linhas (xp no quadro, User)
+    if period == "all":
+        return db.query(User.xp, User)
+    return db.query(XpBucket.xp, User).join(User, User.id == XpBucket.user_id)\
+        .filter(XpBucket.period == period, XpBucket.bucket == bucket)
+
+def get_rank_index(db: Session, period: str, bucket: str) -> XpRankIndex:
+    key = f"{period}:{bucket}"
+    now = time.time()
+    with leaderboard_lock:
+        entry = leaderboard_indexes.get(key)
+        if entry and now - entry["built_at"] < LEADERBOARD_TTL:
+            return entry["index"]
+    snapshot_at = time.monotonic()
+    xp_col, _ = leaderboard_columns(period)
+    query = db.query(xp_col, func.count())
+    if period != "all":
+        query = query.filter(XpBucket.period == period, XpBucket.bucket == bucket)
+    histogram = query.group_by(xp_col).all()
+    index = XpRankIndex(histogram)
+    with leaderboard_lock:
+        leaderboard_indexes[key] = {"index": index, "built_at": now, "snapshot_at": snapshot_at}
+        # Quadros de semanas/meses passados saem da memória sozinhos
+        for stale in [k for k, v in leaderboard_indexes.items() if now - v["built_at"] >= LEADERBOARD_TTL]:
+            del leaderboard_indexes[stale]
+    return index
+
+def apply_leaderboard_delta(committed_at: float, key: str, old_xp, new_xp):
+    with leaderboard_lock:
+        entry = leaderboard_indexes.get(key)
+        if not entry or committed_at <= entry["snapshot_at"]:
+            return
+        if old_xp is not None:
+            entry["index"].add(old_xp, -1)
+        entry["index"].add(new_xp, 1)
+
+# Os eventos também disparam ao fechar savepoints (begin_nested); só vale a transação de fora
+@event.listens_for(Session, "before_commit")
+def stamp_leaderboard_deltas(session):
+    if session.info.get("xp_deltas") and not session.in_nested_transaction():
+        session.info["xp_deltas_at"] = time.monotonic()
+
+@event.listens_for(Session, "after_commit")
+def flush_leaderboard_deltas(session):
+    if session.in_nested_transaction():
+        return
+    committed_at = session.info.pop("xp_deltas_at", None)
+    for delta in session.info.pop("xp_deltas", []):
+        apply_leaderboard_delta(committed_at, *delta)
+
+@event.listens_for(Session, "after_rollback")
+def discard_leaderboard_deltas(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop("xp_deltas", None)
+    session.info.pop("xp_deltas_at", None)
+
+def bump_xp_bucket(db: Session, user_id: int, period: str, bucket: str, amount: int):
+    # Incremento atômico; a primeira pontuação da janela cria a linha (savepoint
+    # contra inserção concorrente). Devolve (xp anterior ou None, xp novo).
+    bucket_filter = (XpBucket.period == period, XpBucket.bucket == bucket, XpBucket.user_id == user_id)
+    bump = update(XpBucket).where(*bucket_filter).values(xp=XpBucket.xp + amount)\
+        .returning(XpBucket.xp).execution_options(synchronize_session=False)
+    new_xp = db.execute(bump).scalar()
+    if new_xp is None:
+        try:
+            with db.begin_nested():
+                db.execute(XpBucket.__table__.insert().values(period=period, bucket=bucket, user_id=user_id, xp=amount))
+            return None, amount
+        except IntegrityError:
+            new_xp = db.execute(bump).scalar()
+    return new_xp - amount, new_xp
+
+def award_xp(db: Session, user: User, amount: int, reason: str, source_id: int = None):
+    # Único ponto que dá XP: evento no livro-caixa + incremento atômico do saldo, com o
+    # nível calculado no próprio UPDATE (sem ler-modificar-escrever no Python, nada se
+    # perde com requisições concorrentes do mesmo usuário)
+    db.add(XpEvent(user_id=user.id, amount=amount, reason=reason, source_id=source_id))
+    balance = func.coalesce(User.xp, 0) + amount
+    new_xp, new_level = db.execute(
+        update(User).where(User.id == user.id)
+        .values(xp=balance, level=1 + balance // 500)
+        .returning(User.xp, User.level)
+        .execution_options(synchronize_session=False)
+    ).one()
+    # Reflete no objeto já carregado sem marcá-lo como alterado
+    set_committed_value(user, "xp", new_xp)
+    set_committed_value(user, "level", new_level)
+    bump_revision(db, f"profile:{user.id}")
+
+    deltas = db.info.setdefault("xp_deltas", [])
+    deltas.append(("all:all", new_xp - amount, new_xp))
+    for period, bucket in xp_bucket_keys().items():
+        old_bucket_xp, new_bucket_xp = bump_xp_bucket(db, user.id, period, bucket, amount)
+        deltas.append((f"{period}:{bucket}", old_bucket_xp, new_bucket_xp))
+
+def backfill_xp_ledger(db: Session):
+    # Ledger criado com usuários já pontuados: um evento de saldo inicial por usuário
+    opening = select(User.id, User.xp, literal("opening_balance"), literal(datetime.now().isoformat()))\
+        .where(User.xp > 0)
+    db.execute(XpEvent.__table__.insert().from_select(["user_id", "amount", "reason", "created_at"], opening))
+    db.commit()
+
+def leaderboard_entry(user: User, xp: int, rank: int):
+    return {
+        "id": user.id,
+        "username": user.username,
+        "nickname": user.nickname or user.username,
+        "avatar_url": user.avatar_url,
+        "level": user.level,
+        "xp": xp,
+        "rank": rank
+    }
+
+def resolve_leaderboard_period(period: str):
+    if period not in LEADERBOARD_PERIODS:
+        raise HTTPException(status_code=400, detail="Período inválido")
+    return "all" if period == "all" else xp_bucket_keys()[period]
+
+def leaderboard_top(db: Session, period: str, limit: int):
+    bucket = resolve_leaderboard_period(period)
+    xp_col, id_col = leaderboard_columns(period)
+    rows = leaderboard_rows(db, period, bucket).order_by(desc(xp_col), desc(id_col)).limit(limit).all()
+    index = get_rank_index(db, period, bucket)
+    return [leaderboard_entry(user, xp or 0, index.rank(xp or 0)) for xp, user in rows]
+
 @app.get("/api/users/top")
-def get_top_users(db: Session = Depends(get_db)):
-    users = db.query(User).order_by(desc(User.xp)).limit(10).all()
-    results = []
-    for u in users:
-        results.append({
-            "id": u.id, 
-            "username": u.username, 
-            "nickname": u.nickname or u.username,
-            "avatar_url": u.avatar_url, 
-            "level": u.level,
-            "xp": u.xp
-        })
-    return results
+def get_top_users(period: str = "all", limit: int = Query(10, ge=1, le=100), db: Session = Depends(get_db)):
+    return leaderboard_top(db, period, limit)
+
+@app.get("/api/leaderboard/{user_id}")
+def get_leaderboard_position(user_id: int, period: str = "all", around: int = Query(3, ge=0, le=25), db: Session = Depends(get_db)):
+    # Posição do usuário + quem está logo acima e logo abaixo (buscas no índice de XP)
+    bucket = resolve_leaderboard_period(period)
+    xp_col, id_col = leaderboard_columns(period)
+    query = leaderboard_rows(db, period, bucket)
+    index = get_rank_index(db, period, bucket)
+
+    me = query.filter(id_col == user_id).first()
+    if not me:
+        if not db.query(User.id).filter(User.id == user_id).first():
+            raise HTTPException(status_code=404, detail="Usuário não encontrado")
+        # Ainda sem XP neste período
+        return {"period": period, "bucket": bucket, "rank": None, "total": index.total, "me": None, "above": [], "below": []}
+
+    # Ordem do quadro é (xp, id) decrescente: os vizinhos são duas buscas no índice
+    xp = me[0] or 0
+    above = query.filter(tuple_(xp_col, id_col) > tuple_(xp, user_id))\
+        .order_by(xp_col, id_col).limit(around).all() if around else []
+    below = query.filter(tuple_(xp_col, id_col) < tuple_(xp, user_id))\
+        .order_by(desc(xp_col), desc(id_col)).limit(around).all() if around else []
+    return {
+        "period": period,
+        "bucket": bucket,
+        "rank": index.rank(xp),
+        "total": index.total,
+        "me": leaderboard_entry(me[1], xp, index.rank(xp)),
+        "above": [leaderboard_entry(u, v or 0, index.rank(v or 0)) for v, u in reversed(above)],
+        "below": [leaderboard_entry(u, v or 0, index.rank(v or 0)) for v, u in below]
+    }
 
 # Rota protegida: usuário só pode atualizar o próprio perfil
 @app.put("/api/profile/update")
-def update_profile(data: UserUpdate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    # Ignora data.user_id, usa current_user
-    user = current_user
+def update_profile(data: UserUpdate, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    # Ignora data.user_id, usa current_user (linha completa: os campos são alterados aqui)
+    user = current_user.row()
+    old_names = (user.username, user.nickname)
     
     if data.username is not None and data.username != user.username:
         existing = db.query(User).filter(User.username == data.username).first()
@@ -1049,36 +2593,30 @@ def update_profile(data: UserUpdate, current_user: User = Depends(get_current_us
     if data.xbox_url is not None: user.xbox_url = data.xbox_url
     if data.psn_url is not None: user.psn_url = data.psn_url
     if data.epic_url is not None: user.epic_url = data.epic_url
+    evaluate_achievements(db, user, "profile")
+    bump_revision(db, f"profile:{user.id}")
     db.commit()
+    invalidate_user_prefixes(*old_names, user.username, user.nickname)
+    invalidate_principal(user.id)
     return {"message": "Perfil atualizado!"}
 
 @app.get("/api/statistics/{user_id}")
 def get_statistics(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.query(User.id).filter(User.id == user_id).first()
     if not user: raise HTTPException(status_code=404, detail="Usuário não encontrado")
-    all_reviews = db.query(Review).filter(Review.owner_id == user_id).all()
-    games_by_genre = {}
-    for r in all_reviews:
-        g_name = r.genre or "Outros"
-        if g_name not in games_by_genre: games_by_genre[g_name] = []
-        games_by_genre[g_name].append({
-            "title": r.game_name,
-            "ratings": {"jogabilidade": r.jogabilidade, "graficos": r.graficos, "narrativa": r.narrativa, "audio": r.audio, "desempenho": r.desempenho},
-            "cover": r.game_image_url or "", "nota_geral": r.nota_geral
-        })
-    top_by_genre = {}
-    for genre, games in games_by_genre.items():
-        top_by_genre[genre] = sorted(games, key=lambda x: x['nota_geral'], reverse=True)[:3]
-    attributes = ["jogabilidade", "graficos", "narrativa", "audio", "desempenho"]
-    best_by_attribute = {}
-    for attr in attributes:
-        sorted_by_attr = sorted(all_reviews, key=lambda x: getattr(x, attr), reverse=True)[:3]
-        best_by_attribute[attr] = [{"title": r.game_name, "score": getattr(r, attr)} for r in sorted_by_attr if getattr(r, attr) > 0]
-    return { "top_by_genre": top_by_genre, "best_by_attribute": best_by_attribute }
+    return { "top_by_genre": top_reviews_by_genre(db, user_id), "best_by_attribute": top_reviews_by_attribute(db, user_id) }
 
 @app.get("/api/user_games/{user_id}")
-def get_user_games(user_id: int, db: Session = Depends(get_db)):
-    reviews = db.query(Review).filter(Review.owner_id == user_id).all()
+async def get_user_games(user_id: int, request: Request, response: Response, db = Depends(get_async_db)):
+    (revision,), last_modified = await read_revisions_async(db, f"user_games:{user_id}")
+    not_modified = conditional_get(request, response, ("user_games", user_id, revision), last_modified)
+    if not_modified:
+        return not_modified
+
+    reviews = (await db.execute(
+        select(Review.game_id, Review.game_name, Review.game_image_url, Review.nota_geral, Review.is_favorite)
+        .where(Review.owner_id == user_id).order_by(Review.id)
+    )).all()
     games = []
     seen_ids = set()
     for r in reviews:
@@ -1094,8 +2632,14 @@ def get_user_games(user_id: int, db: Session = Depends(get_db)):
     return games
     
 @app.get("/api/games/best-rated")
-def get_best_rated_games(db: Session = Depends(get_db)):
-    results = db.query(
+async def get_best_rated_games(request: Request, response: Response, db = Depends(get_async_db)):
+    # Agregado global: revisão única "best_rated", somada a cada review salva
+    (revision,), last_modified = await read_revisions_async(db, "best_rated")
+    not_modified = conditional_get(request, response, ("best_rated", revision), last_modified, s_maxage=60)
+    if not_modified:
+        return not_modified
+
+    results = (await db.execute(select(
         Review.game_id,
         Review.game_name,
         Review.game_image_url,
@@ -1109,7 +2653,7 @@ def get_best_rated_games(db: Session = Depends(get_db)):
     .order_by(
         desc("average_score"), 
         desc("review_count")
-    ).limit(12).all()
+    ).limit(12))).all()
 
     games = []
     for r in results:
@@ -1123,12 +2667,207 @@ def get_best_rated_games(db: Session = Depends(get_db)):
         })
     return games
 
-@app.get("/api/tierlist_public/{tierlist_id}")
-def get_single_tierlist(tierlist_id: int, user_id: int = -1, db: Session = Depends(get_db)):
-    tierlist = db.query(Tierlist).filter(Tierlist.id == tierlist_id).first()
-    if not tierlist:
+DEFAULT_TIERS = ["S", "A", "B", "C", "D"]
+TIER_SCORES = {"S": 5, "A": 4, "B": 3, "C": 2, "D": 1}
+
+def parse_tierlist_entries(data):
+    # {"S": [{"id", "title", "cover", "is_favorite"}, ...], ...}
+    # -> (tiers na ordem, [(tier, posição, game_id, título, capa, favorito)])
+    tiers, entries, seen = [], [], set()
+    for tier, games in (data or {}).items():
+        tier = str(tier)
+        tiers.append(tier)
+        position = 0
+        for game in games if isinstance(games, list) else []:
+            try:
+                game_id = int(game.get("id"))
+            except (AttributeError, TypeError, ValueError):
+                continue
+            if game_id in seen:
+                continue
+            seen.add(game_id)
+            entries.append((tier, position, game_id, game.get("title") or game.get("name"), game.get("cover") or None, bool(game.get("is_favorite"))))
+            position += 1
+    return tiers, entries
+
+def render_tierlist_data(db: Session, owner_id: int, tiers, items):
+    # Remonta o JSON do front a partir das linhas (tier, posição, game_id, capa, favorito):
+    # nome da dimensão de jogos, capa da entrada (ou da dimensão), nota da review do dono
+    game_ids = [item[2] for item in items]
+    games = resolve_games(db, game_ids)
+    scores = dict(db.query(Review.game_id, Review.nota_geral).filter(Review.owner_id == owner_id, Review.game_id.in_(game_ids)).all()) if game_ids else {}
+    data = {tier: [] for tier in tiers}
+    for tier, _, game_id, cover, is_favorite in sorted(items, key=lambda item: (item[0], item[1])):
+        game = games.get(game_id, {})
+        data.setdefault(tier, []).append({
+            "id": game_id,
+            "title": game.get("name"),
+            "cover": cover or game.get("cover", ""),
+            "nota_geral": scores.get(game_id),
+            "is_favorite": bool(is_favorite)
+        })
+    return data
+
+TIERLIST_SUMMARY_COVERS = 4
+
+def build_tierlist_summary(data) -> dict:
+    tier_counts = {tier: len(games) for tier, games in data.items() if isinstance(games, list)}
+    covers = [game.get("cover") for games in data.values() if isinstance(games, list)
+              for game in games if isinstance(game, dict) and game.get("cover")]
+    return {
+        "item_count": sum(tier_counts.values()),
+        "tiers": list(tier_counts),
+        "tier_counts": tier_counts,
+        "covers": covers[:TIERLIST_SUMMARY_COVERS]
+    }
+
+def store_tierlist_data(tierlist: Tierlist, data):
+    # Cache JSON completo + resumo das listagens + tiers na ordem, sempre juntos
+    tierlist.data = json.dumps(data)
+    tierlist.summary = json.dumps(build_tierlist_summary(data))
+    tierlist.tiers = json.dumps(list(data))
+
+def load_tierlist_tiers(tierlist: Tierlist):
+    # Tiers gravadas; tierlist antiga sem a coluna preenchida usa as chaves do cache JSON
+    if tierlist.tiers:
+        return json.loads(tierlist.tiers)
+    try:
+        data = json.loads(tierlist.data) if tierlist.data else {}
+    except ValueError:
+        data = {}
+    return [str(tier) for tier in data] or list(DEFAULT_TIERS)
+
+def tierlist_summary(summary_json) -> dict:
+    return json.loads(summary_json) if summary_json else build_tierlist_summary({})
+
+def rebuild_tierlist_summaries(db: Session, batch_size: int = 500):
+    last_id = 0
+    while True:
+        batch = db.query(Tierlist).filter(Tierlist.id > last_id).order_by(Tierlist.id).limit(batch_size).all()
+        if not batch:
+            break
+        for tierlist in batch:
+            # Backfill a partir do cache JSON já gravado
+            try:
+                data = json.loads(tierlist.data) if tierlist.data else {}
+            except ValueError:
+                data = {}
+            tierlist.summary = json.dumps(build_tierlist_summary(data))
+        last_id = batch[-1].id
+        db.commit()
+
+def rebuild_tierlist_tiers(db: Session, batch_size: int = 500):
+    # Backfill a partir do cache JSON já gravado
+    last_id = 0
+    while True:
+        batch = db.query(Tierlist).filter(Tierlist.id > last_id).order_by(Tierlist.id).limit(batch_size).all()
+        if not batch:
+            break
+        for tierlist in batch:
+            tierlist.tiers = json.dumps(load_tierlist_tiers(tierlist))
+        last_id = batch[-1].id
+        db.commit()
+
+def save_tierlist_items(db: Session, tierlist: Tierlist, data):
+    # Regrava as linhas da tierlist e regenera o cache JSON (mesma transação)
+    tiers, entries = parse_tierlist_entries(data)
+    known = resolve_games(db, [entry[2] for entry in entries])
+    for _, _, game_id, title, cover, _ in entries:
+        if game_id not in known:
+            upsert_game(db, game_id, title, cover)
+    db.query(TierlistItem).filter(TierlistItem.tierlist_id == tierlist.id).delete(synchronize_session=False)
+    db.add_all([TierlistItem(tierlist_id=tierlist.id, tier=tier, position=position, game_id=game_id, cover=cover, is_favorite=is_favorite)
+                for tier, position, game_id, _, cover, is_favorite in entries])
+    store_tierlist_data(tierlist, render_tierlist_data(db, tierlist.owner_id, tiers or DEFAULT_TIERS,
+                                                       [(tier, position, game_id, cover, is_favorite) for tier, position, game_id, _, cover, is_favorite in entries]))
+
+def rebuild_tierlist_items(db: Session, batch_size: int = 500):
+    # Backfill a partir dos blobs JSON existentes (o cache antigo fica como está)
+    db.query(TierlistItem).delete(synchronize_session=False)
+    last_id = 0
+    while True:
+        batch = db.query(Tierlist.id, Tierlist.data).filter(Tierlist.id > last_id).order_by(Tierlist.id).limit(batch_size).all()
+        if not batch:
+            break
+        for tierlist_id, raw in batch:
+            try:
+                data = json.loads(raw) if raw else {}
+            except ValueError:
+                data = {}
+            _, entries = parse_tierlist_entries(data)
+            db.add_all([TierlistItem(tierlist_id=tierlist_id, tier=tier, position=position, game_id=game_id, cover=cover, is_favorite=is_favorite)
+                        for tier, position, game_id, _, cover, is_favorite in entries])
+        last_id = batch[-1][0]
+        db.commit()
+
+TIERLIST_MAX_OPS = 500
+
+def apply_tierlist_ops(tiers: dict, ops):
+    # Aplica move/insert/remove sobre {tier: [game_id, ...]} em memória
+    location = {game_id: tier for tier, games in tiers.items() for game_id in games}
+    for op in ops:
+        if op.op == "remove":
+            if op.game_id not in location:
+                raise HTTPException(status_code=400, detail=f"Jogo {op.game_id} não está na tierlist")
+            tiers[location.pop(op.game_id)].remove(op.game_id)
+            continue
+        if op.op not in ("move", "insert") or not op.tier:
+            raise HTTPException(status_code=400, detail="Operação inválida")
+        if op.op == "move" and op.game_id not in location:
+            raise HTTPException(status_code=400, detail=f"Jogo {op.game_id} não está na tierlist")
+        if op.op == "insert" and op.game_id in location:
+            raise HTTPException(status_code=400, detail=f"Jogo {op.game_id} já está na tierlist")
+        if op.game_id in location:
+            tiers[location[op.game_id]].remove(op.game_id)
+        if op.tier not in tiers:
+            raise HTTPException(status_code=422, detail=f"Tier {op.tier} não existe nesta tierlist")
+        target = tiers[op.tier]
+        position = len(target) if op.position is None else max(0, min(op.position, len(target)))
+        target.insert(position, op.game_id)
+        location[op.game_id] = op.tier
+    return tiers
+
+TIERLIST_PUBLIC_COMMENTS = 20  # comentários embutidos em /api/tierlist_public/{id}
+
+def tierlist_comments_page(db: Session, tierlist_id: int, cursor: Optional[str], limit: int):
+    # Mais recentes primeiro, paginado por id
+    query = db.query(TierlistComment, User).outerjoin(User, User.id == TierlistComment.user_id).filter(TierlistComment.tierlist_id == tierlist_id)
+    rows = keyset_query(query, [TierlistComment.id], cursor, limit).all()
+    total = count_total(db.query(TierlistComment.id).filter(TierlistComment.tierlist_id == tierlist_id), cursor)
+
+    def serialize(row):
+        c, c_author = row
+        return {
+            "id": c.id,
+            "content": c.content,
+            "created_at": c.created_at,
+            "author": {
+                "id": c_author.id,
+                "nickname": c_author.nickname or c_author.username,
+                "avatar_url": c_author.avatar_url
+            } if c_author else {"nickname": "Desconhecido", "avatar_url": ""}
+        }
+    return keyset_page(rows, limit, lambda row: (row[0].id,), serialize, total)
+
+@app.get("/api/tierlist_public/{tierlist_id}", response_model=TierlistPublicOut, response_model_exclude_unset=True)
+def get_single_tierlist(tierlist_id: int, request: Request, response: Response, viewer_id: Optional[int] = Depends(get_viewer_id), db: Session = Depends(get_db)):
+    owner_id = db.query(Tierlist.owner_id).filter(Tierlist.id == tierlist_id).first()
+    if not owner_id:
         raise HTTPException(status_code=404, detail="Tierlist não encontrada")
-    
+
+    # Revisão da tierlist (edições, likes, comentários) + dos perfis do dono e de quem
+    # comentou na primeira página (nome/avatar embutidos na resposta); com visitante
+    # identificado a resposta traz user_has_liked, então é privada
+    commenters = db.query(TierlistComment.user_id).filter(TierlistComment.tierlist_id == tierlist_id)\
+        .order_by(desc(TierlistComment.id)).limit(TIERLIST_PUBLIC_COMMENTS).all()
+    profiles = dict.fromkeys([owner_id[0], *sorted({uid for (uid,) in commenters if uid is not None})])
+    revisions, last_modified = read_revisions(db, f"tierlist:{tierlist_id}", *[f"profile:{uid}" for uid in profiles])
+    not_modified = conditional_get(request, response, ("tierlist", tierlist_id, viewer_id, *revisions), last_modified,
+                                   private=viewer_id is not None)
+    if not_modified:
+        return not_modified
+
+    tierlist = db.query(Tierlist).filter(Tierlist.id == tierlist_id).first()
     try:
         loaded_data = json.loads(tierlist.data) if tierlist.data else {}
     except: loaded_data = {}
@@ -1144,49 +2883,83 @@ def get_single_tierlist(tierlist_id: int, user_id: int = -1, db: Session = Depen
     # Contagem de Likes
     likes_count = db.query(TierlistLike).filter(TierlistLike.tierlist_id == tierlist_id).count()
     
-    # Verifica se o usuário (se passado na query) deu like
-    user_has_liked = False
-    if user_id != -1:
-        if db.query(TierlistLike).filter(TierlistLike.tierlist_id == tierlist_id, TierlistLike.user_id == user_id).first():
-            user_has_liked = True
-
-    # Busca Comentários
-    comments_query = db.query(TierlistComment).filter(TierlistComment.tierlist_id == tierlist_id).order_by(desc(TierlistComment.created_at)).all()
-    comments_list = []
-    for c in comments_query:
-        c_author = db.query(User).filter(User.id == c.user_id).first()
-        comments_list.append({
-            "id": c.id,
-            "content": c.content,
-            "created_at": c.created_at,
-            "author": {
-                "id": c_author.id,
-                "nickname": c_author.nickname or c_author.username,
-                "avatar_url": c_author.avatar_url
-            } if c_author else {"nickname": "Desconhecido", "avatar_url": ""}
-        })
+    # Verifica se o visitante (token ou ?user_id=) deu like
+    user_has_liked = tierlist_id in viewer_liked_tierlist_ids(db, viewer_id, [tierlist_id])
+
+    # Primeira página de comentários; o resto vem de /api/tierlist_public/{id}/comments
+    comments_page = tierlist_comments_page(db, tierlist_id, None, TIERLIST_PUBLIC_COMMENTS)
 
     return { 
         "id": tierlist.id, 
         "name": tierlist.name, 
         "data": loaded_data, 
+        "version": tierlist.version or 0,
         "owner_id": tierlist.owner_id,
         "owner": owner_data,
         "likes_count": likes_count,
         "user_has_liked": user_has_liked,
-        "comments": comments_list
+        "comments": comments_page["items"],
+        "comments_next_cursor": comments_page["next_cursor"],
+        "comments_total": comments_page["total"]
+    }
+
+@app.get("/api/tierlist_public/{tierlist_id}/comments", response_model=CommentPage, response_model_exclude_unset=True)
+def get_tierlist_comments(tierlist_id: int, cursor: Optional[str] = None, limit: int = Query(20, ge=1, le=100), db: Session = Depends(get_db)):
+    return tierlist_comments_page(db, tierlist_id, cursor, limit)
+
+@app.get("/api/game/{game_id}/tierlists")
+def get_game_tierlists(game_id: int, cursor: Optional[str] = None, limit: int = Query(20, ge=1, le=100), db: Session = Depends(get_db)):
+    # Tierlists que contêm o jogo (índice reverso), mais recentes primeiro
+    query = db.query(TierlistItem.tierlist_id, TierlistItem.tier, Tierlist.name, User)\
+        .join(Tierlist, Tierlist.id == TierlistItem.tierlist_id)\
+        .outerjoin(User, User.id == Tierlist.owner_id)\
+        .filter(TierlistItem.game_id == game_id)
+    rows = keyset_query(query, [TierlistItem.tierlist_id], cursor, limit).all()
+
+    def serialize(row):
+        tierlist_id, tier, name, author = row
+        return {
+            "id": tierlist_id,
+            "name": name,
+            "tier": tier,
+            "author": {
+                "id": author.id,
+                "username": author.username,
+                "nickname": author.nickname or author.username,
+                "avatar_url": author.avatar_url
+            } if author else None
+        }
+    return keyset_page(rows, limit, lambda row: (row[0],), serialize)
+
+@app.get("/api/game/{game_id}/tier_consensus")
+def get_game_tier_consensus(game_id: int, db: Session = Depends(get_db)):
+    # Em que tier a comunidade coloca o jogo: contagem por tier + média (S=5 ... D=1)
+    counts = dict(db.query(TierlistItem.tier, func.count()).filter(TierlistItem.game_id == game_id).group_by(TierlistItem.tier).all())
+    total = sum(counts.values())
+    scored = [(TIER_SCORES[tier], count) for tier, count in counts.items() if tier in TIER_SCORES]
+    scored_total = sum(count for _, count in scored)
+    average = sum(score * count for score, count in scored) / scored_total if scored_total else None
+    return {
+        "game_id": game_id,
+        "tierlists": total,
+        "tiers": counts,
+        "most_common": max(counts.items(), key=lambda x: (x[1], TIER_SCORES.get(x[0], 0)))[0] if counts else None,
+        "average_score": round(average, 2) if average is not None else None,
+        "consensus": min(TIER_SCORES, key=lambda tier: abs(TIER_SCORES[tier] - average)) if average is not None else None
     }
 
 # Rota protegida: owner_id é preenchido pelo token
 @app.post("/api/tierlist")
-def create_tierlist(tierlist_input: TierlistInput, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def create_tierlist(tierlist_input: TierlistInput, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     try:
         new_tierlist = Tierlist(
             name=tierlist_input.name, 
-            data=json.dumps(tierlist_input.data), 
             owner_id=current_user.id # Pega do token seguro
         )
         db.add(new_tierlist)
+        db.flush()
+        save_tierlist_items(db, new_tierlist, tierlist_input.data)
+        bump_revision(db, f"tierlist:{new_tierlist.id}", f"tierlists:{current_user.id}")
         db.commit()
         return {"message": "Tierlist salva com sucesso!"}
     except Exception as e:
@@ -1195,7 +2968,7 @@ def create_tierlist(tierlist_input: TierlistInput, current_user: User = Depends(
 
 # Rota protegida: user_id do comentário vem do token
 @app.post("/api/tierlist/comment")
-def post_tierlist_comment(comment_data: TierlistCommentInput, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def post_tierlist_comment(comment_data: TierlistCommentInput, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     try:
         new_comment = TierlistComment(
             tierlist_id=comment_data.tierlist_id,
@@ -1203,11 +2976,13 @@ def post_tierlist_comment(comment_data: TierlistCommentInput, current_user: User
             content=comment_data.content
         )
         db.add(new_comment)
-        db.commit()
+        db.flush()
         
-        # Opcional: Dar XP para quem comentou
-        user = current_user
-        user.xp += 15
+        # Opcional: Dar XP para quem comentou (mesma transação do comentário)
+        user = current_user.row()
+        award_xp(db, user, 15, "tierlist_comment", new_comment.id)
+        evaluate_achievements(db, user, "xp")
+        bump_revision(db, f"tierlist:{comment_data.tierlist_id}")
         db.commit()
 
         return {"message": "Comentário enviado com sucesso!"}
@@ -1216,19 +2991,23 @@ def post_tierlist_comment(comment_data: TierlistCommentInput, current_user: User
         return {"error": str(e)}
     
 @app.get("/api/tierlists/{user_id}")
-def get_tierlists(user_id: int, db: Session = Depends(get_db)):
-    tierlists = db.query(Tierlist).filter(Tierlist.owner_id == user_id).all()
-    result = []
-    for t in tierlists:
-        try:
-            loaded_data = json.loads(t.data) if t.data else {}
-            result.append({ "id": t.id, "name": t.name, "data": loaded_data })
-        except: pass
-    return result
+async def get_tierlists(user_id: int, request: Request, response: Response, cursor: Optional[str] = None, limit: int = Query(20, ge=1, le=100), db = Depends(get_async_db)):
+    (revision,), last_modified = await read_revisions_async(db, f"tierlists:{user_id}")
+    not_modified = conditional_get(request, response, ("tierlists", user_id, revision, cursor, limit), last_modified)
+    if not_modified:
+        return not_modified
+
+    query = select(Tierlist.id, Tierlist.name, Tierlist.summary, Tierlist.version).where(Tierlist.owner_id == user_id)
+    rows = (await db.execute(keyset_query(query, [Tierlist.id], cursor, limit, descending=False))).all()
+    total = await count_total_async(db, select(Tierlist.id).where(Tierlist.owner_id == user_id), cursor)
+
+    def serialize(t):
+        return { "id": t.id, "name": t.name, "summary": tierlist_summary(t.summary), "version": t.version or 0 }
+    return keyset_page(rows, limit, lambda t: (t.id,), serialize, total)
 
 # Rota protegida: verifica se a tierlist pertence ao usuário do token
 @app.delete("/api/tierlist/{tierlist_id}")
-def delete_tierlist(tierlist_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def delete_tierlist(tierlist_id: int, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     tierlist = db.query(Tierlist).filter(Tierlist.id == tierlist_id).first()
     if not tierlist:
         raise HTTPException(status_code=404, detail="Tierlist não encontrada")
@@ -1237,7 +3016,9 @@ def delete_tierlist(tierlist_id: int, current_user: User = Depends(get_current_u
         raise HTTPException(status_code=403, detail="Sem permissão para deletar")
 
     try:
+        db.query(TierlistItem).filter(TierlistItem.tierlist_id == tierlist.id).delete(synchronize_session=False)
         db.delete(tierlist)
+        bump_revision(db, f"tierlist:{tierlist.id}", f"tierlists:{tierlist.owner_id}")
         db.commit()
         return {"message": "Tierlist deletada com sucesso!"}
     except Exception as e:
@@ -1246,7 +3027,7 @@ def delete_tierlist(tierlist_id: int, current_user: User = Depends(get_current_u
 
 # Rota protegida: verifica se a tierlist pertence ao usuário do token
 @app.put("/api/tierlist/{tierlist_id}")
-def update_tierlist(tierlist_id: int, tierlist_input: TierlistUpdate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def update_tierlist(tierlist_id: int, tierlist_input: TierlistUpdate, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     tierlist = db.query(Tierlist).filter(Tierlist.id == tierlist_id).first()
     if not tierlist:
         raise HTTPException(status_code=404, detail="Tierlist não encontrada")
@@ -1256,21 +3037,96 @@ def update_tierlist(tierlist_id: int, tierlist_input: TierlistUpdate, current_us
 
     try:
         tierlist.name = tierlist_input.name
-        tierlist.data = json.dumps(tierlist_input.data)
+        tierlist.version = Tierlist.version + 1
+        save_tierlist_items(db, tierlist, tierlist_input.data)
+        bump_revision(db, f"tierlist:{tierlist.id}", f"tierlists:{tierlist.owner_id}")
         db.commit()
         return {"message": "Tierlist atualizada com sucesso!"}
     except Exception as e:
         db.rollback()
         return {"error": str(e)}
         
+# Rota protegida: edição incremental (arrastar um jogo manda só a operação, não o documento)
+@app.patch("/api/tierlist/{tierlist_id}")
+def patch_tierlist(tierlist_id: int, patch: TierlistPatch, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    tierlist = db.query(Tierlist).filter(Tierlist.id == tierlist_id).first()
+    if not tierlist:
+        raise HTTPException(status_code=404, detail="Tierlist não encontrada")
+    if tierlist.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Sem permissão para editar")
+    if len(patch.ops) > TIERLIST_MAX_OPS:
+        raise HTTPException(status_code=400, detail="Operações demais; envie a tierlist inteira")
+
+    # Reserva a versão num UPDATE condicional: edição concorrente perde aqui, sem
+    # ler nem aplicar nada
+    values = {"version": Tierlist.version + 1}
+    if patch.name is not None:
+        values["name"] = patch.name
+    claimed = db.execute(update(Tierlist)
+        .where(Tierlist.id == tierlist_id, func.coalesce(Tierlist.version, 0) == patch.version)
+        .values(**values)
+        .execution_options(synchronize_session=False)).rowcount
+    if not claimed:
+        db.rollback()
+        current = db.query(Tierlist.version).filter(Tierlist.id == tierlist_id).scalar() or 0
+        raise HTTPException(status_code=409, detail="Tierlist alterada em outro lugar; recarregue", headers={"X-Tierlist-Version": str(current)})
+
+    try:
+        items = db.query(TierlistItem).filter(TierlistItem.tierlist_id == tierlist_id).order_by(TierlistItem.tier, TierlistItem.position).all()
+        before = {item.game_id: item for item in items}
+        tiers = {tier: [] for tier in load_tierlist_tiers(tierlist)}
+        for item in items:
+            tiers.setdefault(item.tier, []).append(item.game_id)
+        apply_tierlist_ops(tiers, patch.ops)
+
+        # Grava só o que mudou
+        known = resolve_games(db, [op.game_id for op in patch.ops if op.op == "insert"])
+        for op in patch.ops:
+            if op.op == "insert" and op.game_id not in known:
+                upsert_game(db, op.game_id, op.title, op.cover)
+        after = {}
+        for tier, games in tiers.items():
+            for position, game_id in enumerate(games):
+                after[game_id] = (tier, position)
+        removed = [game_id for game_id in before if game_id not in after]
+        if removed:
+            db.query(TierlistItem).filter(TierlistItem.tierlist_id == tierlist_id, TierlistItem.game_id.in_(removed))\
+                .delete(synchronize_session=False)
+        inserted = {op.game_id: op for op in patch.ops if op.op == "insert"}
+        for game_id, (tier, position) in after.items():
+            item = before.get(game_id)
+            if item is None:
+                op = inserted[game_id]
+                item = TierlistItem(tierlist_id=tierlist_id, game_id=game_id, tier=tier, position=position,
+                                    cover=op.cover or None, is_favorite=op.is_favorite)
+                db.add(item)
+                before[game_id] = item
+            elif (item.tier, item.position) != (tier, position):
+                item.tier, item.position = tier, position
+
+        store_tierlist_data(tierlist, render_tierlist_data(db, tierlist.owner_id, list(tiers),
+            [(tier, position, game_id, before[game_id].cover, before[game_id].is_favorite) for game_id, (tier, position) in after.items()]))
+        bump_revision(db, f"tierlist:{tierlist_id}", f"tierlists:{tierlist.owner_id}")
+        db.commit()
+        return {"message": "Tierlist atualizada com sucesso!", "version": patch.version + 1}
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        # Rollback devolve a versão reservada; o front mantém a que já tinha
+        db.rollback()
+        print(f"Erro ao aplicar PATCH na tierlist {tierlist_id}: {e}")
+        raise HTTPException(status_code=500, detail="Erro ao salvar a tierlist")
+
 # Rota protegida: Review criada no nome do usuário do token
 @app.post("/api/review")
-def post_review(review_input: ReviewInput, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def post_review(review_input: ReviewInput, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     try:
         notas = [review_input.jogabilidade, review_input.graficos, review_input.narrativa, review_input.audio, review_input.desempenho]
         nota_geral = sum(notas) / len(notas)
         # Usa current_user.id
         existing = db.query(Review).filter(Review.game_id == review_input.game_id, Review.owner_id == current_user.id).first()
+        upsert_game(db, review_input.game_id, review_input.game_name, review_input.game_image_url)
         if existing:
             existing.jogabilidade = review_input.jogabilidade
             existing.graficos = review_input.graficos
@@ -1280,7 +3136,14 @@ def post_review(review_input: ReviewInput, current_user: User = Depends(get_curr
             existing.nota_geral = nota_geral
             if review_input.genre: existing.genre = review_input.genre 
             if review_input.game_image_url: existing.game_image_url = review_input.game_image_url
+            db.flush()
+            refresh_similarity_for_review(db, current_user.id, review_input.game_id)
+            refresh_profile_reviews(db, current_user.id)
+            bump_revision(db, "best_rated")
+            evaluate_achievements(db, current_user.row(), "review")
             db.commit()
+            invalidate_recommendations(current_user.id)
+            invalidate_quiz_pool(current_user.id)
             return {"message": "Review atualizada!"}
         
         new_review = Review(
@@ -1298,25 +3161,33 @@ def post_review(review_input: ReviewInput, current_user: User = Depends(get_curr
             owner_id=current_user.id # Seguro
         )
         db.add(new_review)
+        db.flush()
+        refresh_similarity_for_review(db, current_user.id, review_input.game_id)
         
-        user = current_user
-        user.xp += 100
-        user.level = 1 + (user.xp // 500)
+        user = current_user.row()
+        award_xp(db, user, 100, "review", new_review.id)
+        refresh_profile_reviews(db, current_user.id)
+        bump_revision(db, "best_rated")
+        # Review nova mexe no resumo e no XP: avalia todas as regras
+        evaluate_achievements(db, user)
         db.commit()
+        invalidate_recommendations(current_user.id)
+        invalidate_quiz_pool(current_user.id)
         return {"message": "Review salva!"}
     except Exception as e:
         db.rollback()
         print(f"Erro ao salvar review: {e}") 
         return {"error": str(e)}
 
-@app.get("/api/review")
+@app.get("/api/review", response_model=Union[ReviewOut, Dict[str, str]])
 def get_review(game_id: int, owner_id: int, db: Session = Depends(get_db)):
     r = db.query(Review).filter(Review.game_id == game_id, Review.owner_id == owner_id).first()
-    return r if r else {"error": "Não encontrada"}
+    # Só as colunas da review; nunca o objeto ORM cru (estado interno / relações preguiçosas)
+    return ReviewOut.model_validate(r) if r else {"error": "Não encontrada"}
 
 # Rota protegida: Comentário atrelado ao usuário do token
 @app.post("/api/comments")
-def post_comment(comment: CommentInput, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def post_comment(comment: CommentInput, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     try:
         new_comment = Comment(
             game_id=comment.game_id,
@@ -1331,7 +3202,7 @@ def post_comment(comment: CommentInput, current_user: User = Depends(get_current
         return {"error": str(e)}
 
 @app.get("/api/game/{game_id}/discussion")
-def get_game_discussion(game_id: int, user_id: int = -1, db: Session = Depends(get_db)):
+def get_game_discussion(game_id: int, viewer_id: Optional[int] = Depends(get_viewer_id), db: Session = Depends(get_db)):
     total_count = db.query(Comment).filter(Comment.game_id == game_id).count()
     stmt = db.query(Comment, func.count(CommentLike.id).label('likes'))\
         .outerjoin(CommentLike)\
@@ -1342,10 +3213,7 @@ def get_game_discussion(game_id: int, user_id: int = -1, db: Session = Depends(g
     if not stmt:
         return {"total": 0, "top_comment": None}
     comment, likes_count = stmt
-    user_liked = False
-    if user_id != -1:
-        if db.query(CommentLike).filter(CommentLike.user_id == user_id, CommentLike.comment_id == comment.id).first():
-            user_liked = True
+    user_liked = comment.id in viewer_liked_comment_ids(db, viewer_id, [comment.id])
     author = db.query(User).filter(User.id == comment.user_id).first()
     return {
         "total": total_count,
@@ -1364,96 +3232,99 @@ def get_game_discussion(game_id: int, user_id: int = -1, db: Session = Depends(g
         }
     }
 
-@app.get("/api/game/{game_id}/comments/all")
-def get_all_game_comments(game_id: int, user_id: int = -1, db: Session = Depends(get_db)):
-    comments = db.query(Comment, func.count(CommentLike.id).label('likes'))\
-        .outerjoin(CommentLike)\
-        .filter(Comment.game_id == game_id)\
-        .group_by(Comment.id)\
-        .order_by(desc('likes'), desc(Comment.created_at))\
-        .all()
-    result = []
-    for c, likes in comments:
-        user_liked = False
-        if user_id != -1:
-            if db.query(CommentLike).filter(CommentLike.user_id == user_id, CommentLike.comment_id == c.id).first():
-                user_liked = True
-        author = db.query(User).filter(User.id == c.user_id).first()
-        result.append({
+@app.get("/api/game/{game_id}/comments/all", response_model=GameCommentPage, response_model_exclude_unset=True)
+async def get_all_game_comments(game_id: int, cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=100), viewer_id: Optional[int] = Depends(get_viewer_id), db = Depends(get_async_db)):
+    # Mais curtidos primeiro, seek por (likes_count, id) no índice ix_comments_game_likes
+    query = select(Comment, User).outerjoin(User, User.id == Comment.user_id).where(Comment.game_id == game_id)
+    rows = (await db.execute(keyset_query(query, [Comment.likes_count, Comment.id], cursor, limit))).all()
+    total = await count_total_async(db, select(Comment.id).where(Comment.game_id == game_id), cursor)
+
+    # Likes do visitante resolvidos em lote para a página inteira
+    liked_ids = await viewer_liked_comment_ids_async(db, viewer_id, [c.id for c, _ in rows[:limit]])
+
+    def serialize(row):
+        c, author = row
+        return {
             "id": c.id,
             "content": c.content,
             "created_at": c.created_at,
-            "likes": likes,
-            "user_liked": user_liked,
+            "likes": c.likes_count or 0,
+            "user_liked": c.id in liked_ids,
             "author": {
                 "id": author.id,
                 "username": author.username,
                 "nickname": author.nickname or author.username,
                 "avatar_url": author.avatar_url
-            }
-        })
-    return result
+            } if author else {"nickname": "Desconhecido", "avatar_url": ""}
+        }
+    return keyset_page(rows, limit, lambda row: (row[0].likes_count or 0, row[0].id), serialize, total)
+
+def refresh_comment_likes(db: Session, comment_id: int):
+    # Recontagem atômica no próprio UPDATE (subquery indexada por comment_id)
+    like_count = select(func.count(CommentLike.id)).where(CommentLike.comment_id == comment_id).scalar_subquery()
+    db.query(Comment).filter(Comment.id == comment_id).update({Comment.likes_count: like_count}, synchronize_session=False)
+
+def rebuild_comment_likes(db: Session):
+    # Backfill usado quando a coluna likes_count é criada num banco já existente
+    like_count = select(func.count(CommentLike.id)).where(CommentLike.comment_id == Comment.id).scalar_subquery()
+    db.query(Comment).update({Comment.likes_count: like_count}, synchronize_session=False)
+    db.commit()
 
 # Rota protegida: Like atrelado ao usuário do token
 @app.post("/api/comments/{comment_id}/like")
-def toggle_like(comment_id: int, like_data: LikeInput, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def toggle_like(comment_id: int, like_data: LikeInput, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     existing = db.query(CommentLike).filter(CommentLike.comment_id == comment_id, CommentLike.user_id == current_user.id).first()
     if existing:
         db.delete(existing)
-        db.commit()
-        return {"status": "unliked"}
+        status = "unliked"
     else:
         new_like = CommentLike(comment_id=comment_id, user_id=current_user.id)
         db.add(new_like)
-        db.commit()
-        return {"status": "liked"}
+        status = "liked"
+    db.flush()
+    refresh_comment_likes(db, comment_id)
+    db.commit()
+    return {"status": status}
 
 @app.get("/api/user/{user_id}/comments")
-def get_user_comments(user_id: int, db: Session = Depends(get_db)):
-    comments = db.query(Comment, func.count(CommentLike.id).label('likes'))\
-        .outerjoin(CommentLike)\
-        .filter(Comment.user_id == user_id)\
-        .group_by(Comment.id)\
-        .order_by(desc(Comment.created_at))\
-        .all()
-    results = []
-    for c, likes in comments:
-        review = db.query(Review).filter(Review.game_id == c.game_id).first()
-        game_name = review.game_name if review else f"Jogo #{c.game_id}"
-        results.append({
+def get_user_comments(user_id: int, cursor: Optional[str] = None, limit: int = Query(20, ge=1, le=100), db: Session = Depends(get_db)):
+    query = db.query(Comment).filter(Comment.user_id == user_id)
+    rows = keyset_query(query, [Comment.id], cursor, limit).all()
+    total = count_total(db.query(Comment.id).filter(Comment.user_id == user_id), cursor)
+    games = resolve_games(db, [c.game_id for c in rows[:limit]])
+
+    def serialize(c):
+        game = games.get(c.game_id)
+        return {
             "id": c.id,
             "content": c.content,
-            "likes": likes,
-            "game_name": game_name,
+            "likes": c.likes_count or 0,
+            "game_name": game["name"] if game else f"Jogo #{c.game_id}",
             "game_id": c.game_id,
             "created_at": c.created_at
-        })
-    return results
+        }
+    return keyset_page(rows, limit, lambda c: (c.id,), serialize, total)
 
 @app.get("/api/user/{user_id}/best_comment")
 def get_user_best_comment(user_id: int, db: Session = Depends(get_db)):
-    stmt = db.query(Comment, func.count(CommentLike.id).label('likes'))\
-        .outerjoin(CommentLike)\
+    stmt = db.query(Comment, Game.name)\
+        .outerjoin(Game, Game.id == Comment.game_id)\
         .filter(Comment.user_id == user_id)\
-        .group_by(Comment.id)\
-        .order_by(desc('likes'))\
+        .order_by(desc(Comment.likes_count), desc(Comment.id))\
         .first()
     if not stmt: return None
-    comment, likes = stmt
-    game_name = "Jogo Desconhecido"
-    review = db.query(Review).filter(Review.game_id == comment.game_id).first()
-    if review: game_name = review.game_name
+    comment, game_name = stmt
     return {
         "id": comment.id,
         "content": comment.content,
-        "likes": likes,
-        "game_name": game_name,
+        "likes": comment.likes_count or 0,
+        "game_name": game_name or "Jogo Desconhecido",
         "game_id": comment.game_id
     }
 
 # Rota protegida: Favoritos atrelados ao usuário do token
 @app.post("/api/profile/favorites")
-def set_favorites(input_data: FavoritesInput, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def set_favorites(input_data: FavoritesInput, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     try:
         db.query(Review).filter(Review.owner_id == current_user.id).update({"is_favorite": False})
         if input_data.game_ids:
@@ -1461,7 +3332,9 @@ def set_favorites(input_data: FavoritesInput, current_user: User = Depends(get_c
                 Review.owner_id == current_user.id, 
                 Review.game_id.in_(input_data.game_ids)
             ).update({"is_favorite": True}, synchronize_session=False)
+        refresh_profile_reviews(db, current_user.id)
         db.commit()
+        invalidate_quiz_pool(current_user.id)
         return {"message": "Favoritos atualizados!"}
     except Exception as e:
         db.rollback()
@@ -1471,7 +3344,7 @@ def set_favorites(input_data: FavoritesInput, current_user: User = Depends(get_c
 
 # Rota protegida: Seguir usando o ID do token
 @app.post("/api/user/follow")
-def toggle_follow(data: FollowInput, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def toggle_follow(data: FollowInput, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     if current_user.id == data.followed_id:
         return {"error": "Não pode seguir a si mesmo"}
     
@@ -1479,52 +3352,77 @@ def toggle_follow(data: FollowInput, current_user: User = Depends(get_current_us
     
     if existing:
         db.delete(existing)
-        db.commit()
-        return {"status": "unfollowed"}
+        status = "unfollowed"
     else:
         new_follow = Follower(follower_id=current_user.id, followed_id=data.followed_id)
         db.add(new_follow)
-        db.commit()
-        return {"status": "followed"}
+        status = "followed"
 
-@app.get("/api/user/{user_id}/social_list")
-def get_social_list(user_id: int, db: Session = Depends(get_db)):
-    # 1. Seguidores
-    followers = db.query(User).join(Follower, Follower.follower_id == User.id).filter(Follower.followed_id == user_id).all()
-    
-    # 2. Seguindo
-    following = db.query(User).join(Follower, Follower.followed_id == User.id).filter(Follower.follower_id == user_id).all()
-    
-    # 3. Amigos (Tabela FriendRequest com status accepted)
-    # Amigos onde eu sou o sender
-    friends_sent = db.query(User).join(FriendRequest, FriendRequest.receiver_id == User.id).filter(
-        FriendRequest.sender_id == user_id, 
-        FriendRequest.status == "accepted"
-    ).all()
-    
-    # Amigos onde eu sou o receiver
-    friends_received = db.query(User).join(FriendRequest, FriendRequest.sender_id == User.id).filter(
-        FriendRequest.receiver_id == user_id, 
-        FriendRequest.status == "accepted"
-    ).all()
-    
-    friends_list = friends_sent + friends_received
-    
-    def format_user(u):
-        return {
-            "id": u.id,
-            "username": u.username,
-            "nickname": u.nickname or u.username,
-            "avatar_url": u.avatar_url,
-            "level": u.level
-        }
+    # Contadores dos dois perfis atualizados na mesma transação
+    db.flush()
+    refresh_profile_follows(db, current_user.id)
+    refresh_profile_follows(db, data.followed_id)
+    db.commit()
+    return {"status": status}
+
+SOCIAL_LIST_KINDS = ("friends", "followers", "following")
 
+def format_social_user(u):
     return {
-        "friends": [format_user(u) for u in friends_list],
-        "followers": [format_user(u) for u in followers],
-        "following": [format_user(u) for u in following]
+        "id": u.id,
+        "username": u.username,
+        "nickname": u.nickname or u.username,
+        "avatar_url": u.avatar_url,
+        "level": u.level
     }
 
+def social_list_page(db: Session, user_id: int, kind: str, cursor: Optional[str], limit: int):
+    # Todas as listas são ordenadas por id do usuário listado
+    if kind == "followers":
+        query = db.query(User).join(Follower, Follower.follower_id == User.id).filter(Follower.followed_id == user_id)
+        rows = keyset_query(query, [User.id], cursor, limit, descending=False).all()
+        total = count_total(db.query(Follower.follower_id).filter(Follower.followed_id == user_id), cursor)
+    elif kind == "following":
+        query = db.query(User).join(Follower, Follower.followed_id == User.id).filter(Follower.follower_id == user_id)
+        rows = keyset_query(query, [User.id], cursor, limit, descending=False).all()
+        total = count_total(db.query(Follower.followed_id).filter(Follower.follower_id == user_id), cursor)
+    else:
+        # Amigos (FriendRequest aceito) nas duas direções: cada lado busca a
+        # página a partir do mesmo cursor e o merge fica com as limit + 1 primeiras
+        friends_sent = db.query(User).join(FriendRequest, FriendRequest.receiver_id == User.id).filter(
+            FriendRequest.sender_id == user_id, 
+            FriendRequest.status == "accepted"
+        )
+        friends_received = db.query(User).join(FriendRequest, FriendRequest.sender_id == User.id).filter(
+            FriendRequest.receiver_id == user_id, 
+            FriendRequest.status == "accepted"
+        )
+        merged = {}
+        for query in (friends_sent, friends_received):
+            for u in keyset_query(query, [User.id], cursor, limit, descending=False).all():
+                merged[u.id] = u
+        rows = [merged[k] for k in sorted(merged)][:limit + 1]
+        total = count_total(db.query(FriendRequest.id).filter(
+            or_(FriendRequest.sender_id == user_id, FriendRequest.receiver_id == user_id),
+            FriendRequest.status == "accepted"
+        ), cursor)
+    return keyset_page(rows, limit, lambda u: (u.id,), format_social_user, total)
+
+@app.get("/api/user/{user_id}/social_list")
+def get_social_list(user_id: int, kind: Optional[str] = None, cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=100), token: Optional[str] = Depends(optional_oauth2_scheme), db: Session = Depends(get_db)):
+    # Com ?kind= devolve só a próxima página daquela lista
+    if kind is not None:
+        if kind not in SOCIAL_LIST_KINDS:
+            raise HTTPException(status_code=400, detail="Lista inválida")
+        return social_list_page(db, user_id, kind, cursor, limit)
+
+    result = {k: social_list_page(db, user_id, k, None, limit) for k in SOCIAL_LIST_KINDS}
+
+    # Se o visitante segue este perfil (não depende de ele estar na primeira página)
+    viewer_id = viewer_id_from_token(token)
+    result["viewer_follows"] = viewer_id is not None and db.query(Follower).filter(Follower.follower_id == viewer_id, Follower.followed_id == user_id).first() is not None
+    return result
+
 # --- ROTAS DE AMIZADE (ADD / REMOVE / ACCEPT) ---
 
 @app.get("/api/friend/status")
@@ -1550,7 +3448,7 @@ def get_friendship_status(sender_id: int, target_id: int, db: Session = Depends(
 
 # Rota protegida: Remetente é o usuário do token
 @app.post("/api/friend/request")
-def send_friend_request(data: FriendInput, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def send_friend_request(data: FriendInput, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     if current_user.id == data.target_id: return {"error": "Mesmo usuário"}
     
     existing = db.query(FriendRequest).filter(
@@ -1571,29 +3469,29 @@ def send_friend_request(data: FriendInput, current_user: User = Depends(get_curr
 
 # --- ADICIONE ESTA ROTA QUE ESTAVA FALTANDO ---
 @app.get("/api/user/{user_id}/pending_requests")
-def get_pending_requests(user_id: int, db: Session = Depends(get_db)):
+def get_pending_requests(user_id: int, cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=100), db: Session = Depends(get_db)):
     # Busca solicitações onde EU sou o recebedor (receiver_id) e status é 'pending'
-    requests = db.query(FriendRequest).filter(
+    query = db.query(FriendRequest, User).join(User, User.id == FriendRequest.sender_id).filter(
         FriendRequest.receiver_id == user_id,
         FriendRequest.status == "pending"
-    ).all()
-    
-    results = []
-    for req in requests:
-        sender = db.query(User).filter(User.id == req.sender_id).first()
-        if sender:
-            results.append({
-                "request_id": req.id,
-                "sender_id": sender.id,
-                "username": sender.username,
-                "nickname": sender.nickname or sender.username,
-                "avatar_url": sender.avatar_url
-            })
-    return results
+    )
+    rows = keyset_query(query, [FriendRequest.id], cursor, limit, descending=False).all()
+    total = count_total(db.query(FriendRequest.id).filter(FriendRequest.receiver_id == user_id, FriendRequest.status == "pending"), cursor)
+
+    def serialize(row):
+        req, sender = row
+        return {
+            "request_id": req.id,
+            "sender_id": sender.id,
+            "username": sender.username,
+            "nickname": sender.nickname or sender.username,
+            "avatar_url": sender.avatar_url
+        }
+    return keyset_page(rows, limit, lambda row: (row[0].id,), serialize, total)
 
 # Rota protegida: Aceitar requisição segura
 @app.post("/api/friend/accept")
-def accept_friend_request(data: FriendInput, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def accept_friend_request(data: FriendInput, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     # Procura o pedido onde o remetente é quem enviou (sender_id da request) e o destinatário SOU EU (current_user)
     # A variável data.sender_id vem do JSON (quem enviou o pedido)
     req = db.query(FriendRequest).filter(
@@ -1610,7 +3508,7 @@ def accept_friend_request(data: FriendInput, current_user: User = Depends(get_cu
 
 # Rota protegida: Remover amigo seguro
 @app.delete("/api/friend/remove")
-def remove_friend(sender_id: int, target_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def remove_friend(sender_id: int, target_id: int, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     # Garante que quem está deletando faz parte da relação (ou é o sender ou é o receiver)
     if current_user.id != sender_id and current_user.id != target_id:
         raise HTTPException(status_code=403, detail="Não autorizado")
@@ -1630,160 +3528,518 @@ def remove_friend(sender_id: int, target_id: int, current_user: User = Depends(g
     
     raise HTTPException(status_code=404, detail="Solicitação não encontrada")
 
+# --- ÍNDICE DE COMPATIBILIDADE ENTRE USUÁRIOS ---
+
+SIMILARITY_NEIGHBORS = 20         # K usuários mais compatíveis guardados por usuário
+SIMILARITY_BATCH_SIZE = 200       # usuários por lote na reconstrução
+SIMILARITY_MAX_CO_REVIEWERS = 50  # co-avaliadores recalculados junto com cada review
+
+def refresh_user_similarity(db: Session, user_ids):
+    # Recalcula os K vizinhos de cada usuário do lote. Os pares (usuário, quem avaliou
+    # o mesmo jogo) são agregados no próprio banco e o ROW_NUMBER corta cada usuário
+    # em K: só voltam K linhas por usuário, nunca a matriz de co-avaliadores.
+    mine, theirs = aliased(Review), aliased(Review)
+    diff = func.abs(mine.nota_geral - theirs.nota_geral)
+    pairs = db.query(
+        mine.owner_id.label("user_id"),
+        theirs.owner_id.label("other_id"),
+        # Diferença de nota (0 a 10) vira % de similaridade (0 diff = 100%, 10 diff = 0%)
+        func.sum(case((diff < 10, 100 - diff * 10), else_=0.0)).label("similarity_sum"),
+        func.count().label("shared_count")
+    ).join(theirs, and_(theirs.game_id == mine.game_id, theirs.owner_id != mine.owner_id))\
+        .filter(mine.owner_id.in_(user_ids), mine.nota_geral.isnot(None), theirs.nota_geral.isnot(None), theirs.owner_id.isnot(None))\
+        .group_by(mine.owner_id, theirs.owner_id).subquery()
+    compatibility = pairs.c.similarity_sum * 1.0 / pairs.c.shared_count
+    ranked = db.query(
+        pairs, compatibility.label("compatibility"),
+        func.row_number().over(partition_by=pairs.c.user_id, order_by=(desc(compatibility), desc(pairs.c.shared_count), pairs.c.other_id)).label("rn")
+    ).subquery()
+    rows = db.query(ranked.c.user_id, ranked.c.other_id, ranked.c.similarity_sum, ranked.c.shared_count, ranked.c.compatibility)\
+        .filter(ranked.c.rn <= SIMILARITY_NEIGHBORS).all()
+
+    db.query(UserSimilarity).filter(UserSimilarity.user_id.in_(user_ids)).delete(synchronize_session=False)
+    db.bulk_insert_mappings(UserSimilarity, [{
+        "user_id": user_id,
+        "other_id": other_id,
+        "similarity_sum": float(total),
+        "shared_count": int(count),
+        "compatibility": float(compat)
+    } for user_id, other_id, total, count, compat in rows])
+    return len(rows)
+
+def refresh_similarity_for_review(db: Session, user_id: int, game_id: int):
+    # Na transação da review: recalcula o autor e os co-avaliadores mais recentes do
+    # jogo (limitados); os demais pares mudam pouco e o job reconstrói no ciclo dele
+    co_reviewers = [uid for (uid,) in db.query(Review.owner_id)
+        .filter(Review.game_id == game_id, Review.owner_id != user_id, Review.owner_id.isnot(None), Review.nota_geral.isnot(None))
+        .order_by(desc(Review.id)).limit(SIMILARITY_MAX_CO_REVIEWERS).all()]
+    try:
+        with db.begin_nested():
+            refresh_user_similarity(db, [user_id, *co_reviewers])
+    except IntegrityError:
+        # Corrida com outra review do mesmo jogo; a próxima review ou o job corrige
+        print(f"Compatibilidade não atualizada para o usuário {user_id} (jogo {game_id})")
+
+def rebuild_user_similarity_batch(db: Session, last_id: int, batch_size: int = SIMILARITY_BATCH_SIZE):
+    # Um lote de usuários depois de last_id; devolve (último id, pares) ou (None, 0) no fim
+    user_ids = [uid for (uid,) in db.query(User.id).filter(User.id > last_id).order_by(User.id).limit(batch_size).all()]
+    if not user_ids:
+        return None, 0
+    return user_ids[-1], refresh_user_similarity(db, user_ids)
+
+def rebuild_user_similarity(db: Session):
+    # Reconstrução completa (python api/index.py rebuild-similarity)
+    last_id, total = 0, 0
+    while True:
+        last_id, pairs = rebuild_user_similarity_batch(db, last_id)
+        if last_id is None:
+            return total
+        total += pairs
+        db.commit()
+
 # --- ROTA DE CONEXÕES / AMIGOS (COM CÁLCULO DE COMPATIBILIDADE) ---
 @app.get("/api/connections/{user_id}")
 def get_profile_connections(user_id: int, db: Session = Depends(get_db)):
-    # 1. Busca todas as reviews do usuário alvo
-    target_reviews = db.query(Review).filter(Review.owner_id == user_id).all()
-    
-    # Mapa: {game_id: nota_geral}
-    target_scores = {r.game_id: r.nota_geral for r in target_reviews}
-    target_game_ids = list(target_scores.keys())
-    
+    # Usuário que nem a review nem o job alcançaram ainda: calcula agora e grava
+    if db.query(UserSimilarity.user_id).filter(UserSimilarity.user_id == user_id).first() is None:
+        try:
+            refresh_user_similarity(db, [user_id])
+            db.commit()
+        except IntegrityError:
+            db.rollback() # outra requisição gravou ao mesmo tempo
+
+    # Leitura única no índice (user_id, compatibility) já com os dados do usuário
+    rows = db.query(UserSimilarity.compatibility, User)\
+        .join(User, User.id == UserSimilarity.other_id)\
+        .filter(UserSimilarity.user_id == user_id, UserSimilarity.compatibility > 50)\
+        .order_by(desc(UserSimilarity.compatibility), UserSimilarity.other_id)\
+        .limit(10)\
+        .all()
+
     connections_list = []
-    
-    if target_game_ids:
-        # 2. Busca outras reviews DESSES MESMOS JOGOS por OUTROS usuários
-        others_reviews = db.query(Review).filter(
-            Review.game_id.in_(target_game_ids),
-            Review.owner_id != user_id
-        ).all()
-        
-        # Agrupa por usuario
-        user_scores_map = {}
-        for r in others_reviews:
-            if r.owner_id not in user_scores_map:
-                user_scores_map[r.owner_id] = []
-            user_scores_map[r.owner_id].append(r)
-            
-        # 3. Calcula compatibilidade
-        for other_id, reviews in user_scores_map.items():
-            total_similarity = 0
-            shared_count = 0
-            
-            for r in reviews:
-                if r.game_id in target_scores:
-                    my_score = target_scores[r.game_id]
-                    other_score = r.nota_geral
-                    
-                    # Diferença absoluta (0 a 10)
-                    diff = abs(my_score - other_score)
-                    
-                    # Converter diff em % de similaridade (0 diff = 100%, 10 diff = 0%)
-                    similarity = max(0, 100 - (diff * 10))
-                    
-                    total_similarity += similarity
-                    shared_count += 1
-            
-            if shared_count > 0:
-                final_compatibility = total_similarity / shared_count
-                
-                # SÓ ADICIONA SE FOR MAIOR QUE 50%
-                if final_compatibility > 50:
-                    other_user = db.query(User).filter(User.id == other_id).first()
-                    if other_user:
-                        connections_list.append({
-                            "id": other_user.id,
-                            "username": other_user.username,
-                            "nickname": other_user.nickname or other_user.username,
-                            "avatar_url": other_user.avatar_url,
-                            "level": other_user.level,
-                            "compatibility": int(final_compatibility),
-                            "interaction": f"{int(final_compatibility)}% Compatível"
-                        })
-
-    # Ordena por maior compatibilidade
-    connections_list.sort(key=lambda x: x['compatibility'], reverse=True)
-    
-    return connections_list[:10] # Retorna top 10
+    for compatibility, other_user in rows:
+        connections_list.append({
+            "id": other_user.id,
+            "username": other_user.username,
+            "nickname": other_user.nickname or other_user.username,
+            "avatar_url": other_user.avatar_url,
+            "level": other_user.level,
+            "compatibility": int(compatibility),
+            "interaction": f"{int(compatibility)}% Compatível"
+        })
+    return connections_list
+
+# ==============================================================================
+#  RECOMENDAÇÕES (FILTRAGEM COLABORATIVA ITEM-ITEM)
+# ==============================================================================
+
+RECOMMENDATION_NEIGHBORS = 30      # K vizinhos guardados por jogo
+RECOMMENDATION_MIN_SUPPORT = 2     # mínimo de usuários em comum para o par valer
+RECOMMENDATION_BATCH_SIZE = 100    # jogos por lote na reconstrução
+RECOMMENDATION_CACHE_TTL = 600
+RECOMMENDATION_CACHE_SIZE = 1024
+REVIEW_SCORE_COLUMNS = [Review.jogabilidade, Review.graficos, Review.narrativa, Review.audio, Review.desempenho]
+
+# Resultado por usuário (LRU com TTL); a review do próprio usuário invalida a entrada
+recommendations_cache = OrderedDict()
+recommendations_cache_lock = threading.Lock()
+
+def invalidate_recommendations(user_id: int = None):
+    with recommendations_cache_lock:
+        if user_id is None:
+            recommendations_cache.clear()
+        else:
+            recommendations_cache.pop(user_id, None)
+
+def centered_review_scores(means, review):
+    # Notas dos 5 atributos centradas na média do usuário em cada atributo: quem dá
+    # 9 em tudo não "gosta" mais de nada (atributo sem nota conta como 0)
+    return [func.coalesce(column, 0.0) - means.c[f"m{i}"] for i, column in enumerate((review.jogabilidade, review.graficos, review.narrativa, review.audio, review.desempenho))]
+
+def user_score_means(db: Session, owner_filter=None):
+    query = db.query(Review.owner_id, *[func.avg(func.coalesce(column, 0.0)).label(f"m{i}") for i, column in enumerate(REVIEW_SCORE_COLUMNS)])\
+        .filter(Review.owner_id.isnot(None), Review.nota_geral.isnot(None))
+    if owner_filter is not None:
+        query = query.filter(Review.owner_id.in_(owner_filter))
+    return query.group_by(Review.owner_id).subquery()
+
+def game_vector_norms(db: Session):
+    # Norma ao quadrado do vetor (usuário x atributo) de cada jogo; uma agregação por
+    # invocação do job, linear no número de reviews
+    means = user_score_means(db)
+    review = aliased(Review)
+    squares = sum(value * value for value in centered_review_scores(means, review))
+    return dict(db.query(review.game_id, func.sum(squares))
+        .join(means, means.c.owner_id == review.owner_id)
+        .filter(review.nota_geral.isnot(None))
+        .group_by(review.game_id).all())
+
+def rebuild_game_neighbors_batch(db: Session, last_id: int, norms, k: int = RECOMMENDATION_NEIGHBORS, batch_size: int = RECOMMENDATION_BATCH_SIZE):
+    # Vizinhos dos jogos de um lote (ids depois de last_id). O produto escalar entre o
+    # jogo e cada jogo que os mesmos usuários avaliaram é somado no banco, usuário a
+    # usuário; volta uma linha por par com suporte mínimo e produto positivo, e aqui
+    # o cosseno escolhe os K maiores. Devolve (último id, vizinhos) ou (None, 0) no fim.
+    game_ids = [gid for (gid,) in db.query(Review.game_id).filter(Review.game_id > last_id, Review.nota_geral.isnot(None))
+        .group_by(Review.game_id).order_by(Review.game_id).limit(batch_size).all()]
+    if not game_ids:
+        return None, 0
+
+    source, other = aliased(Review), aliased(Review)
+    reviewers = db.query(Review.owner_id).filter(Review.game_id.in_(game_ids))
+    means = user_score_means(db, reviewers)
+    dot = sum(a * b for a, b in zip(centered_review_scores(means, source), centered_review_scores(means, other)))
+    rows = db.query(source.game_id, other.game_id, func.sum(dot), func.count())\
+        .join(other, and_(other.owner_id == source.owner_id, other.game_id != source.game_id))\
+        .join(means, means.c.owner_id == source.owner_id)\
+        .filter(source.game_id.in_(game_ids), source.nota_geral.isnot(None), other.nota_geral.isnot(None))\
+        .group_by(source.game_id, other.game_id)\
+        .having(and_(func.count() >= RECOMMENDATION_MIN_SUPPORT, func.sum(dot) > 0)).all()
+
+    candidates = {}
+    for game_id, neighbor_id, dot_value, support in rows:
+        denom = math.sqrt((norms.get(game_id) or 0.0) * (norms.get(neighbor_id) or 0.0))
+        if denom > 0:
+            candidates.setdefault(game_id, []).append((-(dot_value / denom), neighbor_id, support))
+
+    db.query(GameNeighbor).filter(GameNeighbor.game_id.in_(game_ids)).delete(synchronize_session=False)
+    neighbors = [{
+        "game_id": game_id,
+        "neighbor_id": neighbor_id,
+        "similarity": round(-negative, 6),
+        "support": int(support)
+    } for game_id, ranked in candidates.items() for negative, neighbor_id, support in sorted(ranked)[:k]]
+    db.bulk_insert_mappings(GameNeighbor, neighbors)
+    return game_ids[-1], len(neighbors)
+
+def game_neighbors_step(db: Session):
+    # As normas são calculadas uma vez e valem para todos os lotes da invocação
+    norms = game_vector_norms(db)
+    return lambda session, last_id: rebuild_game_neighbors_batch(session, last_id, norms)
+
+def rebuild_game_neighbors(db: Session):
+    # Reconstrução completa (python api/index.py rebuild-recommendations)
+    norms = game_vector_norms(db)
+    last_id, total = 0, 0
+    while True:
+        last_id, neighbors = rebuild_game_neighbors_batch(db, last_id, norms)
+        if last_id is None:
+            break
+        total += neighbors
+        db.commit()
+    invalidate_recommendations()
+    return total
+
+def popular_recommendations(db: Session, user_id: int, limit: int):
+    # Enquanto o modelo não tem vizinhos (cron ainda não passou ou usuário sem notas):
+    # jogos mais bem avaliados, primeiro os dos gêneros que o usuário mais avalia.
+    genre_col = func.coalesce(func.nullif(Review.genre, ""), "Outros")
+    owned = Review.owner_id == user_id
+    top_genres = [g for (g,) in db.query(genre_col).filter(owned).group_by(genre_col)
+                  .order_by(desc(func.count(Review.id))).limit(3).all()]
+    in_top = func.max(case((genre_col.in_(top_genres), 1), else_=0)) if top_genres else literal(0)
+    avg_score = func.avg(Review.nota_geral)
+    rows = db.query(Review.game_id, func.max(genre_col), avg_score)\
+        .filter(Review.nota_geral.isnot(None), Review.game_id.notin_(db.query(Review.game_id).filter(owned)))\
+        .group_by(Review.game_id).having(func.count(Review.id) >= 2)\
+        .order_by(desc(in_top), desc(avg_score), desc(func.count(Review.id)), Review.game_id).limit(limit).all()
+    games = resolve_games(db, {gid for gid, _, _ in rows})
+    return [{
+        "game_id": gid,
+        "name": games.get(gid, {}).get("name"),
+        "cover": games.get(gid, {}).get("cover", ""),
+        "predicted_score": round(float(score), 1),
+        "because_of": {"game_id": None, "name": None, "genre": genre}
+    } for gid, genre, score in rows]
+
+def compute_recommendations(db: Session, user_id: int, limit: int):
+    # Predição clássica item-item: para cada jogo não avaliado, média das notas do
+    # usuário nos jogos vizinhos ponderada pela similaridade.
+    reviewed = dict(db.query(Review.game_id, Review.nota_geral).filter(Review.owner_id == user_id, Review.nota_geral.isnot(None)).all())
+    if not reviewed:
+        return popular_recommendations(db, user_id, limit)
+
+    weighted, weights, because = {}, {}, {}
+    neighbors = db.query(GameNeighbor.game_id, GameNeighbor.neighbor_id, GameNeighbor.similarity)\
+        .filter(GameNeighbor.game_id.in_(reviewed.keys())).all()
+    for source_id, candidate_id, similarity in neighbors:
+        if candidate_id in reviewed:
+            continue
+        weighted[candidate_id] = weighted.get(candidate_id, 0.0) + similarity * reviewed[source_id]
+        weights[candidate_id] = weights.get(candidate_id, 0.0) + similarity
+        best = because.get(candidate_id)
+        if best is None or similarity > best[1]:
+            because[candidate_id] = (source_id, similarity)
+
+    if not weighted:
+        return popular_recommendations(db, user_id, limit)
+
+    # Ordena pela nota prevista; o peso total desempata (mais evidência primeiro)
+    ranked = sorted(weighted, key=lambda gid: (-(weighted[gid] / weights[gid]), -weights[gid], gid))[:limit]
+    games = resolve_games(db, set(ranked) | {because[gid][0] for gid in ranked})
+    results = []
+    for gid in ranked:
+        source_id = because[gid][0]
+        game = games.get(gid, {})
+        results.append({
+            "game_id": gid,
+            "name": game.get("name"),
+            "cover": game.get("cover", ""),
+            "predicted_score": round(weighted[gid] / weights[gid], 1),
+            "because_of": {"game_id": source_id, "name": games.get(source_id, {}).get("name")}
+        })
+    return results
+
+@app.get("/api/recommendations/{user_id}")
+def get_recommendations(user_id: int, limit: int = Query(10, ge=1, le=50), db: Session = Depends(get_db)):
+    now = time.time()
+    with recommendations_cache_lock:
+        entry = recommendations_cache.get(user_id)
+        if entry and now - entry["last_updated"] < RECOMMENDATION_CACHE_TTL and limit <= entry["limit"]:
+            recommendations_cache.move_to_end(user_id)
+            return entry["data"][:limit]
+
+    data = compute_recommendations(db, user_id, max(limit, 20))
+    with recommendations_cache_lock:
+        recommendations_cache[user_id] = {"data": data, "limit": max(limit, 20), "last_updated": now}
+        recommendations_cache.move_to_end(user_id)
+        while len(recommendations_cache) > RECOMMENDATION_CACHE_SIZE:
+            recommendations_cache.popitem(last=False)
+    return data[:limit]
+
+def require_cron_secret(request: Request):
+    # Rotas internas (jobs, métricas): "Authorization: Bearer $CRON_SECRET"
+    cron_secret = os.environ.get("CRON_SECRET")
+    if not cron_secret or request.headers.get("authorization") != f"Bearer {cron_secret}":
+        raise HTTPException(status_code=401, detail="Não autorizado")
+
+JOB_TIME_BUDGET = float(os.environ.get("JOB_TIME_BUDGET", "45"))  # segundos de lotes por invocação (maxDuration 60 no vercel.json)
+
+# Jobs em lotes: nome -> função que recebe a sessão e devolve o passo (db, last_id) -> (last_id, linhas)
+BATCH_JOBS = {
+    "backfill_achievements": lambda db: backfill_achievements_batch,
+    "user_similarity": lambda db: rebuild_user_similarity_batch,
+    "game_neighbors": lambda db: game_neighbors_step(db)
+}
+
+def run_batch_job(db: Session, name: str, deadline: float):
+    # Roda lotes até o prazo (time.monotonic), gravando a posição a cada lote; a
+    # próxima invocação continua dali. No fim da passada volta ao começo (ou, no
+    # backfill de conquistas, apaga a pendência).
+    progress = db.get(JobProgress, name)
+    if progress is None:
+        progress = JobProgress(name=name, last_id=0)
+        db.add(progress)
+    step = BATCH_JOBS[name](db)
+    batches, rows, done = 0, 0, False
+    # Pelo menos um lote por invocação, mesmo que o preparo tenha gasto o tempo todo
+    while batches == 0 or time.monotonic() < deadline:
+        last_id, count = step(db, progress.last_id)
+        if last_id is None:
+            done = True
+            break
+        progress.last_id = last_id
+        progress.updated_at = datetime.now().isoformat()
+        db.commit()
+        batches, rows = batches + 1, rows + count
+    if done:
+        if name == "backfill_achievements":
+            db.delete(progress)
+        else:
+            progress.last_id = 0
+            progress.updated_at = datetime.now().isoformat()
+        db.commit()
+    if name == "game_neighbors":
+        invalidate_recommendations()
+    return {"job": name, "batches": batches, "rows": rows, "last_id": progress.last_id, "done": done}
+
+# Job agendado (vercel.json -> crons, uma entrada por modelo com ?job=). A Vercel manda
+# "Authorization: Bearer $CRON_SECRET". Usa o tempo todo da invocação: backfill de
+# conquistas pendente primeiro, depois o job pedido e então os outros, do que está
+# há mais tempo sem avançar; cada um roda no máximo uma passada.
+@app.get("/api/jobs/rebuild-models")
+def run_rebuild_models(request: Request, job: Optional[str] = None, db: Session = Depends(get_db)):
+    require_cron_secret(request)
+    if job is not None and job not in BATCH_JOBS:
+        raise HTTPException(status_code=400, detail="Job desconhecido")
+    deadline = time.monotonic() + JOB_TIME_BUDGET
+    progress = {row.name: row.updated_at for row in db.query(JobProgress).all()}
+    models = sorted(("user_similarity", "game_neighbors"), key=lambda name: progress.get(name) or "")
+    order = (["backfill_achievements"] if "backfill_achievements" in progress else []) + ([job] if job else []) + models
+    results = []
+    for name in dict.fromkeys(order):
+        if time.monotonic() >= deadline:
+            break
+        result = run_batch_job(db, name, deadline)
+        results.append(result)
+        if not result["done"]:
+            break # o prazo acabou no meio deste job
+    return {"jobs": results}
+
+@app.get("/api/metrics/compression")
+def get_compression_metrics(request: Request):
+    # Contadores desta instância desde o cold start ("gzip:static" = pré-compressão)
+    require_cron_secret(request)
+    with compression_stats_lock:
+        stats = {encoding: dict(values) for encoding, values in compression_stats.items()}
+    for values in stats.values():
+        values["ratio"] = round(values["bytes_in"] / values["bytes_out"], 2) if values["bytes_out"] else None
+        values["cpu_ms"] = round(values["cpu_ms"], 2)
+        values["cpu_ms_per_mb"] = round(values["cpu_ms"] / (values["bytes_in"] / 1048576), 2) if values["bytes_in"] else None
+    return {
+        "min_size": COMPRESSION_MIN_SIZE,
+        "gzip_level": COMPRESSION_LEVEL,
+        "brotli_quality": BROTLI_QUALITY if brotli is not None else None,
+        "encodings": stats
+    }
+
+@app.get("/api/metrics/bulkheads")
+def get_bulkhead_metrics(request: Request):
+    # Ocupação de cada serviço externo nesta instância (contadores desde o cold start)
+    require_cron_secret(request)
+    return {
+        "queue_timeout": BULKHEAD_QUEUE_TIMEOUT,
+        "bulkheads": {name: bulkhead.stats() for name, bulkhead in bulkheads.items()}
+    }
+
+@app.get("/api/metrics/upstreams")
+def get_upstream_metrics(request: Request):
+    # Estado dos circuit breakers e quantas respostas saíram do cache por queda do serviço
+    require_cron_secret(request)
+    with upstream_cache_lock:
+        cached = len(upstream_cache)
+    return {
+        "connect_timeout": UPSTREAM_CONNECT_TIMEOUT,
+        "failure_threshold": CIRCUIT_FAILURE_THRESHOLD,
+        "reset_timeout": CIRCUIT_RESET_TIMEOUT,
+        "cached_responses": cached,
+        "breakers": {name: breaker.stats() for name, breaker in circuit_breakers.items()}
+    }
 
 # --- QUIZ COM 10 PERGUNTAS VARIADAS ---
-@app.get("/api/quiz/{user_id}")
-def generate_quiz(user_id: int, db: Session = Depends(get_db)):
-    reviews = db.query(Review).filter(Review.owner_id == user_id).all()
-    
-    if len(reviews) < 2:
-        return {"error": "Usuário precisa de pelo menos 2 avaliações para gerar o quiz."}
+QUIZ_POOL_TTL = 300
+QUIZ_POOL_CACHE_SIZE = 512
+QUIZ_FAKE_GENRES = ["RPG", "Shooter", "Adventure", "Indie", "Strategy", "Sports"]
+# Perguntas "qual jogo tem a maior/menor X": (id, campo, maior?, texto)
+QUIZ_EXTREMES = [
+    (1, "nota_geral", True, "Qual jogo recebeu a MAIOR Nota Geral deste perfil?"),
+    (2, "graficos", True, "Qual jogo tem os Melhores Gráficos segundo o usuário?"),
+    (3, "narrativa", True, "Qual jogo tem a Melhor História (Narrativa)?"),
+    (7, "nota_geral", False, "Qual destes jogos teve a MENOR nota?"),
+    (9, "jogabilidade", True, "Qual jogo tem a Melhor Jogabilidade?"),
+    (10, "audio", True, "Qual jogo tem o Melhor Áudio/Trilha Sonora?"),
+]
+
+# Pool por usuário: reviews enxutas + extremos/gênero/favoritos já resolvidos.
+# Montar um quiz a partir dele é O(1) por pergunta; review/favoritos invalidam.
+quiz_pool_cache = OrderedDict()
+quiz_pool_lock = threading.Lock()
+
+def invalidate_quiz_pool(user_id: int):
+    with quiz_pool_lock:
+        quiz_pool_cache.pop(user_id, None)
+
+def build_quiz_pool(db: Session, user_id: int):
+    fields = ["nota_geral", "graficos", "narrativa", "jogabilidade", "audio"]
+    rows = db.query(Review.game_id, Review.game_name, Review.game_image_url, Review.genre, Review.is_favorite,
+                    Review.nota_geral, Review.graficos, Review.narrativa, Review.jogabilidade, Review.audio)\
+        .filter(Review.owner_id == user_id).order_by(Review.id).all()
+
+    # Uma passada só: maior/menor de cada atributo (o primeiro vence no empate),
+    # contagem de gêneros e separação favoritos / não favoritos
+    best, worst = {}, {}
+    genre_counts = {}
+    favorites, non_favorites = [], []
+    for i, r in enumerate(rows):
+        for field in fields:
+            value = getattr(r, field) or 0
+            if field not in best or value > (getattr(rows[best[field]], field) or 0):
+                best[field] = i
+            if field not in worst or value < (getattr(rows[worst[field]], field) or 0):
+                worst[field] = i
+        g = r.genre or "Outros"
+        genre_counts[g] = genre_counts.get(g, 0) + 1
+        (favorites if r.is_favorite else non_favorites).append(i)
 
+    return {
+        "reviews": rows,
+        "best": best,
+        "worst": worst,
+        "favorite_genre": max(genre_counts.items(), key=lambda x: x[1])[0] if genre_counts else None,
+        "favorites": favorites,
+        "non_favorites": non_favorites,
+    }
+
+def get_quiz_pool(db: Session, user_id: int):
+    now = time.time()
+    with quiz_pool_lock:
+        entry = quiz_pool_cache.get(user_id)
+        if entry and now - entry["built_at"] < QUIZ_POOL_TTL:
+            quiz_pool_cache.move_to_end(user_id)
+            return entry["pool"]
+    pool = build_quiz_pool(db, user_id)
+    with quiz_pool_lock:
+        quiz_pool_cache[user_id] = {"pool": pool, "built_at": now}
+        while len(quiz_pool_cache) > QUIZ_POOL_CACHE_SIZE:
+            quiz_pool_cache.popitem(last=False)
+    return pool
+
+def quiz_option(r):
+    return {"id": r.game_id, "name": r.game_name, "image": r.game_image_url}
+
+def sample_excluding(rng, n, exclude, count):
+    # Amostra índices de range(n) sem o excluído, sem montar a lista filtrada
+    picks = rng.sample(range(n - 1), min(count, n - 1))
+    return [i + 1 if i >= exclude else i for i in picks]
+
+def build_quiz(pool, rng):
+    reviews = pool["reviews"]
+    n = len(reviews)
     questions = []
-    
-    # Helper para pegar distratores (opções erradas)
-    def get_distractors(exclude_id, count=3):
-        candidates = [r for r in reviews if r.id != exclude_id]
-        if len(candidates) >= count:
-            return random.sample(candidates, count)
-        return candidates
-
-    # 1. MELHOR NOTA GERAL
-    sorted_by_score = sorted(reviews, key=lambda x: x.nota_geral, reverse=True)
-    winner_score = sorted_by_score[0]
-    opts_score = [winner_score] + get_distractors(winner_score.id)
-    random.shuffle(opts_score)
-    questions.append({
-        "id": 1, "type": "multiple_choice",
-        "question": "Qual jogo recebeu a MAIOR Nota Geral deste perfil?",
-        "correct_id": winner_score.game_id,
-        "options": [{"id": o.game_id, "name": o.game_name, "image": o.game_image_url} for o in opts_score]
-    })
 
-    # 2. MELHOR GRÁFICO
-    sorted_gfx = sorted(reviews, key=lambda x: x.graficos, reverse=True)
-    winner_gfx = sorted_gfx[0]
-    opts_gfx = [winner_gfx] + get_distractors(winner_gfx.id)
-    random.shuffle(opts_gfx)
-    questions.append({
-        "id": 2, "type": "multiple_choice",
-        "question": "Qual jogo tem os Melhores Gráficos segundo o usuário?",
-        "correct_id": winner_gfx.game_id,
-        "options": [{"id": o.game_id, "name": o.game_name, "image": o.game_image_url} for o in opts_gfx]
-    })
+    def extreme_question(qid, field, highest, text):
+        winner = (pool["best"] if highest else pool["worst"])[field]
+        opts = [winner] + sample_excluding(rng, n, winner, 3)
+        rng.shuffle(opts)
+        return {
+            "id": qid, "type": "multiple_choice",
+            "question": text,
+            "correct_id": reviews[winner].game_id,
+            "options": [quiz_option(reviews[i]) for i in opts]
+        }
 
-    # 3. MELHOR NARRATIVA
-    sorted_narr = sorted(reviews, key=lambda x: x.narrativa, reverse=True)
-    winner_narr = sorted_narr[0]
-    opts_narr = [winner_narr] + get_distractors(winner_narr.id)
-    random.shuffle(opts_narr)
-    questions.append({
-        "id": 3, "type": "multiple_choice",
-        "question": "Qual jogo tem a Melhor História (Narrativa)?",
-        "correct_id": winner_narr.game_id,
-        "options": [{"id": o.game_id, "name": o.game_name, "image": o.game_image_url} for o in opts_narr]
-    })
+    def slider_question(qid, r, text):
+        return {
+            "id": qid, "type": "slider",
+            "question": text,
+            "game_name": r.game_name,
+            "game_image": r.game_image_url,
+            "correct_score": r.nota_geral
+        }
+
+    extremes = {qid: (field, highest, text) for qid, field, highest, text in QUIZ_EXTREMES}
+    for qid in (1, 2, 3):
+        questions.append(extreme_question(qid, *extremes[qid]))
 
     # 4. SLIDER (NOTA EXATA - Jogo Aleatório 1)
-    r_slider1 = random.choice(reviews)
+    slider1 = rng.randrange(n)
+    questions.append(slider_question(4, reviews[slider1], f"Qual a nota exata de {reviews[slider1].game_name}?"))
+
+    # 5. VERSUS (Quem ganha?) - se empate, o segundo ganha
+    a, b = rng.sample(range(n), 2)
+    r1, r2 = reviews[a], reviews[b]
     questions.append({
-        "id": 4, "type": "slider",
-        "question": f"Qual a nota exata de {r_slider1.game_name}?",
-        "game_name": r_slider1.game_name,
-        "game_image": r_slider1.game_image_url,
-        "correct_score": r_slider1.nota_geral
+        "id": 5, "type": "versus",
+        "question": "Duelo: Qual jogo tem a nota maior?",
+        "option_a": {"id": r1.game_id, "name": r1.game_name, "image": r1.game_image_url, "score": r1.nota_geral},
+        "option_b": {"id": r2.game_id, "name": r2.game_name, "image": r2.game_image_url, "score": r2.nota_geral},
+        "correct_id": (r1 if r1.nota_geral > r2.nota_geral else r2).game_id
     })
 
-    # 5. VERSUS (Quem ganha?)
-    if len(reviews) >= 2:
-        r1, r2 = random.sample(reviews, 2)
-        winner_versus = r1 if r1.nota_geral > r2.nota_geral else r2 # Se empate, r2 ganha (simplificação)
-        questions.append({
-            "id": 5, "type": "versus",
-            "question": "Duelo: Qual jogo tem a nota maior?",
-            "option_a": {"id": r1.game_id, "name": r1.game_name, "image": r1.game_image_url, "score": r1.nota_geral},
-            "option_b": {"id": r2.game_id, "name": r2.game_name, "image": r2.game_image_url, "score": r2.nota_geral},
-            "correct_id": winner_versus.game_id
-        })
-
     # 6. GÊNERO FAVORITO
-    genre_counts = {}
-    for r in reviews:
-        g = r.genre or "Outros"
-        genre_counts[g] = genre_counts.get(g, 0) + 1
-    fav_genre = sorted(genre_counts.items(), key=lambda x: x[1], reverse=True)[0][0]
-    fake_genres = ["RPG", "Shooter", "Adventure", "Indie", "Strategy", "Sports"]
-    fake_genres = [g for g in fake_genres if g != fav_genre]
-    random.shuffle(fake_genres)
-    opts_genre = [fav_genre] + fake_genres[:3]
-    random.shuffle(opts_genre)
-    
+    fav_genre = pool["favorite_genre"]
+    fake_genres = [g for g in QUIZ_FAKE_GENRES if g != fav_genre]
+    opts_genre = [fav_genre] + rng.sample(fake_genres, 3)
+    rng.shuffle(opts_genre)
     questions.append({
         "id": 6, "type": "genre",
         "question": "Qual gênero aparece mais neste perfil?",
@@ -1791,96 +4047,90 @@ def generate_quiz(user_id: int, db: Session = Depends(get_db)):
         "correct_answer": fav_genre
     })
 
-    # 7. PIOR NOTA (Ou Menor)
-    sorted_worst = sorted(reviews, key=lambda x: x.nota_geral)
-    worst = sorted_worst[0]
-    opts_worst = [worst] + get_distractors(worst.id)
-    random.shuffle(opts_worst)
-    questions.append({
-        "id": 7, "type": "multiple_choice",
-        "question": "Qual destes jogos teve a MENOR nota?",
-        "correct_id": worst.game_id,
-        "options": [{"id": o.game_id, "name": o.game_name, "image": o.game_image_url} for o in opts_worst]
-    })
+    # 7. PIOR NOTA
+    questions.append(extreme_question(7, *extremes[7]))
 
-    # 8. SLIDER (NOTA EXATA - Jogo Aleatório 2)
-    # Tenta pegar um diferente do primeiro slider
-    r_slider2 = random.choice(reviews)
-    if r_slider2.id == r_slider1.id and len(reviews) > 1:
-        for r in reviews:
-            if r.id != r_slider1.id:
-                r_slider2 = r
-                break
-                
-    questions.append({
-        "id": 8, "type": "slider",
-        "question": f"Quanto o usuário deu para {r_slider2.game_name}?",
-        "game_name": r_slider2.game_name,
-        "game_image": r_slider2.game_image_url,
-        "correct_score": r_slider2.nota_geral
-    })
+    # 8. SLIDER (NOTA EXATA - Jogo Aleatório 2, diferente do primeiro)
+    slider2 = sample_excluding(rng, n, slider1, 1)[0]
+    questions.append(slider_question(8, reviews[slider2], f"Quanto o usuário deu para {reviews[slider2].game_name}?"))
 
     # 9. MELHOR JOGABILIDADE
-    sorted_gameplay = sorted(reviews, key=lambda x: x.jogabilidade, reverse=True)
-    winner_gp = sorted_gameplay[0]
-    opts_gp = [winner_gp] + get_distractors(winner_gp.id)
-    random.shuffle(opts_gp)
-    questions.append({
-        "id": 9, "type": "multiple_choice",
-        "question": "Qual jogo tem a Melhor Jogabilidade?",
-        "correct_id": winner_gp.game_id,
-        "options": [{"id": o.game_id, "name": o.game_name, "image": o.game_image_url} for o in opts_gp]
-    })
+    questions.append(extreme_question(9, *extremes[9]))
 
-    # 10. ESTÁ NO TOP 3 (FAVORITOS)?
-    favorites = [r for r in reviews if r.is_favorite]
-    if favorites:
-        fav_target = random.choice(favorites)
-        # Distratores devem ser jogos que NÃO são favoritos
-        non_favs = [r for r in reviews if not r.is_favorite]
-        if len(non_favs) >= 3:
-            dist_favs = random.sample(non_favs, 3)
-            opts_fav = [fav_target] + dist_favs
-            random.shuffle(opts_fav)
-            questions.append({
-                "id": 10, "type": "multiple_choice",
-                "question": "Qual destes jogos está nos Favoritos do perfil?",
-                "correct_id": fav_target.game_id,
-                "options": [{"id": o.game_id, "name": o.game_name, "image": o.game_image_url} for o in opts_fav]
-            })
-    
-    # Se não tiver favoritos suficientes ou der erro, completa com outra pergunta de áudio
-    if len(questions) < 10:
-        sorted_audio = sorted(reviews, key=lambda x: x.audio, reverse=True)
-        winner_aud = sorted_audio[0]
-        opts_aud = [winner_aud] + get_distractors(winner_aud.id)
-        random.shuffle(opts_aud)
+    # 10. ESTÁ NOS FAVORITOS? (distratores não favoritos); senão, melhor áudio
+    if pool["favorites"] and len(pool["non_favorites"]) >= 3:
+        target = rng.choice(pool["favorites"])
+        opts_fav = [target] + rng.sample(pool["non_favorites"], 3)
+        rng.shuffle(opts_fav)
         questions.append({
             "id": 10, "type": "multiple_choice",
-            "question": "Qual jogo tem o Melhor Áudio/Trilha Sonora?",
-            "correct_id": winner_aud.game_id,
-            "options": [{"id": o.game_id, "name": o.game_name, "image": o.game_image_url} for o in opts_aud]
+            "question": "Qual destes jogos está nos Favoritos do perfil?",
+            "correct_id": reviews[target].game_id,
+            "options": [quiz_option(reviews[i]) for i in opts_fav]
         })
+    else:
+        questions.append(extreme_question(10, *extremes[10]))
+
+    return questions
 
-    return questions[:10]
+@app.get("/api/quiz/{user_id}")
+def generate_quiz(user_id: int, response: Response, seed: Optional[int] = None, db: Session = Depends(get_db)):
+    pool = get_quiz_pool(db, user_id)
+    if len(pool["reviews"]) < 2:
+        return {"error": "Usuário precisa de pelo menos 2 avaliações para gerar o quiz."}
+
+    # Semente devolvida no header: o mesmo seed refaz exatamente o mesmo quiz
+    if seed is None:
+        seed = random.randrange(2 ** 31)
+    response.headers["X-Quiz-Seed"] = str(seed)
+    return build_quiz(pool, random.Random(seed))
 # ==============================================================================
 #  NOVAS ROTAS: DADOS (Lançamentos e Notícias com Tradução)
 # ==============================================================================
 
+# O deep-translator não aceita timeout: a tradução roda num pool próprio e quem
+# chamou desiste depois de upstream_timeout("translator"). A thread presa continua
+# ocupando o bulkhead até o Google responder, então o estrago fica limitado a ele.
+translator_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=bulkheads["translator"].concurrency + bulkheads["translator"].queue,
+    thread_name_prefix="translator"
+)
+TRANSLATION_CACHE_SIZE = 512
+translation_cache = OrderedDict()
+translation_cache_lock = threading.Lock()
+
+def translate_with_deadline(translate, text):
+    future = translator_executor.submit(bulkheads["translator"].call, translate, text)
+    return future.result(timeout=upstream_timeout("translator"))
+
 # Função auxiliar de tradução segura
 def safe_translate(text):
     if not text or len(text) < 2:
         return text
+    # Tradução já feita não muda: serve do cache (e é o que sobra com o circuito aberto)
+    with translation_cache_lock:
+        if text in translation_cache:
+            translation_cache.move_to_end(text)
+            return translation_cache[text]
     try:
         from deep_translator import GoogleTranslator
-        # Traduz do inglês (auto) para português (pt)
-        return GoogleTranslator(source='auto', target='pt').translate(text)
     except ImportError:
         print("ERRO: 'deep-translator' não instalado. Rodar: pip install deep-translator")
         return text
+    try:
+        # Traduz do inglês (auto) para português (pt)
+        translator = GoogleTranslator(source='auto', target='pt')
+        translated = guarded_call("translator", translate_with_deadline, translator.translate, text)
+    except UpstreamUnavailable:
+        return text
     except Exception as e:
-        print(f"Erro ao traduzir trecho: {e}")
+        print(f"Erro ao traduzir trecho: {e!r}")
         return text
+    with translation_cache_lock:
+        translation_cache[text] = translated
+        while len(translation_cache) > TRANSLATION_CACHE_SIZE:
+            translation_cache.popitem(last=False)
+    return translated
 
 # --- SUBSTITUA A FUNÇÃO get_upcoming_games POR ESTA ---
 
@@ -1896,8 +4146,7 @@ def get_upcoming_games():
     try:
         # Busca a lista oficial de "Em Breve" da Steam
         url = "https://store.steampowered.com/api/featuredcategories?cc=BR&l=portuguese"
-        response = requests.get(url, timeout=10)
-        data = response.json()
+        data = upstream_json("steam_store", "GET", url)
         
         items = []
         if "coming_soon" in data:
@@ -1917,7 +4166,7 @@ def get_upcoming_games():
                 time.sleep(random.uniform(0.05, 0.1))
                 
                 url_det = f"http://store.steampowered.com/api/appdetails?appids={app_id}&cc=BR&l=portuguese"
-                res = requests.get(url_det, timeout=5).json()
+                res = upstream_json("steam_store", "GET", url_det)
                 
                 if str(app_id) in res and res[str(app_id)]["success"]:
                     game_data = res[str(app_id)]["data"]
@@ -1996,12 +4245,20 @@ def get_upcoming_games():
         # Reordena conforme a lista original da Steam (relevância)
         results.sort(key=lambda x: target_ids.index(x["id"]) if x["id"] in target_ids else 999)
 
+        # Steam fora do ar no meio da busca: a lista antiga é melhor que uma vazia
+        if not results and upcoming_cache["data"]:
+            return upcoming_cache["data"]
+
         # Atualiza Cache
         upcoming_cache["data"] = results[:12] # Pega os 12 primeiros válidos
         upcoming_cache["last_updated"] = current_time
         
         return upcoming_cache["data"]
 
+    except UpstreamUnavailable:
+        if upcoming_cache["data"]:
+            return upcoming_cache["data"]
+        raise
     except Exception as e:
         print(f"Erro Geral Steam Upcoming: {e}")
         return []
@@ -2025,8 +4282,7 @@ def get_latest_news():
     def fetch_news_for_app(app_id):
         try:
             url = f"http://api.steampowered.com/ISteamNews/GetNewsForApp/v0002/?appid={app_id}&count=1&maxlength=300&format=json"
-            res = requests.get(url, timeout=5) # Timeout um pouco maior para garantir
-            data = res.json()
+            data = upstream_json("steam_api", "GET", url)
             
             if "appnews" in data and "newsitems" in data["appnews"]:
                 items = data["appnews"]["newsitems"]
@@ -2068,6 +4324,9 @@ def get_latest_news():
 
     # Ordena por data
     raw_news.sort(key=lambda x: x["date"], reverse=True)
+
+    if not raw_news and news_cache["data"]:
+        return news_cache["data"]
     
     # Atualiza Cache
     news_cache["data"] = raw_news
@@ -2076,19 +4335,67 @@ def get_latest_news():
     return raw_news
 
 # --- ROTA PARA O MINIGAME DE CAPA (GUESS THE GAME) ---
+# Até aqui vale puxar só os ids do usuário e sortear; acima, sorteio de ids com seek.
+# (ORDER BY random() não aceita semente no SQLite, e a rodada precisa ser reproduzível)
+COVER_SMALL_SET = 1000
+COVER_ROUND_SIZE = 10
+COVER_SEEK_ROUNDS = 5
+
+def sample_review_ids(db: Session, user_id: int, total: int, rng, size: int):
+    owned = Review.owner_id == user_id
+    if total <= COVER_SMALL_SET:
+        ids = [row[0] for row in db.query(Review.id).filter(owned).order_by(Review.id).all()]
+        return rng.sample(ids, min(size, len(ids)))
+
+    # Sorteia ids em [menor, maior] e busca o primeiro id >= sorteado no índice
+    # (owner_id, id): cada busca é um seek, tudo numa ida ao banco por rodada, com
+    # ORDER BY explícito para a mesma semente dar a mesma rodada também no Postgres.
+    # Buracos e repetidos geram novas rodadas (limitadas); o que faltar vem da lista de ids.
+    low, high = db.query(func.min(Review.id), func.max(Review.id)).filter(owned).one()
+    wanted = min(size, total)
+    picked = []
+    for _ in range(COVER_SEEK_ROUNDS):
+        if len(picked) >= wanted or low is None:
+            break
+        targets = [rng.randint(low, high) for _ in range(wanted - len(picked))]
+        seeks = union_all(*[
+            select(literal(pick).label("pick"),
+                   select(Review.id).where(owned, Review.id >= target).order_by(Review.id).limit(1).scalar_subquery().label("review_id"))
+            for pick, target in enumerate(targets)
+        ]).subquery()
+        for (review_id,) in db.execute(select(seeks.c.review_id).order_by(seeks.c.pick)).all():
+            # Review apagada entre a contagem e a busca: o seek volta vazio
+            if review_id is not None and review_id not in picked and len(picked) < wanted:
+                picked.append(review_id)
+    if len(picked) < wanted:
+        rest = [row[0] for row in db.query(Review.id).filter(owned, Review.id.notin_(picked)).order_by(Review.id).all()]
+        picked += rng.sample(rest, min(wanted - len(picked), len(rest)))
+    return picked
+
 @app.get("/api/minigame/cover/{user_id}")
-def get_minigame_cover(user_id: int, db: Session = Depends(get_db)):
-    reviews = db.query(Review).filter(Review.owner_id == user_id).all()
+def get_minigame_cover(user_id: int, response: Response, seed: Optional[int] = None, db: Session = Depends(get_db)):
+    total = db.query(func.count(Review.id)).filter(Review.owner_id == user_id).scalar()
     
     # Mínimo de 3 jogos para jogar
-    if len(reviews) < 3:
+    if total < 3:
         return []
+
+    # Mesma semente = mesma rodada (jogos, ordem e dicas); devolvida no header
+    if seed is None:
+        seed = random.randrange(2 ** 31)
+    response.headers["X-Round-Seed"] = str(seed)
+    rng = random.Random(seed)
     
-    # Seleciona até 10 jogos aleatórios
-    selected_reviews = random.sample(reviews, min(len(reviews), 10))
+    # Seleciona até 10 jogos aleatórios, trazendo só as colunas do minigame
+    picked = sample_review_ids(db, user_id, total, rng, COVER_ROUND_SIZE)
+    rows = db.query(Review.id, Review.game_id, Review.game_name, Review.game_image_url,
+                    Review.nota_geral, Review.narrativa, Review.graficos, Review.jogabilidade, Review.audio)\
+        .filter(Review.id.in_(picked)).all()
+    by_id = {r.id: r for r in rows}
     
     game_data = []
-    for r in selected_reviews:
+    for review_id in picked:
+        r = by_id[review_id]
         # Gera uma dica baseada nas notas disponíveis
         possible_hints = []
         if r.nota_geral: possible_hints.append(f"O usuário deu nota TOTAL {r.nota_geral:.1f} para este jogo")
@@ -2097,7 +4404,7 @@ def get_minigame_cover(user_id: int, db: Session = Depends(get_db)):
         if r.jogabilidade: possible_hints.append(f"A nota de JOGABILIDADE foi {r.jogabilidade:.1f}")
         if r.audio: possible_hints.append(f"A nota de ÁUDIO foi {r.audio:.1f}")
         
-        hint = random.choice(possible_hints) if possible_hints else "Jogo avaliado pelo usuário"
+        hint = rng.choice(possible_hints) if possible_hints else "Jogo avaliado pelo usuário"
         
         game_data.append({
             "id": r.game_id,
@@ -2107,8 +4414,30 @@ def get_minigame_cover(user_id: int, db: Session = Depends(get_db)):
         })
         
     return game_data
+# Catálogo fixo: serializado uma única vez e servido como bytes prontos
+anticipated_2026_cache = {}
+
 @app.get("/api/games/anticipated_2026")
-def get_anticipated_2026():
+def get_anticipated_2026(request: Request, response: Response):
+    if not anticipated_2026_cache:
+        body = FastJSONResponse(anticipated_2026_catalog()).body
+        anticipated_2026_cache.update(body=body, digest=hashlib.blake2b(body, digest_size=12).hexdigest(),
+                                      variants=precompress_static(body))
+    # Só muda com deploy: o próprio corpo é o validador, cache longo no navegador e na borda
+    not_modified = conditional_get(request, response, (anticipated_2026_cache["digest"],), max_age=3600, s_maxage=86400)
+    if not_modified:
+        return not_modified
+    headers = {name: response.headers[name] for name in ("ETag", "Cache-Control", "Vary")}
+    # Variante pré-comprimida; o middleware não recomprime o que já tem Content-Encoding
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    if encoding in anticipated_2026_cache["variants"]:
+        content = anticipated_2026_cache["variants"][encoding]
+        record_compression(encoding, len(anticipated_2026_cache["body"]), len(content), 0.0)
+        headers["Content-Encoding"] = encoding
+        return Response(content=content, media_type="application/json", headers=headers)
+    return Response(content=anticipated_2026_cache["body"], media_type="application/json", headers=headers)
+
+def anticipated_2026_catalog():
     return [
         {
             "category": "Sequências e Continuações AAA",
@@ -2325,45 +4654,71 @@ def get_anticipated_2026():
 #  ROTAS DE DISCUSSÕES (COMUNIDADE)
 # ==============================================================================
 
+# Hot score no estilo Reddit: log10 dos pontos (votos + comentários) somado a um
+# termo de tempo, então cada ordem de grandeza de pontos vale ~12,5h de "frescor".
+HOT_SCORE_EPOCH = 1704067200 # 2024-01-01 UTC
+HOT_SCORE_DECAY_SECONDS = 45000
+
+def compute_hot_score(score, comment_count, created_at):
+    points = (score or 0) + (comment_count or 0)
+    order = math.log10(max(abs(points), 1))
+    sign = 1 if points > 0 else -1 if points < 0 else 0
+    try:
+        created_ts = datetime.fromisoformat(created_at).timestamp()
+    except (TypeError, ValueError):
+        created_ts = time.time()
+    return round(sign * order + (created_ts - HOT_SCORE_EPOCH) / HOT_SCORE_DECAY_SECONDS, 7)
+
+def refresh_discussion_stats(db: Session, discussion: Discussion):
+    # Recalcula a partir das tabelas de origem (consultas indexadas por discussion_id)
+    discussion.score = db.query(func.coalesce(func.sum(DiscussionVote.vote_type), 0)).filter(DiscussionVote.discussion_id == discussion.id).scalar()
+    discussion.comment_count = db.query(func.count(DiscussionComment.id)).filter(DiscussionComment.discussion_id == discussion.id).scalar()
+    discussion.hot_score = compute_hot_score(discussion.score, discussion.comment_count, discussion.created_at)
+
+def rebuild_discussion_scores(db: Session):
+    # Backfill usado quando as colunas de ranking são criadas num banco já existente
+    votes = dict(db.query(DiscussionVote.discussion_id, func.sum(DiscussionVote.vote_type)).group_by(DiscussionVote.discussion_id).all())
+    comments = dict(db.query(DiscussionComment.discussion_id, func.count(DiscussionComment.id)).group_by(DiscussionComment.discussion_id).all())
+    for d in db.query(Discussion).all():
+        d.score = votes.get(d.id) or 0
+        d.comment_count = comments.get(d.id) or 0
+        d.hot_score = compute_hot_score(d.score, d.comment_count, d.created_at)
+    db.commit()
+
 @app.get("/api/discussions/top")
-def get_top_discussions(db: Session = Depends(get_db)):
-    # Busca discussões e calcula o "score" (soma dos votos)
-    # Ordena por score descendente e data
-    discussions = db.query(Discussion).all()
-    
-    results = []
-    for d in discussions:
-        # Calcula Score
-        score = db.query(func.sum(DiscussionVote.vote_type)).filter(DiscussionVote.discussion_id == d.id).scalar() or 0
-        
-        # Contagem de Comentários
-        comment_count = db.query(DiscussionComment).filter(DiscussionComment.discussion_id == d.id).count()
-        
-        author = db.query(User).filter(User.id == d.user_id).first()
-        
-        results.append({
+def get_top_discussions(game_id: Optional[int] = None, cursor: Optional[str] = None, limit: int = Query(20, ge=1, le=50), viewer_id: Optional[int] = Depends(get_viewer_id), db: Session = Depends(get_db)):
+    # Ranking feito no banco pelo hot_score armazenado, paginado por (hot_score, id)
+    query = db.query(Discussion, User).outerjoin(User, User.id == Discussion.user_id)
+    if game_id is not None:
+        query = query.filter(Discussion.game_id == game_id)
+
+    rows = keyset_query(query, [Discussion.hot_score, Discussion.id], cursor, limit).all()
+    user_votes = viewer_discussion_votes(db, viewer_id, [d.id for d, _ in rows[:limit]])
+    games = resolve_games(db, [d.game_id for d, _ in rows[:limit] if not d.game_name])
+
+    def serialize(row):
+        d, author = row
+        return {
             "id": d.id,
             "title": d.title,
             "content": d.content,
             "game_id": d.game_id,
-            "game_name": d.game_name,
+            "game_name": d.game_name or games.get(d.game_id, {}).get("name"),
             "created_at": d.created_at,
-            "score": score,
-            "comment_count": comment_count,
+            "score": d.score or 0,
+            "comment_count": d.comment_count or 0,
+            "user_vote": user_votes.get(d.id, 0),
             "author": {
                 "id": author.id,
                 "nickname": author.nickname or author.username,
                 "avatar_url": author.avatar_url,
                 "username": author.username
             } if author else {"nickname": "Desconhecido", "avatar_url": ""}
-        })
-    
-    # Ordenação manual python (Score > Data)
-    results.sort(key=lambda x: (x['score'], x['created_at']), reverse=True)
-    return results[:20]
+        }
+    return keyset_page(rows, limit, lambda row: (row[0].hot_score, row[0].id), serialize)
 
 @app.post("/api/discussions")
-def create_discussion(data: DiscussionInput, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def create_discussion(data: DiscussionInput, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     try:
         new_disc = Discussion(
             title=data.title,
@@ -2372,11 +4727,16 @@ def create_discussion(data: DiscussionInput, current_user: User = Depends(get_cu
             game_name=data.game_name,
             user_id=current_user.id # Pega do token seguro
         )
+        new_disc.created_at = datetime.now().isoformat()
+        new_disc.hot_score = compute_hot_score(0, 0, new_disc.created_at)
         db.add(new_disc)
+        upsert_game(db, data.game_id, data.game_name)
+        db.flush()
         
         # XP para o criador
-        user = current_user
-        user.xp += 20
+        user = current_user.row()
+        award_xp(db, user, 20, "discussion", new_disc.id)
+        evaluate_achievements(db, user, "xp")
         
         db.commit()
         return {"message": "Discussão criada!"}
@@ -2385,7 +4745,11 @@ def create_discussion(data: DiscussionInput, current_user: User = Depends(get_cu
         return {"error": str(e)}
 
 @app.post("/api/discussions/vote")
-def vote_discussion(data: VoteInput, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def vote_discussion(data: VoteInput, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    discussion = db.query(Discussion).filter(Discussion.id == data.discussion_id).first()
+    if not discussion:
+        raise HTTPException(status_code=404, detail="Discussão não encontrada")
+
     # Verifica se esse usuário já votou nessa discussão
     existing = db.query(DiscussionVote).filter(
         DiscussionVote.discussion_id == data.discussion_id, 
@@ -2396,13 +4760,11 @@ def vote_discussion(data: VoteInput, current_user: User = Depends(get_current_us
         # Se o usuário clicou no MESMO botão (ex: já tinha dado like e clicou no like de novo)
         if existing.vote_type == data.vote_type:
             db.delete(existing)
-            db.commit()
-            return {"status": "removed"}
+            status = "removed"
         else:
             # Se o usuário clicou no OUTRO botão (ex: tinha like, clicou dislike)
             existing.vote_type = data.vote_type
-            db.commit()
-            return {"status": "updated"}
+            status = "updated"
     else:
         # Se nunca votou, cria um novo
         new_vote = DiscussionVote(
@@ -2411,16 +4773,24 @@ def vote_discussion(data: VoteInput, current_user: User = Depends(get_current_us
             vote_type=data.vote_type
         )
         db.add(new_vote)
-        db.commit()
-        return {"status": "created"}
+        status = "created"
+
+    # Atualiza score/hot_score na mesma transação do voto
+    db.flush()
+    refresh_discussion_stats(db, discussion)
+    db.commit()
+    return {"status": status}
     
-@app.get("/api/discussions/{discussion_id}/comments")
-def get_discussion_comments(discussion_id: int, db: Session = Depends(get_db)):
-    comments = db.query(DiscussionComment).filter(DiscussionComment.discussion_id == discussion_id).order_by(DiscussionComment.created_at.asc()).all()
-    results = []
-    for c in comments:
-        author = db.query(User).filter(User.id == c.user_id).first()
-        results.append({
+@app.get("/api/discussions/{discussion_id}/comments", response_model=CommentPage, response_model_exclude_unset=True)
+async def get_discussion_comments(discussion_id: int, cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=100), db = Depends(get_async_db)):
+    # Ordem cronológica (id crescente)
+    query = select(DiscussionComment, User).outerjoin(User, User.id == DiscussionComment.user_id).where(DiscussionComment.discussion_id == discussion_id)
+    rows = (await db.execute(keyset_query(query, [DiscussionComment.id], cursor, limit, descending=False))).all()
+    total = await count_total_async(db, select(DiscussionComment.id).where(DiscussionComment.discussion_id == discussion_id), cursor)
+
+    def serialize(row):
+        c, author = row
+        return {
             "id": c.id,
             "content": c.content,
             "created_at": c.created_at,
@@ -2429,11 +4799,14 @@ def get_discussion_comments(discussion_id: int, db: Session = Depends(get_db)):
                 "avatar_url": author.avatar_url,
                 "username": author.username
             } if author else {"nickname": "Anon", "avatar_url": ""}
-        })
-    return results
+        }
+    return keyset_page(rows, limit, lambda row: (row[0].id,), serialize, total)
 
 @app.post("/api/discussions/comment")
-def post_discussion_comment(data: DiscussionCommentInput, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def post_discussion_comment(data: DiscussionCommentInput, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    discussion = db.query(Discussion).filter(Discussion.id == data.discussion_id).first()
+    if not discussion:
+        raise HTTPException(status_code=404, detail="Discussão não encontrada")
     try:
         new_comment = DiscussionComment(
             discussion_id=data.discussion_id,
@@ -2441,6 +4814,8 @@ def post_discussion_comment(data: DiscussionCommentInput, current_user: User = D
             content=data.content
         )
         db.add(new_comment)
+        db.flush()
+        refresh_discussion_stats(db, discussion)
         db.commit()
         return {"message": "Comentado!"}
     except Exception as e:
@@ -2448,6 +4823,25 @@ def post_discussion_comment(data: DiscussionCommentInput, current_user: User = D
         return {"error": str(e)}
     
 if __name__ == "__main__":
-    import uvicorn
-    # Apenas para teste local direto, se necessário
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    import sys
+    # Jobs pontuais de manutenção:
+    #   python api/index.py backfill-achievements [codigo ...]
+    #   python api/index.py rebuild-similarity
+    #   python api/index.py rebuild-recommendations
+    if len(sys.argv) > 1 and sys.argv[1] in ("backfill-achievements", "rebuild-similarity", "rebuild-recommendations"):
+        db_gen = get_db()
+        db = next(db_gen)
+        try:
+            if sys.argv[1] == "backfill-achievements":
+                codes = sys.argv[2:] or None
+                print(f"Conquistas desbloqueadas: {backfill_achievements(db, codes=codes)}")
+            elif sys.argv[1] == "rebuild-similarity":
+                print(f"Pares de compatibilidade: {rebuild_user_similarity(db)}")
+            else:
+                print(f"Vizinhos de jogos: {rebuild_game_neighbors(db)}")
+        finally:
+            db_gen.close()
+    else:
+        import uvicorn
+        # Apenas para teste local direto, se necessário
+        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,29 @@
+// Listas paginadas por cursor: o backend devolve {items, next_cursor} e, só na
+// primeira página, total (tamanho da lista inteira, para as contagens da tela)
+export type Page<T = any> = {
+  items: T[];
+  next_cursor: string | null;
+  total: number;
+};
+
+export const emptyPage = <T = any>(): Page<T> => ({ items: [], next_cursor: null, total: 0 });
+
+export const toPage = <T = any>(data: any): Page<T> => ({
+  items: data?.items || [],
+  next_cursor: data?.next_cursor || null,
+  total: data?.total ?? (data?.items || []).length,
+});
+
+// Busca a página seguinte (a partir do next_cursor da atual) e junta com a atual
+export async function loadNextPage<T = any>(url: string, page: Page<T>, init?: RequestInit): Promise<Page<T>> {
+  if (!page.next_cursor) return page;
+  const separator = url.includes("?") ? "&" : "?";
+  const res = await fetch(`${url}${separator}cursor=${encodeURIComponent(page.next_cursor)}`, init);
+  if (!res.ok) throw new Error(`Falha ao carregar mais itens (${res.status})`);
+  const next = await res.json();
+  return {
+    items: [...page.items, ...(next.items || [])],
+    next_cursor: next.next_cursor || null,
+    total: page.total,
+  };
+}
@@ -16,6 +16,7 @@ import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogTrigger } from
 import { Textarea } from "@/components/ui/textarea";
 import { ScrollArea } from "@/components/ui/scroll-area";
 import { Badge } from "@/components/ui/badge";
+import { Page, emptyPage, toPage, loadNextPage } from "@/lib/pagination";
 
 export default function Community() {
   const navigate = useNavigate();
@@ -24,7 +25,9 @@ export default function Community() {
   const [topUsers, setTopUsers] = useState<any[]>([]); 
   const [topComments, setTopComments] = useState<any[]>([]);
   const [topTierlists, setTopTierlists] = useState<any[]>([]);
-  const [discussions, setDiscussions] = useState<any[]>([]); // Estado para discussões
+  const [discussionsPage, setDiscussionsPage] = useState<Page>(emptyPage()); // Estado para discussões
+  const discussions = discussionsPage.items;
+  const setDiscussions = (update: (items: any[]) => any[]) => setDiscussionsPage(prev => ({ ...prev, items: update(prev.items) }));
   const [loading, setLoading] = useState(false);
 
   // Estados para Criar Discussão
@@ -37,7 +40,8 @@ export default function Community() {
 
   // Estados para Visualizar Discussão (Comentários)
   const [viewDisc, setViewDisc] = useState<any | null>(null);
-  const [discComments, setDiscComments] = useState<any[]>([]);
+  const [discCommentsPage, setDiscCommentsPage] = useState<Page>(emptyPage());
+  const discComments = discCommentsPage.items;
   const [newCommentText, setNewCommentText] = useState("");
 
   useEffect(() => {
@@ -58,7 +62,7 @@ export default function Community() {
         if (searchRes.ok) setUsers(await searchRes.json());
         if (commentsRes.ok) setTopComments(await commentsRes.json());
         if (tierlistsRes.ok) setTopTierlists(await tierlistsRes.json());
-        if (discRes.ok) setDiscussions(await discRes.json());
+        if (discRes.ok) setDiscussionsPage(toPage(await discRes.json()));
         
         setLoading(false);
       } catch (error) {
@@ -128,7 +132,7 @@ export default function Community() {
             setNewDiscTitle(""); setNewDiscContent(""); setSelectedGame(null);
             // Recarrega a lista
             const discRes = await fetch('/api/discussions/top');
-            if (discRes.ok) setDiscussions(await discRes.json());
+            if (discRes.ok) setDiscussionsPage(toPage(await discRes.json()));
         } else {
             toast.error("Erro ao criar discussão.");
         }
@@ -183,11 +187,24 @@ export default function Community() {
     } catch (e) { toast.error("Erro ao votar."); }
   };
 
+  const loadMoreDiscussions = async () => {
+      try {
+          setDiscussionsPage(await loadNextPage('/api/discussions/top', discussionsPage));
+      } catch (e) { toast.error("Erro ao carregar discussões."); }
+  };
+
   const openDiscussionDetails = async (disc: any) => {
       setViewDisc(disc);
       // Carregar comentários
       const res = await fetch(`/api/discussions/${disc.id}/comments`);
-      if (res.ok) setDiscComments(await res.json());
+      if (res.ok) setDiscCommentsPage(toPage(await res.json()));
+  };
+
+  const loadMoreDiscComments = async () => {
+      if (!viewDisc) return;
+      try {
+          setDiscCommentsPage(await loadNextPage(`/api/discussions/${viewDisc.id}/comments`, discCommentsPage));
+      } catch (e) { toast.error("Erro ao carregar comentários."); }
   };
 
   const handlePostComment = async () => {
@@ -211,7 +228,7 @@ export default function Community() {
               setNewCommentText("");
               // Recarrega comentários
               const cRes = await fetch(`/api/discussions/${viewDisc.id}/comments`);
-              if (cRes.ok) setDiscComments(await cRes.json());
+              if (cRes.ok) setDiscCommentsPage(toPage(await cRes.json()));
               
               // Atualiza contador na lista principal
               setDiscussions(prev => prev.map(d => d.id === viewDisc.id ? {...d, comment_count: d.comment_count + 1} : d));
@@ -513,6 +530,11 @@ export default function Community() {
                                 <p>Nenhuma discussão criada ainda. Seja o primeiro!</p>
                             </div>
                         )}
+                        {discussionsPage.next_cursor && (
+                            <div className="flex justify-center">
+                                <Button variant="ghost" size="sm" onClick={loadMoreDiscussions} className="text-gray-400 hover:text-primary">Carregar mais</Button>
+                            </div>
+                        )}
                     </div>
                 </div>
 
@@ -543,7 +565,7 @@ export default function Community() {
 
                                     <div className="border-t border-white/10 pt-6">
                                         <h4 className="text-sm font-bold text-gray-400 mb-4 flex items-center gap-2">
-                                            <MessageSquare className="w-4 h-4" /> Comentários
+                                            <MessageSquare className="w-4 h-4" /> Comentários ({discCommentsPage.total})
                                         </h4>
                                         <div className="space-y-6">
                                             {discComments.map((c) => (
@@ -563,6 +585,11 @@ export default function Community() {
                                                 </div>
                                             ))}
                                             {discComments.length === 0 && <p className="text-xs text-gray-600 italic">Sem comentários.</p>}
+                                            {discCommentsPage.next_cursor && (
+                                                <div className="flex justify-center">
+                                                    <Button variant="ghost" size="sm" onClick={loadMoreDiscComments} className="text-gray-400 hover:text-primary">Carregar mais</Button>
+                                                </div>
+                                            )}
                                         </div>
                                     </div>
                                 </ScrollArea>
@@ -591,7 +618,7 @@ export default function Community() {
             <TabsContent value="tierlists" className="animate-in fade-in slide-in-from-bottom-4">
                 <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-5">
                     {topTierlists.map((tier) => {
-                        const totalGames = tier.data ? Object.values(tier.data).flat().length : 0;
+                        const totalGames = tier.summary?.item_count || 0;
                         return (
                         <div key={tier.id} className="glass-panel p-5 rounded-xl border border-white/5 hover:border-primary/50 transition-all flex flex-col justify-between bg-black/60 group">
                             <div>
@@ -625,7 +652,7 @@ export default function Community() {
                                 {/* Mini Bar Chart */}
                                 <div className="flex gap-0.5 h-2 w-full rounded-full overflow-hidden bg-white/5 mb-3">
                                     {Object.keys(tierColors).map(rank => {
-                                        const count = tier.data && tier.data[rank] ? tier.data[rank].length : 0;
+                                        const count = tier.summary?.tier_counts?.[rank] || 0;
                                         if (count === 0) return null;
                                         return <div key={rank} className={`${tierColors[rank]} h-full opacity-80`} style={{ flex: count }} />
                                     })}
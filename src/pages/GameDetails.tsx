@@ -12,6 +12,7 @@ import { Textarea } from "@/components/ui/textarea";
 import { ScrollArea } from "@/components/ui/scroll-area";
 import { Avatar, AvatarFallback, AvatarImage } from "@/components/ui/avatar";
 import { Badge } from "@/components/ui/badge";
+import { Page, emptyPage, toPage, loadNextPage } from "@/lib/pagination";
 
 // --- TIPOS ---
 type SteamData = {
@@ -64,6 +65,12 @@ type CommentData = {
   };
 };
 
+// Envia o token (quando logado) para o backend identificar o visitante nos likes
+const viewerHeaders = (): Record<string, string> => {
+  const token = localStorage.getItem("token");
+  return token ? { "Authorization": `Bearer ${token}` } : {};
+};
+
 const defaultReviewState = {
   jogabilidade: 5,
   graficos: 5,
@@ -121,7 +128,8 @@ const GameDetails = () => {
   const [review, setReview] = useState<ReviewForm>(defaultReviewState);
   
   const [discussionInfo, setDiscussionInfo] = useState<{ total: number, top_comment: CommentData | null }>({ total: 0, top_comment: null });
-  const [allComments, setAllComments] = useState<CommentData[]>([]);
+  const [commentsPage, setCommentsPage] = useState<Page<CommentData>>(emptyPage());
+  const allComments = commentsPage.items;
   const [newComment, setNewComment] = useState("");
   const [isCommentsOpen, setIsCommentsOpen] = useState(false);
 
@@ -166,7 +174,7 @@ const GameDetails = () => {
         });
       }
 
-      const discussRes = await fetch(`/api/game/${id}/discussion?user_id=${userId}`);
+      const discussRes = await fetch(`/api/game/${id}/discussion`, { headers: viewerHeaders() });
       if (discussRes.ok) {
         setDiscussionInfo(await discussRes.json());
       }
@@ -185,10 +193,9 @@ const GameDetails = () => {
 
   useEffect(() => {
     if (isCommentsOpen && id) {
-        const userId = localStorage.getItem("userId") || "-1";
-        fetch(`/api/game/${id}/comments/all?user_id=${userId}`)
+        fetch(`/api/game/${id}/comments/all`, { headers: viewerHeaders() })
             .then(res => res.json())
-            .then(data => setAllComments(data));
+            .then(data => setCommentsPage(toPage(data)));
     }
   }, [isCommentsOpen, id]);
 
@@ -281,8 +288,8 @@ const GameDetails = () => {
             setNewComment("");
             loadData();
             if (isCommentsOpen) {
-                const allRes = await fetch(`/api/game/${id}/comments/all?user_id=${userId}`);
-                setAllComments(await allRes.json());
+                const allRes = await fetch(`/api/game/${id}/comments/all`, { headers: viewerHeaders() });
+                setCommentsPage(toPage(await allRes.json()));
             }
         }
     } catch (e) { console.error(e); }
@@ -312,7 +319,7 @@ const GameDetails = () => {
                 }
                 return c;
             });
-            setAllComments(updateList(allComments));
+            setCommentsPage(prev => ({ ...prev, items: updateList(prev.items) }));
             if (discussionInfo.top_comment && discussionInfo.top_comment.id === commentId) {
                 setDiscussionInfo({ ...discussionInfo, top_comment: updateList([discussionInfo.top_comment])[0] });
             }
@@ -320,6 +327,12 @@ const GameDetails = () => {
     } catch (e) { console.error(e); }
   };
 
+  const loadMoreComments = async () => {
+    try {
+        setCommentsPage(await loadNextPage(`/api/game/${id}/comments/all`, commentsPage, { headers: viewerHeaders() }));
+    } catch (e) { toast.error("Erro ao carregar comentários."); }
+  };
+
   const openSteamLink = () => {
     if (game?.steam_data?.store_link) {
       window.open(game.steam_data.store_link, '_blank', 'noopener,noreferrer');
@@ -605,7 +618,7 @@ const GameDetails = () => {
                           <DialogHeader className="p-6 bg-[#121214] border-b border-white/5">
                               <DialogTitle className="font-pixel text-primary flex items-center gap-2">
                                   <MessageSquare className="w-5 h-5" /> 
-                                  Comentários: {game.name}
+                                  Comentários: {game.name} ({commentsPage.total})
                               </DialogTitle>
                           </DialogHeader>
                           
@@ -618,6 +631,11 @@ const GameDetails = () => {
                                       <p>Nenhum comentário ainda.</p>
                                   </div>
                               )}
+                              {commentsPage.next_cursor && (
+                                  <div className="flex justify-center py-4">
+                                      <Button variant="ghost" size="sm" onClick={loadMoreComments} className="text-gray-400 hover:text-primary">Carregar mais</Button>
+                                  </div>
+                              )}
                           </ScrollArea>
 
                           <div className="p-4 bg-[#121214] border-t border-white/5 flex gap-2">
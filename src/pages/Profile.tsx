@@ -29,6 +29,7 @@ import steamLogo from "@/assets/steam.png";
 import xboxLogo from "@/assets/xbox.png";
 import psnLogo from "@/assets/psn.png";
 import epicLogo from "@/assets/epic.png";
+import { Page, emptyPage, toPage, loadNextPage } from "@/lib/pagination";
 
 // Interfaces para o Quiz Avançado
 type QuizStage = {
@@ -46,6 +47,20 @@ type QuizStage = {
   option_b?: any;
 };
 
+// Envia o token (quando logado) para o backend identificar o visitante
+const viewerHeaders = (): Record<string, string> => {
+  const token = localStorage.getItem("token");
+  return token ? { "Authorization": `Bearer ${token}` } : {};
+};
+
+// O social_list vem paginado por lista; as próximas páginas vêm de ?kind=
+type SocialKind = "friends" | "followers" | "following";
+const toSocialPages = (data: any): Record<SocialKind, Page> => ({
+  friends: toPage(data.friends),
+  followers: toPage(data.followers),
+  following: toPage(data.following),
+});
+
 export default function Profile() {
   const navigate = useNavigate();
   // ALTERAÇÃO: Mudado de userId para username para casar com a rota nova
@@ -55,19 +70,20 @@ export default function Profile() {
   
   // Dados secundários
   const [allGames, setAllGames] = useState<any[]>([]);
-  const [allTierlists, setAllTierlists] = useState<any[]>([]);
-  const [userComments, setUserComments] = useState<any[]>([]);
+  const [tierlistsPage, setTierlistsPage] = useState<Page>(emptyPage());
+  const allTierlists = tierlistsPage.items;
+  const [userComments, setUserComments] = useState<Page>(emptyPage());
   const [bestComment, setBestComment] = useState<any>(null);
   const [connections, setConnections] = useState<any[]>([]); // Conexões por interação
 
   // --- NOVOS DADOS SOCIAIS (AMIGOS/SEGUIDORES) ---
-  const [socialData, setSocialData] = useState<any>({ friends: [], followers: [], following: [] });
+  const [socialData, setSocialData] = useState<Record<SocialKind, Page>>({ friends: emptyPage(), followers: emptyPage(), following: emptyPage() });
   const [isFollowing, setIsFollowing] = useState(false);
   const [followersCount, setFollowersCount] = useState(0);
   
   // STATUS DE AMIZADE: 'none' | 'pending_sent' | 'pending_received' | 'friends'
   const [friendStatus, setFriendStatus] = useState<string>("none");
-  const [pendingRequests, setPendingRequests] = useState<any[]>([]); // Lista de solicitações recebidas
+  const [pendingRequests, setPendingRequests] = useState<Page>(emptyPage()); // Lista de solicitações recebidas
 
   // Quiz Data e Estados Avançados
   const [quizQuestions, setQuizQuestions] = useState<QuizStage[]>([]);
@@ -159,7 +175,7 @@ export default function Profile() {
         fetch(`/api/user/${realId}/best_comment`),
         fetch(`/api/user/${realId}/comments`),
         fetch(`/api/connections/${realId}`),
-        fetch(`/api/user/${realId}/social_list`) 
+        fetch(`/api/user/${realId}/social_list`, { headers: viewerHeaders() }) 
       ]);
 
       if (gamesRes.ok) {
@@ -170,19 +186,17 @@ export default function Profile() {
         setSelectedFavorites(favs);
       }
 
-      if (tierRes.ok) setAllTierlists(await tierRes.json());
+      if (tierRes.ok) setTierlistsPage(toPage(await tierRes.json()));
       if (bestCommentRes.ok) setBestComment(await bestCommentRes.json());
-      if (allCommentsRes.ok) setUserComments(await allCommentsRes.json());
+      if (allCommentsRes.ok) setUserComments(toPage(await allCommentsRes.json()));
       if (connRes.ok) setConnections(await connRes.json());
       
       if (socialRes.ok) {
           const sData = await socialRes.json();
-          setSocialData(sData);
+          setSocialData(toSocialPages(sData));
           if (loggedUserId) {
-              const myId = parseInt(loggedUserId);
-              // Verifica SEGUIR
-              const amIFollowing = sData.followers.some((u:any) => u.id === myId);
-              setIsFollowing(amIFollowing);
+              // Verifica SEGUIR (calculado no backend a partir do token)
+              setIsFollowing(sData.viewer_follows);
           }
       }
 
@@ -199,7 +213,7 @@ export default function Profile() {
       if (loggedUserId && String(realId) === String(loggedUserId)) {
           const pendingRes = await fetch(`/api/user/${realId}/pending_requests`);
           if (pendingRes.ok) {
-              setPendingRequests(await pendingRes.json());
+              setPendingRequests(toPage(await pendingRes.json()));
           }
       }
 
@@ -265,8 +279,8 @@ export default function Profile() {
                   toast.success("Deixou de seguir.");
               }
               // Atualiza lista
-              const socialRes = await fetch(`/api/user/${profile.id}/social_list`);
-              if (socialRes.ok) setSocialData(await socialRes.json());
+              const socialRes = await fetch(`/api/user/${profile.id}/social_list`, { headers: viewerHeaders() });
+              if (socialRes.ok) setSocialData(toSocialPages(await socialRes.json()));
           }
       } catch (e) { toast.error("Erro de conexão."); }
   };
@@ -340,7 +354,7 @@ export default function Profile() {
           });
           if (res.ok) {
               toast.success("Solicitação aceita!");
-              setPendingRequests(prev => prev.filter(req => req.sender_id !== senderId));
+              setPendingRequests(prev => removeFromPage(prev, (req: any) => req.sender_id === senderId));
               fetchProfile(); // Atualiza a lista de amigos
           }
       } catch (e) { toast.error("Erro ao aceitar."); }
@@ -359,7 +373,7 @@ export default function Profile() {
           });
           if (res.ok) {
               toast.success("Solicitação recusada.");
-              setPendingRequests(prev => prev.filter(req => req.sender_id !== senderId));
+              setPendingRequests(prev => removeFromPage(prev, (req: any) => req.sender_id === senderId));
           }
       } catch (e) { toast.error("Erro ao recusar."); }
   };
@@ -387,6 +401,31 @@ export default function Profile() {
     } catch (e) { toast.error("Erro ao salvar."); }
   };
 
+  // --- PAGINAÇÃO (CARREGAR MAIS) ---
+  const removeFromPage = (page: Page, match: (item: any) => boolean): Page => {
+      const items = page.items.filter(item => !match(item));
+      return { ...page, items, total: page.total - (page.items.length - items.length) };
+  };
+
+  const handleLoadMoreSocial = async (kind: SocialKind) => {
+      try {
+          const next = await loadNextPage(`/api/user/${profile.id}/social_list?kind=${kind}`, socialData[kind]);
+          setSocialData(prev => ({ ...prev, [kind]: next }));
+      } catch (e) { toast.error("Erro ao carregar mais."); }
+  };
+
+  const handleLoadMoreTierlists = async () => {
+      try {
+          setTierlistsPage(await loadNextPage(`/api/tierlists/${profile.id}`, tierlistsPage));
+      } catch (e) { toast.error("Erro ao carregar mais."); }
+  };
+
+  const handleLoadMorePending = async () => {
+      try {
+          setPendingRequests(await loadNextPage(`/api/user/${profile.id}/pending_requests`, pendingRequests));
+      } catch (e) { toast.error("Erro ao carregar mais."); }
+  };
+
   const handleDeleteTierlist = async (tierlistId: number) => {
     if (!window.confirm("Tem certeza que deseja excluir esta Tierlist?")) return;
     const loggedUserId = localStorage.getItem("userId");
@@ -399,7 +438,7 @@ export default function Profile() {
       });
       if (res.ok) {
         toast.success("Tierlist excluída!");
-        setAllTierlists(prev => prev.filter(t => t.id !== tierlistId));
+        setTierlistsPage(prev => removeFromPage(prev, (t: any) => t.id === tierlistId));
       } else {
         const err = await res.json();
         toast.error(err.detail || "Erro ao excluir");
@@ -710,7 +749,7 @@ export default function Profile() {
                     <BrainCircuit className="w-4 h-4 mr-2 hidden md:inline" /> Quiz
                 </TabsTrigger>
                 <TabsTrigger value="tierlists" className="data-[state=active]:bg-primary data-[state=active]:text-black text-xs md:text-sm py-2">
-                    <List className="w-4 h-4 mr-2 hidden md:inline" /> Tierlists ({allTierlists.length})
+                    <List className="w-4 h-4 mr-2 hidden md:inline" /> Tierlists ({tierlistsPage.total})
                 </TabsTrigger>
               </TabsList>
             </div>
@@ -1000,15 +1039,15 @@ export default function Profile() {
                 </div>
 
                 {/* --- SEÇÃO DE SOLICITAÇÕES PENDENTES (APENAS PARA O DONO) --- */}
-                {isOwner && pendingRequests.length > 0 && (
+                {isOwner && pendingRequests.items.length > 0 && (
                     <div className="max-w-4xl mx-auto w-full animate-slide-up-fade">
                         <div className="bg-yellow-500/5 border border-yellow-500/20 rounded-xl p-6">
                             <h3 className="text-lg font-bold text-yellow-500 mb-4 flex items-center gap-2">
                                 <Bell className="w-5 h-5 fill-yellow-500" /> Solicitações Pendentes
-                                <span className="bg-yellow-500 text-black text-xs font-bold px-2 py-0.5 rounded-full">{pendingRequests.length}</span>
+                                <span className="bg-yellow-500 text-black text-xs font-bold px-2 py-0.5 rounded-full">{pendingRequests.total}</span>
                             </h3>
                             <div className="grid grid-cols-1 md:grid-cols-2 gap-4">
-                                {pendingRequests.map((req: any) => (
+                                {pendingRequests.items.map((req: any) => (
                                     <div key={req.request_id} className="bg-black/40 border border-white/10 p-4 rounded-lg flex items-center justify-between gap-4">
                                         <div className="flex items-center gap-3 overflow-hidden">
                                             <Link to={`/profile/${req.username}`}>
@@ -1046,6 +1085,11 @@ export default function Profile() {
                                     </div>
                                 ))}
                             </div>
+                            {pendingRequests.next_cursor && (
+                                <div className="flex justify-center mt-4">
+                                    <Button variant="ghost" size="sm" onClick={handleLoadMorePending} className="text-gray-400 hover:text-primary">Carregar mais</Button>
+                                </div>
+                            )}
                         </div>
                     </div>
                 )}
@@ -1053,10 +1097,10 @@ export default function Profile() {
                 {/* LISTA DE AMIGOS (Mútuos) */}
                 <div className="max-w-4xl mx-auto">
                     <h3 className="text-lg font-bold text-white mb-4 flex items-center gap-2 border-b border-white/10 pb-2">
-                        <Users className="w-5 h-5 text-primary" /> Amigos (Confirmados)
+                        <Users className="w-5 h-5 text-primary" /> Amigos (Confirmados) <span className="text-sm text-gray-500">({socialData.friends.total})</span>
                     </h3>
                     <div className="grid grid-cols-2 md:grid-cols-4 gap-3">
-                        {socialData.friends.length > 0 ? socialData.friends.map((u: any) => (
+                        {socialData.friends.items.length > 0 ? socialData.friends.items.map((u: any) => (
                             <Link to={`/profile/${u.username}`} key={u.id} className="bg-[#1a1c1f] p-3 rounded-lg flex items-center gap-3 border border-white/5 hover:border-primary/50 transition-all">
                                 <Avatar className="h-8 w-8">
                                     <AvatarImage src={u.avatar_url} />
@@ -1066,15 +1110,20 @@ export default function Profile() {
                             </Link>
                         )) : <p className="text-gray-500 text-sm col-span-full">Nenhum amigo confirmado ainda.</p>}
                     </div>
+                    {socialData.friends.next_cursor && (
+                        <div className="flex justify-center mt-4">
+                            <Button variant="ghost" size="sm" onClick={() => handleLoadMoreSocial("friends")} className="text-gray-400 hover:text-primary">Carregar mais</Button>
+                        </div>
+                    )}
                 </div>
 
                 {/* LISTA DE SEGUIDORES */}
                 <div className="max-w-4xl mx-auto">
                     <h3 className="text-lg font-bold text-white mb-4 flex items-center gap-2 border-b border-white/10 pb-2">
-                        <Star className="w-5 h-5 text-yellow-400" /> Seguidores
+                        <Star className="w-5 h-5 text-yellow-400" /> Seguidores <span className="text-sm text-gray-500">({socialData.followers.total})</span>
                     </h3>
                     <div className="grid grid-cols-2 md:grid-cols-4 gap-3">
-                        {socialData.followers.length > 0 ? socialData.followers.map((u: any) => (
+                        {socialData.followers.items.length > 0 ? socialData.followers.items.map((u: any) => (
                             <Link to={`/profile/${u.username}`} key={u.id} className="bg-[#1a1c1f] p-3 rounded-lg flex items-center gap-3 border border-white/5 hover:border-white/20 transition-all">
                                 <Avatar className="h-8 w-8">
                                     <AvatarImage src={u.avatar_url} />
@@ -1084,6 +1133,11 @@ export default function Profile() {
                             </Link>
                         )) : <p className="text-gray-500 text-sm col-span-full">Nenhum seguidor novo.</p>}
                     </div>
+                    {socialData.followers.next_cursor && (
+                        <div className="flex justify-center mt-4">
+                            <Button variant="ghost" size="sm" onClick={() => handleLoadMoreSocial("followers")} className="text-gray-400 hover:text-primary">Carregar mais</Button>
+                        </div>
+                    )}
                 </div>
             </TabsContent>
 
@@ -1477,6 +1531,7 @@ export default function Profile() {
                   {loadingSecondary && allTierlists.length === 0 ? (
                       <div className="flex justify-center py-20"><Loader2 className="w-10 h-10 text-primary animate-spin" /></div>
                   ) : allTierlists.length > 0 ? (
+                    <>
                     <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6">
                        {allTierlists.map((tier) => (
                          <div key={tier.id} className="bg-gray-900/50 p-5 rounded-xl border border-white/10 hover:border-primary/50 transition-all group">
@@ -1506,6 +1561,12 @@ export default function Profile() {
                          </div>
                        ))}
                     </div>
+                    {tierlistsPage.next_cursor && (
+                        <div className="flex justify-center mt-4">
+                            <Button variant="ghost" size="sm" onClick={handleLoadMoreTierlists} className="text-gray-400 hover:text-primary">Carregar mais</Button>
+                        </div>
+                    )}
+                    </>
                   ) : (
                     <div className="flex flex-col items-center justify-center py-20 text-gray-500">
                        <List className="w-16 h-16 mb-4 opacity-20" />
@@ -12,6 +12,7 @@ import { Avatar, AvatarFallback, AvatarImage } from "@/components/ui/avatar";
 import { toast } from "sonner";
 import welcomeBg from "@/assets/welcome-bg.jpg";
 import defaultAvatar from "@/assets/defaultprofile.png";
+import { Page, emptyPage, toPage, loadNextPage } from "@/lib/pagination";
 
 const tierRanks = [
   { rank: "S", label: "Obra-Prima", color: "bg-red-600", border: "border-red-500" },
@@ -21,6 +22,38 @@ const tierRanks = [
   { rank: "D", label: "Fraco", color: "bg-blue-500", border: "border-blue-500" },
 ];
 
+type TierLayout = Record<string, number[]>;
+
+const layoutOf = (games: Record<string, any[]>): TierLayout =>
+  Object.fromEntries(Object.entries(games).map(([tier, list]) => [tier, list.map((g: any) => g.id)]));
+
+// Gera as operações (move/insert/remove) que levam o layout salvo ao atual,
+// simulando a aplicação do servidor para mandar só o que mudou
+const diffTierlist = (saved: TierLayout, current: Record<string, any[]>) => {
+  const ops: any[] = [];
+  const wanted = new Set(Object.values(current).flat().map((g: any) => g.id));
+  const sim: TierLayout = {};
+  Object.entries(saved).forEach(([tier, ids]) => {
+    ids.filter(id => !wanted.has(id)).forEach(id => ops.push({ op: "remove", game_id: id }));
+    sim[tier] = ids.filter(id => wanted.has(id));
+  });
+  Object.entries(current).forEach(([tier, list]) => {
+    if (!sim[tier]) sim[tier] = [];
+    list.forEach((game: any, position: number) => {
+      if (sim[tier][position] === game.id) return;
+      const from = Object.keys(sim).find(t => sim[t].includes(game.id));
+      if (from) {
+        sim[from].splice(sim[from].indexOf(game.id), 1);
+        ops.push({ op: "move", game_id: game.id, tier, position });
+      } else {
+        ops.push({ op: "insert", game_id: game.id, tier, position, title: game.title, cover: game.cover, is_favorite: !!game.is_favorite });
+      }
+      sim[tier].splice(position, 0, game.id);
+    });
+  });
+  return ops;
+};
+
 export default function Tierlist() {
   const navigate = useNavigate();
   const [searchParams, setSearchParams] = useSearchParams(); 
@@ -36,17 +69,22 @@ export default function Tierlist() {
   const [currentTierlistId, setCurrentTierlistId] = useState<number | null>(null);
   const [viewingMode, setViewingMode] = useState(false);
   const [viewingOwner, setViewingOwner] = useState<any>(null);
+  // Último estado salvo no servidor: base para o PATCH incremental
+  const [savedLayout, setSavedLayout] = useState<TierLayout | null>(null);
+  const [savedVersion, setSavedVersion] = useState(0);
   
   // Dados Auxiliares
   const [userGames, setUserGames] = useState<any[]>([]); 
   const [poolGames, setPoolGames] = useState<any[]>([]); 
-  const [savedTierlists, setSavedTierlists] = useState<any[]>([]); 
+  const [savedPage, setSavedPage] = useState<Page>(emptyPage());
+  const savedTierlists = savedPage.items;
   const [draggedGame, setDraggedGame] = useState<any>(null);
   
   // Interações Sociais (Novo)
   const [likesCount, setLikesCount] = useState(0);
   const [userHasLiked, setUserHasLiked] = useState(false);
-  const [comments, setComments] = useState<any[]>([]);
+  const [commentsPage, setCommentsPage] = useState<Page>(emptyPage());
+  const comments = commentsPage.items;
   const [newComment, setNewComment] = useState("");
   
   const [isSaving, setIsSaving] = useState(false);
@@ -62,10 +100,9 @@ export default function Tierlist() {
   const fetchPublicTierlist = async (id: string) => {
     try {
       const myId = localStorage.getItem("userId");
-      // Passa o ID do usuário para saber se ele deu like
-      const url = myId ? `/api/tierlist_public/${id}?user_id=${myId}` : `/api/tierlist_public/${id}`;
-      
-      const res = await fetch(url);
+      // O token identifica quem vê (para saber se deu like)
+      const token = localStorage.getItem("token");
+      const res = await fetch(`/api/tierlist_public/${id}`, { headers: token ? { "Authorization": `Bearer ${token}` } : {} });
       if (res.ok) {
         const data = await res.json();
         setTierlistName(data.name);
@@ -77,10 +114,13 @@ export default function Tierlist() {
         setViewingMode(!isMine); 
         setLikesCount(data.likes_count || 0);
         setUserHasLiked(data.user_has_liked || false);
-        setComments(data.comments || []);
+        // Primeira página embutida; as próximas vêm de /api/tierlist_public/{id}/comments
+        setCommentsPage({ items: data.comments || [], next_cursor: data.comments_next_cursor || null, total: data.comments_total || 0 });
 
         if (isMine) {
             setCurrentTierlistId(data.id);
+            setSavedLayout(layoutOf(data.data));
+            setSavedVersion(data.version || 0);
         } else {
             setCurrentTierlistId(data.id); // Guardamos o ID mesmo se não for nossa, para comentar/curtir
         }
@@ -129,10 +169,25 @@ export default function Tierlist() {
     if (!userId) return;
     try {
       const response = await fetch(`/api/tierlists/${userId}`);
-      if (response.ok) setSavedTierlists(await response.json());
+      if (response.ok) setSavedPage(toPage(await response.json()));
+    } catch (error) { toast.error("Erro ao carregar salvas."); }
+  };
+
+  const loadMoreSavedTierlists = async () => {
+    const userId = localStorage.getItem("userId");
+    if (!userId) return;
+    try {
+      setSavedPage(await loadNextPage(`/api/tierlists/${userId}`, savedPage));
     } catch (error) { toast.error("Erro ao carregar salvas."); }
   };
 
+  const loadMoreComments = async () => {
+    if (!currentTierlistId) return;
+    try {
+      setCommentsPage(await loadNextPage(`/api/tierlist_public/${currentTierlistId}/comments`, commentsPage));
+    } catch (error) { toast.error("Erro ao carregar comentários."); }
+  };
+
   useEffect(() => {
     if (activeTab === "saved") fetchSavedTierlists();
   }, [activeTab]);
@@ -194,16 +249,19 @@ export default function Tierlist() {
 
     setIsSaving(true);
     try {
-      // Se eu sou o dono e não quero salvar como nova, é PUT.
+      // Se eu sou o dono e não quero salvar como nova, é PUT (ou PATCH com só o que mudou).
       const isUpdate = currentTierlistId && !saveAsNew && (viewingMode ? isMyTierlist() : true);
-      const method = isUpdate ? "PUT" : "POST";
+      const isPatch = isUpdate && savedLayout !== null;
+      const method = isPatch ? "PATCH" : isUpdate ? "PUT" : "POST";
       const url = isUpdate ? `/api/tierlist/${currentTierlistId}` : "/api/tierlist";
 
-      const body = {
-          name: tierlistName,
-          data: tierGames,
-          owner_id: parseInt(userId)
-      };
+      const body = isPatch
+        ? { version: savedVersion, name: tierlistName, ops: diffTierlist(savedLayout, tierGames) }
+        : {
+            name: tierlistName,
+            data: tierGames,
+            owner_id: parseInt(userId)
+          };
 
       const response = await fetch(url, {
         method: method,
@@ -216,7 +274,19 @@ export default function Tierlist() {
 
       if (response.ok) {
         toast.success(saveAsNew ? "Cópia salva!" : "Tierlist salva!");
+        if (isPatch) {
+          const result = await response.json();
+          // Só avança a base do PATCH com uma versão de verdade vinda do servidor
+          if (typeof result.version === "number") {
+            setSavedVersion(result.version);
+            setSavedLayout(layoutOf(tierGames));
+          }
+        }
         if (saveAsNew) setActiveTab("saved");
+      } else if (response.status === 409) {
+        // Outra aba/dispositivo salvou antes: recarrega a versão atual
+        toast.error("Tierlist alterada em outro lugar. Recarregando...");
+        fetchPublicTierlist(String(currentTierlistId));
       } else {
         toast.error("Erro ao salvar.");
       }
@@ -240,7 +310,7 @@ export default function Tierlist() {
         });
         if (res.ok) {
             toast.success("Excluída.");
-            setSavedTierlists(prev => prev.filter(t => t.id !== id));
+            setSavedPage(prev => ({ ...prev, items: prev.items.filter(t => t.id !== id), total: prev.total - 1 }));
         } else {
             toast.error("Erro ao excluir.");
         }
@@ -309,14 +379,24 @@ export default function Tierlist() {
       } catch (e) { toast.error("Erro de conexão."); }
   };
 
-  const loadTierlistToEdit = (tierlist: any) => {
+  const loadTierlistToEdit = async (summary: any) => {
+    // A listagem só traz o resumo; o documento completo vem da rota pública
+    let tierlist: any;
+    try {
+      const res = await fetch(`/api/tierlist_public/${summary.id}`);
+      if (!res.ok) { toast.error("Tierlist não encontrada."); return; }
+      tierlist = await res.json();
+    } catch (e) { toast.error("Erro de conexão."); return; }
+
     setTierlistName(tierlist.name);
     setTierGames(tierlist.data);
     setCurrentTierlistId(tierlist.id);
+    setSavedLayout(layoutOf(tierlist.data));
+    setSavedVersion(tierlist.version || 0);
     setViewingMode(false); 
     setViewingOwner(null);
     setLikesCount(0); // Em modo de edição local, likes não importam tanto
-    setComments([]);
+    setCommentsPage(emptyPage());
     
     // Filtra pool
     const usedIds = new Set();
@@ -333,6 +413,8 @@ export default function Tierlist() {
     setViewingMode(false);
     setViewingOwner(null);
     setCurrentTierlistId(null);
+    setSavedLayout(null);
+    setSavedVersion(0);
     setSearchParams({});
     setActiveTab("creator");
   };
@@ -542,7 +624,7 @@ export default function Tierlist() {
                     <div className="glass-panel p-6 md:p-8 rounded-xl border border-white/10 mt-8 bg-black/40">
                         <div className="flex items-center gap-3 mb-6">
                             <MessageSquare className="w-6 h-6 text-primary" />
-                            <h3 className="text-xl font-bold text-white">Comentários da Comunidade ({comments.length})</h3>
+                            <h3 className="text-xl font-bold text-white">Comentários da Comunidade ({commentsPage.total})</h3>
                         </div>
 
                         {/* Input de Comentário */}
@@ -595,6 +677,11 @@ export default function Tierlist() {
                                 </div>
                             )}
                         </div>
+                        {commentsPage.next_cursor && (
+                            <div className="flex justify-center mt-6">
+                                <Button variant="ghost" size="sm" onClick={loadMoreComments} className="text-gray-400 hover:text-primary">Carregar mais</Button>
+                            </div>
+                        )}
                     </div>
                 )}
             </TabsContent>
@@ -634,14 +721,14 @@ export default function Tierlist() {
                         {/* Mini Visualização das Barras */}
                         <div className="flex gap-1 mb-4 h-3 rounded-full overflow-hidden bg-black/50 w-full">
                             {tierRanks.map(t => {
-                                const count = tierlist.data[t.rank]?.length || 0;
+                                const count = tierlist.summary?.tier_counts?.[t.rank] || 0;
                                 if (count === 0) return null;
                                 return <div key={t.rank} className={`${t.color} h-full`} style={{ flex: count }} title={`${count} jogos em ${t.rank}`} />
                             })}
                         </div>
                         
                         <div className="flex justify-between text-xs text-gray-500 mb-4">
-                            <span>{Object.values(tierlist.data).flat().length} jogos</span>
+                            <span>{tierlist.summary?.item_count || 0} jogos</span>
                             <span className="flex items-center gap-1"><Eye className="w-3 h-3"/> Privado</span>
                         </div>
                     </div>
@@ -662,6 +749,11 @@ export default function Tierlist() {
                     </div>
                 )}
               </div>
+              {savedPage.next_cursor && (
+                  <div className="flex justify-center mt-6">
+                      <Button variant="ghost" size="sm" onClick={loadMoreSavedTierlists} className="text-gray-400 hover:text-primary">Carregar mais</Button>
+                  </div>
+              )}
             </TabsContent>
         </Tabs>
       </div>